@@ -0,0 +1,152 @@
+"""
+遊戲頻道與發言者篩選
+
+在比對關鍵字之前，先以頻道與發言者的雜湊索引算出這條訊息「不需要通知」的
+用戶；如果所有訂閱者都被排除、也沒有人關注這位玩家，訊息就直接略過，
+完全不做文字掃描。
+"""
+import bisect
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+MAX_CHANNEL = 9999
+CHANNEL_CACHE_SIZE = 1024
+
+
+def parse_channel_ranges(text):
+    """把 '1-100,3362' 解析成 [[1, 100], [3362, 3362]]"""
+    ranges = []
+    for part in text.replace('，', ',').replace(' ', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        low, _, high = part.partition('-')
+        if not low.isdigit() or (high and not high.isdigit()):
+            raise ValueError(f"無法解析的頻道範圍: {part}")
+        low, high = int(low), int(high or low)
+        if low > high:
+            low, high = high, low
+        if high > MAX_CHANNEL:
+            raise ValueError(f"頻道編號不可超過 {MAX_CHANNEL}: {part}")
+        ranges.append([low, high])
+    if not ranges:
+        raise ValueError("請提供至少一個頻道或頻道範圍")
+    return ranges
+
+
+def format_channel_ranges(ranges):
+    return ", ".join(str(low) if low == high else f"{low}-{high}" for low, high in ranges)
+
+
+def merge_ranges(ranges):
+    """排序並合併重疊或相鄰的範圍，回傳 (起點列表, 終點列表) 供二分搜尋"""
+    merged = []
+    for low, high in sorted((low, high) for low, high in ranges):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+    return [low for low, _ in merged], [high for _, high in merged]
+
+
+def in_ranges(intervals, channel):
+    lows, highs = intervals
+    position = bisect.bisect_right(lows, channel) - 1
+    return position >= 0 and channel <= highs[position]
+
+
+def speaker_keys(username):
+    """發言者的比對鍵：完整名稱與不含 #編號 的名稱（不分大小寫）
+
+    設定時可以填完整名稱（只對應該玩家）或不含編號的名稱。
+    """
+    name = (username or '').casefold()
+    base = name.split('#', 1)[0]
+    return {name, base} if base else {name}
+
+
+class AudienceIndex:
+    """以頻道、發言者為鍵的訂閱者索引
+
+    filters 格式為 {user_id: {"channels": [[low, high], ...], "allow_speakers": [...],
+    "deny_speakers": [...]}}；watchers 為 {user_id: [username, ...]}。
+    頻道範圍以排序後的區間保存，查詢時二分搜尋，最近查過的頻道結果放在
+    有上限的快取中。
+    """
+
+    def __init__(self, subscribers, filters=None, watchers=None, version=0):
+        self.version = version
+        self.subscribers = set(subscribers)
+        self._channel_filtered = set()
+        self._channel_ranges = {}
+        self._allow_users = set()
+        self._allow_index = {}
+        self._deny_index = {}
+        self._watch_index = {}
+        self._channel_cache = OrderedDict()
+
+        for user_id, user_filters in (filters or {}).items():
+            if user_id not in self.subscribers:
+                continue
+            channels = user_filters.get("channels") or []
+            if channels:
+                self._channel_filtered.add(user_id)
+                self._channel_ranges[user_id] = merge_ranges(channels)
+            allow = user_filters.get("allow_speakers") or []
+            if allow:
+                self._allow_users.add(user_id)
+                for name in allow:
+                    self._allow_index.setdefault(name.casefold(), set()).add(user_id)
+            for name in user_filters.get("deny_speakers") or []:
+                self._deny_index.setdefault(name.casefold(), set()).add(user_id)
+
+        for user_id, names in (watchers or {}).items():
+            for name in names or []:
+                self._watch_index.setdefault(name.casefold(), set()).add(user_id)
+
+        self.has_filters = bool(self._channel_filtered or self._allow_users or self._deny_index)
+
+    def _excluded_by_channel(self, channel):
+        if not self._channel_filtered:
+            return set()
+        excluded = self._channel_cache.get(channel)
+        if excluded is not None:
+            self._channel_cache.move_to_end(channel)
+            return excluded
+        if channel is None:
+            excluded = set(self._channel_filtered)
+        else:
+            excluded = {
+                user_id for user_id, intervals in self._channel_ranges.items()
+                if not in_ranges(intervals, channel)
+            }
+        self._channel_cache[channel] = excluded
+        if len(self._channel_cache) > CHANNEL_CACHE_SIZE:
+            self._channel_cache.popitem(last=False)
+        return excluded
+
+    def route(self, channel, username):
+        """回傳 (不需通知的用戶集合, 關注此發言者的用戶集合)"""
+        keys = speaker_keys(username)
+        watchers = set()
+        for key in keys:
+            watchers.update(self._watch_index.get(key, ()))
+
+        if not self.has_filters:
+            return set(), watchers
+
+        excluded = set(self._excluded_by_channel(channel))
+        if self._allow_users:
+            allowed = set()
+            for key in keys:
+                allowed.update(self._allow_index.get(key, ()))
+            excluded.update(self._allow_users - allowed)
+        for key in keys:
+            excluded.update(self._deny_index.get(key, ()))
+        return excluded, watchers
+
+    def should_drop(self, excluded, watchers):
+        """沒有任何訂閱者需要這條訊息時回傳 True"""
+        return not watchers and len(excluded) >= len(self.subscribers)
@@ -0,0 +1,52 @@
+"""
+關鍵字回測
+
+用與即時比對相同的比對引擎，對聊天歷史做一次批次掃描，估計某個關鍵字
+訂閱後的通知頻率，避免用戶加入會洗版的關鍵字。
+"""
+import logging
+import time
+
+from expressions import is_expression, validate_expression
+from matcher import SubscriptionIndex
+
+logger = logging.getLogger(__name__)
+
+
+def preview_keyword(store, keyword, hours=24, sample_count=5):
+    """對最近 hours 小時的歷史回測關鍵字，回傳命中統計與最新的幾條範例
+
+    表達式語法錯誤時拋出 ExpressionError（索引建立時會略過無效的表達式，
+    不先檢查的話只會得到 0 次命中）。
+    """
+    if is_expression(keyword):
+        validate_expression(keyword)
+    index = SubscriptionIndex({0: [keyword]})
+    started = time.perf_counter()
+    scanned = 0
+    hits = 0
+    samples = []
+    first_ts = None
+    for batch in store.iter_messages(hours):
+        if first_ts is None and batch:
+            first_ts = batch[0]['ts']
+        for message in batch:
+            if index.match(message['text']):
+                hits += 1
+                samples.append(message)
+                if len(samples) > sample_count:
+                    samples.pop(0)
+        scanned += len(batch)
+
+    # 歷史不足 hours 小時時，以實際涵蓋的時間（至少一分鐘）計算頻率
+    covered_hours = max(min(hours, (time.time() - first_ts) / 3600), 1 / 60) if first_ts else 0
+    return {
+        'keyword': keyword,
+        'hours': hours,
+        'covered_hours': round(covered_hours, 2),
+        'scanned': scanned,
+        'hits': hits,
+        'hits_per_hour': round(hits / covered_hours, 2) if covered_hours > 0 else 0.0,
+        'samples': list(reversed(samples)),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
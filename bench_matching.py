@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+關鍵字比對基準測試
+
+比較逐用戶子字串比對、單執行緒自動機比對，以及不同工作行程數的平行比對。
+"""
+import argparse
+import os
+import random
+import time
+
+from matcher import SubscriptionIndex
+from normalizer import normalize_text
+from parallel import ParallelMatcher
+from simulator import ChatSimulator
+
+
+def build_subscriptions(users, keywords_per_user, seed):
+    """以合成訊息的字元組出隨機關鍵字"""
+    rnd = random.Random(seed)
+    corpus = "".join(m['text'] for m in ChatSimulator(seed=seed).generate(2000))
+    subscriptions = {}
+    for user_id in range(1, users + 1):
+        keywords = []
+        for _ in range(keywords_per_user):
+            start = rnd.randrange(len(corpus) - 4)
+            keywords.append(corpus[start:start + rnd.randint(1, 4)].strip() or "雪")
+        subscriptions[user_id] = keywords
+    return subscriptions
+
+
+def naive_match(subscriptions, text):
+    text = text.lower()
+    return {user_id: [k for k in keywords if k.lower() in text] for user_id, keywords in subscriptions.items()}
+
+
+def timed(label, count, func):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {count / elapsed:>12,.0f} 條/秒  ({elapsed:.2f} 秒)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="關鍵字比對基準測試")
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--keywords-per-user", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--skip-naive", action="store_true", help="略過逐用戶比對（很慢）")
+    args = parser.parse_args()
+
+    subscriptions = build_subscriptions(args.users, args.keywords_per_user, args.seed)
+    index = SubscriptionIndex(subscriptions, version=1)
+    texts = [normalize_text(m['text']) for m in ChatSimulator(seed=args.seed + 1).generate(args.messages)]
+    print(f"📊 {args.messages} 條訊息, {args.users} 位用戶, {len(index)} 個不重複關鍵字")
+
+    if not args.skip_naive:
+        sample = texts[:max(1, args.messages // 20)]
+        timed("逐用戶子字串比對", len(sample), lambda: [naive_match(subscriptions, t) for t in sample])
+
+    baseline = timed("單執行緒自動機", len(texts), lambda: [index.match_ids(t) for t in texts])
+
+    worker_counts = sorted({1, 2, 4, os.cpu_count() or 1})
+    for workers in worker_counts:
+        matcher = ParallelMatcher(workers=workers)
+        try:
+            # 預熱：啟動工作行程並載入自動機
+            matcher.map_batch(index, texts[:workers * 64])
+            elapsed = timed(f"平行比對 ({workers} 行程)", len(texts), lambda: matcher.map_batch(index, texts))
+            print(f"{'':<28} 加速比 {baseline / elapsed:.2f}x")
+        finally:
+            matcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+頻道通知發送基準測試
+
+在本機啟動一個模擬 Discord 速率限制的 HTTP 伺服器，通知經過與機器人相同的
+NotificationOutbox 與 OutboxDispatcher（同一頻道依序、不同頻道並行）發送，
+比較每秒能送出的通知數與每則通知的送達延遲：
+
+- 機器人 REST：discord.py 的 HTTPClient（Route.BASE 指向模擬伺服器）呼叫
+  POST /channels/{id}/messages，使用 discord.py 自己的限速處理，受全域限制與每頻道限制
+- webhook（每次新連線）：每則通知建立新的 aiohttp session
+- webhook（連線池）：WebhookSender 共用連線池，依回應標頭追蹤各 webhook 的限制
+- webhook（連線池，單一消費者）：max_in_flight=1，等同原本依序發送的消費者
+
+--hot-share 設定有多少比例的通知集中在同一個熱門頻道；單一消費者在熱門頻道
+等待限速重置時，其他頻道的通知也只能跟著等。
+
+    python bench_webhooks.py --sends 200 --channels 40
+    python bench_webhooks.py --no-limits   # 只比較用戶端與連線的開銷
+"""
+import argparse
+import asyncio
+import logging
+import shutil
+import tempfile
+import time
+
+import discord
+from aiohttp import web
+from discord.http import HTTPClient, Route, handle_message_parameters
+
+from outbox import NotificationOutbox, OutboxDispatcher
+from webhook_delivery import WebhookSender, webhook_payload
+
+
+class FixedWindow:
+    """每個鍵在 window 秒內最多 limit 次"""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self._windows = {}
+
+    def hit(self, key):
+        """回傳 (是否允許, 剩餘次數, 重置秒數)"""
+        now = time.monotonic()
+        started, count = self._windows.get(key, (now, 0))
+        if now - started >= self.window:
+            started, count = now, 0
+        reset_after = self.window - (now - started)
+        if self.limit and count >= self.limit:
+            return False, 0, reset_after
+        count += 1
+        self._windows[key] = (started, count)
+        return True, (self.limit - count) if self.limit else 1, reset_after
+
+
+def build_app(args):
+    global_bucket = FixedWindow(0 if args.no_limits else args.global_limit, 1.0)
+    channel_bucket = FixedWindow(0 if args.no_limits else args.channel_limit, args.channel_window)
+    webhook_bucket = FixedWindow(0 if args.no_limits else args.webhook_limit, args.webhook_window)
+
+    def respond(limit, allowed, remaining, reset_after, is_global=False, body=None):
+        # 與 Discord 相同的標頭；discord.py 只在帶有 Via 標頭時才把 429 當成限速處理
+        headers = {
+            'X-RateLimit-Limit': str(limit or 1),
+            'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset-After': f"{reset_after:.3f}",
+            'X-RateLimit-Bucket': 'bench',
+            'Via': '1.1 google',
+        }
+        if not allowed:
+            return web.json_response({"retry_after": reset_after, "global": is_global}, status=429, headers=headers)
+        if body is None:
+            return web.Response(status=204, headers=headers)
+        return web.json_response(body, headers=headers)
+
+    async def current_user(request):
+        return web.json_response({"id": "1", "username": "bench", "discriminator": "0", "avatar": None})
+
+    async def channel_message(request):
+        await request.read()
+        allowed, _, reset_after = global_bucket.hit('global')
+        if not allowed:
+            return respond(args.global_limit, False, 0, reset_after, is_global=True)
+        return respond(args.channel_limit, *channel_bucket.hit(request.match_info['channel_id']), body={"id": "1"})
+
+    async def webhook_message(request):
+        await request.read()
+        return respond(args.webhook_limit, *webhook_bucket.hit(request.match_info['webhook_id']))
+
+    app = web.Application()
+    app.router.add_get('/api/v10/users/@me', current_user)
+    app.router.add_post('/api/v10/channels/{channel_id}/messages', channel_message)
+    app.router.add_post('/api/webhooks/{webhook_id}/{token}', webhook_message)
+    return app
+
+
+def sample_embed():
+    return {
+        "title": "🎯 關鍵字匹配通知",
+        "fields": [
+            {"name": "匹配的關鍵字", "value": "**拳套**", "inline": False},
+            {"name": "訊息內容", "value": "```賣 拳套 攻擊+5 3000萬```", "inline": False},
+        ],
+    }
+
+
+def destinations(channels, sends, hot_share):
+    """每則通知的頻道：每 1/hot_share 則有一則送到第一個（熱門）頻道，其餘輪流分配"""
+    hot_every = round(1 / hot_share) if hot_share > 0 else 0
+    others = channels[1:] if hot_every else channels
+    result = []
+    for index in range(sends):
+        if hot_every and index % hot_every == 0:
+            result.append(channels[0])
+        else:
+            result.append(others[index % len(others)])
+    return result
+
+
+async def run_case(channels, deliver, max_in_flight):
+    """把每則通知放入佇列，經由 OutboxDispatcher 全部送出，回傳 (耗時, 各通知的送達延遲, 重試次數)"""
+    sends = len(channels)
+    directory = tempfile.mkdtemp(prefix='bench-outbox-')
+    outbox = NotificationOutbox(directory, memory_limit=sends)
+    latencies = []
+
+    async def timed(entry):
+        delivered = await deliver(entry)
+        latencies.append(time.perf_counter() - started)
+        return delivered
+
+    try:
+        for index in range(sends):
+            outbox.put({"channel_id": channels[index], "user_id": index})
+        dispatcher = OutboxDispatcher(outbox, timed, lambda entry: entry["channel_id"], max_in_flight=max_in_flight)
+        started = time.perf_counter()
+        task = asyncio.create_task(dispatcher.run())
+        while outbox.stats["delivered"] + outbox.stats["failed"] < sends:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return elapsed, sorted(latencies), dispatcher.stats["retries"]
+    finally:
+        outbox.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="頻道通知發送基準測試")
+    parser.add_argument("--sends", type=int, default=200)
+    parser.add_argument("--channels", type=int, default=40)
+    parser.add_argument("--hot-share", type=float, default=0.1, help="集中在熱門頻道的通知比例")
+    parser.add_argument("--global-limit", type=int, default=50, help="機器人全域每秒上限")
+    parser.add_argument("--channel-limit", type=int, default=5)
+    parser.add_argument("--channel-window", type=float, default=5.0)
+    parser.add_argument("--webhook-limit", type=int, default=5)
+    parser.add_argument("--webhook-window", type=float, default=2.0)
+    parser.add_argument("--max-in-flight", type=int, default=200, help="同 OUTBOX_MAX_IN_FLIGHT")
+    parser.add_argument("--no-limits", action="store_true", help="關閉模擬的速率限制")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    # discord.py 與 OutboxDispatcher 被限速時會記錄警告，基準測試只看結果
+    logging.getLogger('discord.http').setLevel(logging.ERROR)
+    logging.getLogger('outbox').setLevel(logging.ERROR)
+
+    runner = web.AppRunner(build_app(args))
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', args.port).start()
+    base = f"http://127.0.0.1:{args.port}/api"
+    Route.BASE = f"{base}/v10"
+    print(f"📊 {args.sends} 則通知分散到 {args.channels} 個頻道，{args.hot_share:.0%} 集中在一個熱門頻道"
+          + ("（無速率限制）" if args.no_limits else ""))
+
+    http = HTTPClient(asyncio.get_running_loop())
+    await http.static_login("bench-token")
+    sender = WebhookSender()
+    embed = discord.Embed.from_dict(sample_embed())
+    mentions = discord.AllowedMentions(everyone=False, roles=False, users=True)
+
+    async def bot_send(entry):
+        params = handle_message_parameters(content=f"<@{entry['user_id']}>", embed=embed, allowed_mentions=mentions)
+        with params:
+            await http.send_message(entry["channel_id"], params=params)
+        return True
+
+    def webhook_send(send):
+        async def deliver(entry):
+            await send(f"{base}/webhooks/{entry['channel_id']}/token",
+                       webhook_payload(f"<@{entry['user_id']}>", sample_embed(), [entry['user_id']]))
+            return True
+        return deliver
+
+    async def unpooled_send(url, payload):
+        unpooled = WebhookSender(pool_size=1)
+        try:
+            await unpooled.send(url, payload)
+        finally:
+            await unpooled.close()
+
+    try:
+        cases = [
+            ("機器人 REST", bot_send, args.max_in_flight),
+            ("webhook（每次新連線）", webhook_send(unpooled_send), args.max_in_flight),
+            ("webhook（連線池）", webhook_send(sender.send), args.max_in_flight),
+            ("webhook（連線池，單一消費者）", webhook_send(sender.send), 1),
+        ]
+        for case, (label, deliver, max_in_flight) in enumerate(cases):
+            # 每種方式使用不同的頻道，避免沿用前一輪的限制額度
+            channels = [10**17 + case * args.channels + i for i in range(args.channels)]
+            channels = destinations(channels, args.sends, args.hot_share)
+            limited_before = sender.stats["rate_limited"]
+            elapsed, latencies, retries = await run_case(channels, deliver, max_in_flight)
+            limited = sender.stats["rate_limited"] - limited_before
+            notes = f"，被限速 {limited} 次" if limited else ""
+            notes += f"，重試 {retries} 次" if retries else ""
+            print(f"{label:<24} {args.sends / elapsed:>8,.1f} 則/秒  延遲 p50 {percentile(latencies, 0.5):6.2f} 秒"
+                  f"  p95 {percentile(latencies, 0.95):6.2f} 秒  ({elapsed:.2f} 秒{notes})")
+    finally:
+        await sender.close()
+        await http.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
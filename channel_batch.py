@@ -0,0 +1,69 @@
+"""
+共用通知頻道的合併發送
+
+多位用戶以 set_channel 指向同一個 Discord 頻道時，同一則公頻訊息原本會
+在該頻道各發一則 embed。這裡把收件者依通知頻道分組，同一頻道的收件者
+合併成一則貼文（內容放所有提及，embed 列出每位用戶匹配的關鍵字），
+頻道 API 呼叫次數從 O(用戶數) 降為 O(頻道數)。每則貼文遵守 Discord 的
+訊息長度（2000 字元）與 embed 欄位長度（1024 字元）限制，超過時拆成多則。
+"""
+MAX_CONTENT_LENGTH = 2000
+MAX_FIELD_LENGTH = 1024
+MAX_RECIPIENTS = 25
+
+
+def group_by_channel(deliveries, channels):
+    """把 {用戶: 關鍵字} 依通知頻道分組
+
+    回傳 (batches, singles)：batches 為 {頻道: [(用戶, 關鍵字), ...]}，
+    只包含兩位以上收件者的頻道；其餘用戶放在 singles，照原本方式個別通知。
+    """
+    by_channel = {}
+    singles = {}
+    for user_id, keywords in deliveries.items():
+        channel_id = channels.get(user_id)
+        if channel_id:
+            by_channel.setdefault(channel_id, []).append((user_id, keywords))
+        else:
+            singles[user_id] = keywords
+    batches = {}
+    for channel_id, recipients in by_channel.items():
+        if len(recipients) > 1:
+            batches[channel_id] = recipients
+        else:
+            user_id, keywords = recipients[0]
+            singles[user_id] = keywords
+    return batches, singles
+
+
+def mention(user_id):
+    return f"<@{user_id}>"
+
+
+def recipient_line(user_id, keywords):
+    line = f"{mention(user_id)}: " + ", ".join(f"**{kw}**" for kw in keywords)
+    if len(line) > MAX_FIELD_LENGTH:
+        line = line[:MAX_FIELD_LENGTH - 3] + "..."
+    return line
+
+
+def chunk_recipients(recipients, max_recipients=MAX_RECIPIENTS):
+    """把收件者切成多組，每組的提及內容與關鍵字欄位都不超過 Discord 的長度限制"""
+    chunk = []
+    content_length = field_length = 0
+    for user_id, keywords in recipients:
+        line_length = len(recipient_line(user_id, keywords)) + 1
+        mention_length = len(mention(user_id)) + 1
+        if chunk and (
+            len(chunk) >= max_recipients
+            or content_length + mention_length > MAX_CONTENT_LENGTH
+            or field_length + line_length > MAX_FIELD_LENGTH
+        ):
+            yield chunk
+            chunk = []
+            content_length = field_length = 0
+        chunk.append((user_id, keywords))
+        content_length += mention_length
+        field_length += line_length
+    if chunk:
+        yield chunk
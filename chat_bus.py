@@ -0,0 +1,158 @@
+"""
+本機聊天訊息匯流排
+
+多個機器人行程（各自負責一組分片）不需要各自連線 wss://api.pal.tw：
+其中一個行程持有 WebSocket 連線，把收到的原始訊息廣播到 Unix socket，
+其他行程訂閱同一個 socket。每個訊框是 4 位元組的長度加上一筆二進位紀錄：
+
+    版本(1) 旗標(1) 頻道(2) 時間戳(8, epoch 秒) 名稱長度(2) 內容長度(2) 正規化長度(2)
+    名稱 內容 正規化內容（UTF-8）
+
+發布端已正規化的內容一併送出，訂閱端不必重算。
+"""
+import asyncio
+import logging
+import os
+import struct
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUS_PATH = '/tmp/artale_chat_bus.sock'
+FRAME_HEADER = struct.Struct('>I')
+MAX_FRAME_SIZE = 1 << 20
+RECORD_VERSION = 1
+RECORD_HEADER = struct.Struct('>BBHdHHH')
+FLAG_NORMALIZED = 0x01
+MAX_FIELD_SIZE = 0xFFFF
+
+
+def _to_epoch(timestamp):
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    try:
+        return datetime.fromisoformat(str(timestamp).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return datetime.now().timestamp()
+
+
+def _field(value):
+    return (value or '').encode()[:MAX_FIELD_SIZE]
+
+
+def encode_message(msg):
+    """把訊息 {channel, username, text, timestamp[, normalized]} 編碼成二進位紀錄"""
+    channel = msg.get('channel')
+    channel = int(channel) if str(channel).isdigit() and int(channel) <= 0xFFFF else 0
+    username, text = _field(msg.get('username')), _field(msg.get('text'))
+    normalized = msg.get('normalized')
+    flags = FLAG_NORMALIZED if normalized is not None else 0
+    normalized = _field(normalized)
+    header = RECORD_HEADER.pack(
+        RECORD_VERSION, flags, channel, _to_epoch(msg.get('timestamp')),
+        len(username), len(text), len(normalized)
+    )
+    return header + username + text + normalized
+
+
+def decode_message(payload):
+    version, flags, channel, timestamp, username_size, text_size, normalized_size = RECORD_HEADER.unpack_from(payload)
+    if version != RECORD_VERSION:
+        raise ValueError(f"不支援的紀錄版本: {version}")
+    offset = RECORD_HEADER.size
+    fields = []
+    for size in (username_size, text_size, normalized_size):
+        fields.append(payload[offset:offset + size].decode(errors='ignore'))
+        offset += size
+    msg = {
+        'channel': channel or '',
+        'username': fields[0],
+        'text': fields[1],
+        'timestamp': datetime.fromtimestamp(timestamp).isoformat(),
+    }
+    if flags & FLAG_NORMALIZED:
+        msg['normalized'] = fields[2]
+    return msg
+
+
+def encode_frame(msg):
+    payload = encode_message(msg)
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader):
+    """讀取一個訊框並解碼，連線關閉時拋出 asyncio.IncompleteReadError"""
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"訊框過大: {length} 位元組")
+    return decode_message(await reader.readexactly(length))
+
+
+class ChatBusPublisher:
+    """在 Unix socket 上廣播聊天訊息
+
+    訂閱者的寫入緩衝超過 max_buffer 位元組時（處理太慢）會被斷線，
+    不會拖慢其他訂閱者；斷線的訂閱者會自行重新連線。
+    """
+
+    def __init__(self, path=DEFAULT_BUS_PATH, max_buffer=4 << 20):
+        self.path = path
+        self.max_buffer = max_buffer
+        self._server = None
+        self._writers = set()
+        self.stats = {"published": 0, "dropped_subscribers": 0}
+
+    @property
+    def subscribers(self):
+        return len(self._writers)
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._server = await asyncio.start_unix_server(self._handle_subscriber, path=self.path)
+        logger.info(f"📡 聊天匯流排已啟動: {self.path}")
+
+    async def _handle_subscriber(self, reader, writer):
+        self._writers.add(writer)
+        logger.info(f"🔗 匯流排訂閱者已連線，目前 {len(self._writers)} 個")
+        try:
+            # 訂閱者不會送資料，讀到 EOF 表示斷線
+            await reader.read()
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def publish(self, msg):
+        if not self._writers:
+            return
+        frame = encode_frame(msg)
+        for writer in list(self._writers):
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                logger.warning("⚠️ 匯流排訂閱者處理太慢，已斷線")
+                self._writers.discard(writer)
+                writer.close()
+                self.stats["dropped_subscribers"] += 1
+                continue
+            writer.write(frame)
+        self.stats["published"] += 1
+
+    async def close(self):
+        for writer in list(self._writers):
+            writer.close()
+        self._writers.clear()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def subscribe(path=DEFAULT_BUS_PATH):
+    """連線到匯流排並逐條產生訊息；連線中斷時拋出例外，由呼叫端負責重連"""
+    reader, writer = await asyncio.open_unix_connection(path)
+    try:
+        while True:
+            yield await read_frame(reader)
+    finally:
+        writer.close()
@@ -0,0 +1,189 @@
+"""
+通知冷卻與頻率上限
+
+同一則交易喊單反覆出現時，每次都通知會讓訂閱者被洗版。這裡以
+(用戶, 關鍵字) 為單位設定冷卻時間，並限制每位用戶每分鐘的通知數。
+冷卻的到期時間放在階層式時間輪上：排程與取消都是 O(1)，每個時間刻度
+只處理到期的那一格，不需要掃描時間戳列表，數十萬組 (用戶, 關鍵字)
+同時冷卻也不會拖慢比對。冷卻期間的匹配可以折疊，在冷卻結束時合併成
+一則通知送出。
+"""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+WHEEL_BITS = 6
+WHEEL_SLOTS = 1 << WHEEL_BITS
+WHEEL_MASK = WHEEL_SLOTS - 1
+
+
+class TimingWheel:
+    """階層式時間輪
+
+    每層 64 格：第 0 層一格一個刻度，第 1 層一格 64 個刻度，依此類推；
+    較遠的到期時間放在高層，時間前進到該格時再往下層分配。重新排程同一個
+    鍵只會更新到期時間，舊的位置在輪到時直接忽略（延遲刪除）。
+    """
+
+    def __init__(self, tick_seconds=1.0, levels=3, now=None):
+        self.tick_seconds = tick_seconds
+        self.levels = levels
+        self._wheels = [[[] for _ in range(WHEEL_SLOTS)] for _ in range(levels)]
+        self._deadlines = {}
+        self._tick = self._to_tick(time.time() if now is None else now)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def _to_tick(self, now):
+        return int(now / self.tick_seconds)
+
+    def _place(self, key, deadline):
+        delta = deadline - self._tick
+        for level in range(self.levels):
+            if delta < WHEEL_SLOTS << (WHEEL_BITS * level) or level == self.levels - 1:
+                slot = (deadline >> (WHEEL_BITS * level)) & WHEEL_MASK
+                self._wheels[level][slot].append((key, deadline))
+                return
+
+    def schedule(self, key, delay_seconds):
+        """delay_seconds 秒後到期（重複排程會覆蓋先前的到期時間）"""
+        deadline = self._tick + max(1, -(-int(delay_seconds * 1000) // int(self.tick_seconds * 1000)))
+        self._deadlines[key] = deadline
+        self._place(key, deadline)
+        return deadline
+
+    def cancel(self, key):
+        self._deadlines.pop(key, None)
+
+    def advance(self, now):
+        """時間前進到 now，回傳這段期間到期的鍵"""
+        target = self._to_tick(now)
+        expired = []
+        while self._tick < target:
+            self._tick += 1
+            tick = self._tick
+            # 高層的格子輪到時往下層重新分配
+            for level in range(self.levels - 1, 0, -1):
+                if tick & ((1 << (WHEEL_BITS * level)) - 1) == 0:
+                    slot = (tick >> (WHEEL_BITS * level)) & WHEEL_MASK
+                    entries, self._wheels[level][slot] = self._wheels[level][slot], []
+                    for key, deadline in entries:
+                        if self._deadlines.get(key) == deadline:
+                            self._place(key, deadline)
+            slot = tick & WHEEL_MASK
+            entries, self._wheels[0][slot] = self._wheels[0][slot], []
+            for key, deadline in entries:
+                if self._deadlines.get(key) != deadline:
+                    continue
+                if deadline > tick:
+                    self._place(key, deadline)
+                    continue
+                del self._deadlines[key]
+                expired.append(key)
+            if not self._deadlines:
+                # 沒有任何排程時直接跳到目標時間
+                self._tick = target
+        return expired
+
+
+class NotificationThrottle:
+    """(用戶, 關鍵字) 冷卻與每位用戶每分鐘上限
+
+    settings 格式為 {user_id: {"default": 秒數, "keywords": {keyword: 秒數}, "fold": bool}}，
+    可在執行期間直接修改。per_minute 為每位用戶每分鐘最多通知數（0 表示不限）。
+    """
+
+    def __init__(self, settings=None, default_cooldown=0, per_minute=0, now=None):
+        self.settings = settings if settings is not None else {}
+        self.default_cooldown = default_cooldown
+        self.per_minute = per_minute
+        self.wheel = TimingWheel(now=now)
+        self._minute_counts = {}
+        self._pending = {}
+        self.stats = {"cooled_down": 0, "capped": 0, "folded_sent": 0}
+
+    def cooldown_for(self, user_id, keyword):
+        setting = self.settings.get(user_id)
+        if not setting:
+            return self.default_cooldown
+        return setting.get("keywords", {}).get(keyword, setting.get("default", self.default_cooldown))
+
+    def fold_enabled(self, user_id):
+        return self.settings.get(user_id, {}).get("fold", True)
+
+    def _fold(self, key, message_data, keywords, count=1):
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = {"count": 0, "keywords": []}
+        pending["count"] += count
+        pending["message"] = message_data
+        for keyword in keywords:
+            if keyword not in pending["keywords"]:
+                pending["keywords"].append(keyword)
+
+    def _take_quota(self, user_id, now):
+        """用戶這一分鐘還能通知時計數並回傳 True"""
+        if not self.per_minute:
+            return True
+        minute = int(now // 60)
+        entry = self._minute_counts.get(user_id)
+        if entry is None or entry[0] != minute:
+            entry = self._minute_counts[user_id] = [minute, 0]
+        if entry[1] >= self.per_minute:
+            return False
+        entry[1] += 1
+        return True
+
+    def _cap(self, user_id, message_data, keywords, now, count=1):
+        """超過每分鐘上限：折疊到下一分鐘開始時送出"""
+        self.stats["capped"] += count
+        if self.fold_enabled(user_id):
+            key = (user_id, None)
+            self._fold(key, message_data, keywords, count)
+            if key not in self.wheel:
+                self.wheel.schedule(key, (int(now // 60) + 1) * 60 - now)
+
+    def _start_cooldowns(self, user_id, keywords):
+        for keyword in keywords:
+            cooldown = self.cooldown_for(user_id, keyword)
+            if cooldown > 0:
+                self.wheel.schedule((user_id, keyword), cooldown)
+
+    def admit(self, user_id, message_data, keywords, now=None):
+        """回傳可以通知的關鍵字；全部在冷卻中或超過上限時回傳空列表"""
+        now = time.time() if now is None else now
+        allowed = [keyword for keyword in keywords if (user_id, keyword) not in self.wheel]
+        if not allowed:
+            self.stats["cooled_down"] += 1
+            if self.fold_enabled(user_id):
+                for keyword in keywords:
+                    self._fold((user_id, keyword), message_data, [keyword])
+            return []
+        if not self._take_quota(user_id, now):
+            self._cap(user_id, message_data, allowed, now)
+            return []
+        self._start_cooldowns(user_id, allowed)
+        return allowed
+
+    def advance(self, now=None):
+        """推進時間輪，回傳冷卻結束時要送出的折疊通知 [(user_id, message_data, keywords, folded), ...]"""
+        now = time.time() if now is None else now
+        flushes = []
+        for key in self.wheel.advance(now):
+            pending = self._pending.pop(key, None)
+            if pending is None:
+                continue
+            user_id = key[0]
+            if not self._take_quota(user_id, now):
+                self._cap(user_id, pending["message"], pending["keywords"], now, pending["count"])
+                continue
+            # 折疊通知本身也算一次通知，重新開始冷卻
+            self._start_cooldowns(user_id, pending["keywords"])
+            self.stats["folded_sent"] += pending["count"]
+            flushes.append((user_id, pending["message"], pending["keywords"], pending["count"]))
+        return flushes
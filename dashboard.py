@@ -0,0 +1,128 @@
+"""
+Web 控制台即時推送
+
+以 Server-Sent Events 把狀態變化與抽樣的匹配訊息推送給瀏覽器。每個事件只
+序列化一次，再放進各連線的有界佇列；佇列滿的慢速連線會被直接斷開，
+不會拖慢處理管線或其他觀看者。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardClient:
+    """單一瀏覽器連線"""
+
+    def __init__(self, buffer_size):
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = False
+
+
+class EventBroadcaster:
+    """把事件廣播給所有 SSE 連線"""
+
+    def __init__(self, client_buffer=100, sample_interval=1.0, samples_per_interval=5,
+                 keepalive_interval=15.0):
+        self.client_buffer = client_buffer
+        self.sample_interval = sample_interval
+        self.samples_per_interval = samples_per_interval
+        self.keepalive_interval = keepalive_interval
+        self.clients = set()
+        self.last_status = {}
+        self.stats = {"events_published": 0, "clients_dropped": 0, "matches_sampled": 0, "matches_skipped": 0}
+        self._sample_window_start = 0.0
+        self._sample_count = 0
+
+    @staticmethod
+    def _encode(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def subscribe(self):
+        client = DashboardClient(self.client_buffer)
+        # 新連線先收到完整狀態，之後只收差異
+        if self.last_status:
+            client.queue.put_nowait(self._encode("status", self.last_status))
+        self.clients.add(client)
+        logger.info(f"📺 控制台連線加入，目前 {len(self.clients)} 個")
+        return client
+
+    def unsubscribe(self, client):
+        self.clients.discard(client)
+
+    def publish(self, event, data):
+        if not self.clients:
+            return
+        payload = self._encode(event, data)
+        self.stats["events_published"] += 1
+        for client in list(self.clients):
+            try:
+                client.queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # 慢速連線直接斷開，不阻塞廣播
+                client.dropped = True
+                self.clients.discard(client)
+                self.stats["clients_dropped"] += 1
+                logger.warning("🐢 控制台連線跟不上推送速度，已斷開")
+
+    def publish_status(self, status):
+        """只推送和上次相比有變化的狀態欄位"""
+        delta = {key: value for key, value in status.items() if self.last_status.get(key) != value}
+        if not delta:
+            return
+        self.last_status = dict(status)
+        self.publish("status", delta)
+
+    def publish_match(self, message_data, matches):
+        """以每個時間區間固定數量抽樣推送匹配訊息"""
+        if not self.clients:
+            return
+        now = time.monotonic()
+        if now - self._sample_window_start >= self.sample_interval:
+            self._sample_window_start = now
+            self._sample_count = 0
+        if self._sample_count >= self.samples_per_interval:
+            self.stats["matches_skipped"] += 1
+            return
+        self._sample_count += 1
+        self.stats["matches_sampled"] += 1
+        keywords = sorted({keyword for matched in matches.values() for keyword in matched})
+        self.publish("match", {
+            "channel": message_data.get("channel", ""),
+            "username": message_data.get("username", ""),
+            "text": message_data.get("text", "")[:200],
+            "timestamp": message_data.get("timestamp"),
+            "keywords": keywords,
+            "subscribers": len(matches),
+        })
+
+    async def stream(self, client):
+        """產生 SSE 內容，連線中斷時自動取消訂閱"""
+        try:
+            yield "retry: 5000\n\n"
+            while not client.dropped:
+                try:
+                    payload = await asyncio.wait_for(client.queue.get(), timeout=self.keepalive_interval)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield payload
+        finally:
+            self.unsubscribe(client)
+
+
+class StaticAsset:
+    """載入一次並以 ETag 快取的靜態檔案"""
+
+    def __init__(self, path, media_type, max_age=300):
+        with open(path, 'rb') as f:
+            self.content = f.read()
+        self.media_type = media_type
+        self.etag = '"' + hashlib.md5(self.content).hexdigest() + '"'
+        self.headers = {"ETag": self.etag, "Cache-Control": f"public, max-age={max_age}"}
+
+    def not_modified(self, if_none_match):
+        return if_none_match is not None and self.etag in if_none_match
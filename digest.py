@@ -0,0 +1,109 @@
+"""
+定時摘要通知
+
+不需要即時通知的用戶可以改成每 N 分鐘收到一則摘要。摘要期間的匹配放在
+每位用戶的精簡緩衝區：只保留最近 max_items 則（訊息只留發送需要的欄位），
+各關鍵字的匹配次數另外計數，因此被擠出緩衝區的匹配仍會算進摘要。
+到期時間沿用 cooldown.py 的階層式時間輪，排程器每次推進時一次取出所有
+到期的摘要。摘要挑選 top_n 則訊息：先取每個關鍵字最新的一則，再依時間
+由新到舊補滿，最後依時間排序。
+"""
+import logging
+import time
+from collections import Counter, deque
+
+from cooldown import TimingWheel
+
+logger = logging.getLogger(__name__)
+
+MIN_DIGEST_MINUTES = 5
+MAX_DIGEST_MINUTES = 1440
+DIGEST_FIELDS = ('text', 'username', 'channel', 'timestamp')
+
+
+class DigestScheduler:
+    """每位用戶的摘要緩衝區與到期排程
+
+    settings 格式為 {user_id: {"minutes": 15}}，可在執行期間直接修改。
+    """
+
+    def __init__(self, settings=None, max_items=50, top_n=10, now=None):
+        self.settings = settings if settings is not None else {}
+        self.max_items = max_items
+        self.top_n = top_n
+        self.wheel = TimingWheel(now=now)
+        self._buffers = {}
+        self.stats = {"buffered": 0, "digests_sent": 0}
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def minutes_for(self, user_id):
+        return self.settings.get(user_id, {}).get("minutes", 0)
+
+    def add(self, user_id, message_data, keywords, now=None):
+        """用戶使用摘要模式時把匹配放入緩衝區並回傳 True，否則回傳 False"""
+        minutes = self.minutes_for(user_id)
+        if not minutes:
+            return False
+        now = time.time() if now is None else now
+        buffer = self._buffers.get(user_id)
+        if buffer is None:
+            buffer = self._buffers[user_id] = {
+                "since": now, "minutes": minutes, "total": 0,
+                "keywords": Counter(), "items": deque(maxlen=self.max_items),
+            }
+            self.wheel.schedule(user_id, minutes * 60)
+        item = {field: message_data[field] for field in DIGEST_FIELDS if field in message_data}
+        item["keywords"] = list(keywords)
+        buffer["items"].append(item)
+        buffer["keywords"].update(keywords)
+        buffer["total"] += 1
+        self.stats["buffered"] += 1
+        return True
+
+    def _select(self, items):
+        latest = list(reversed(items))
+        picked = []
+        covered = set()
+        for index, item in enumerate(latest):
+            if len(picked) >= self.top_n:
+                break
+            if not covered.issuperset(item["keywords"]):
+                covered.update(item["keywords"])
+                picked.append(index)
+        for index in range(len(latest)):
+            if len(picked) >= self.top_n:
+                break
+            if index not in picked:
+                picked.append(index)
+        return [latest[index] for index in sorted(picked, reverse=True)]
+
+    def _build(self, user_id, now):
+        buffer = self._buffers.pop(user_id, None)
+        if buffer is None:
+            return None
+        self.wheel.cancel(user_id)
+        self.stats["digests_sent"] += 1
+        return {
+            "since": buffer["since"],
+            "until": now,
+            "minutes": buffer["minutes"],
+            "total": buffer["total"],
+            "keywords": buffer["keywords"].most_common(),
+            "items": self._select(buffer["items"]),
+        }
+
+    def take(self, user_id, now=None):
+        """立即取出用戶的摘要（例如關閉摘要模式時），沒有待送的匹配時回傳 None"""
+        return self._build(user_id, time.time() if now is None else now)
+
+    def advance(self, now=None):
+        """推進時間輪，回傳所有到期的摘要 [(user_id, digest), ...]"""
+        now = time.time() if now is None else now
+        return [(user_id, self._build(user_id, now)) for user_id in self.wheel.advance(now) if user_id in self._buffers]
+
+    def flush_all(self, now=None):
+        """取出所有尚未到期的摘要（關閉時交給通知佇列保存）"""
+        now = time.time() if now is None else now
+        return [(user_id, self._build(user_id, now)) for user_id in list(self._buffers)]
@@ -0,0 +1,290 @@
+"""
+關鍵字表達式
+
+支援 AND / OR / NOT、括號、"片語" 與 /正規表示式/，例如：
+
+    拳套 AND (收 OR 買) NOT 賣
+    "1:5 雪" OR /1:[1-5]雪/
+
+表達式在訂閱時解析一次，所有字面詞都註冊進共用的 Aho-Corasick 自動機，
+正規表示式只在預先篩選的字面詞出現時才會執行。字面詞與正規表示式都套用
+normalizer 的正規化規則，並比對正規化後的訊息文字。
+"""
+import functools
+import re
+
+from normalizer import normalize_regex, normalize_text
+
+TOKEN_PATTERN = re.compile(r'\(|\)|"(?:[^"\\]|\\.)*"|/(?:[^/\\]|\\.)+/|[^\s()]+')
+OPERATOR_PATTERN = re.compile(r'(^|\s)(AND|OR|NOT)(\s|$)')
+REGEX_META = set('.^$*+?{}[]\\|()')
+
+
+class ExpressionError(ValueError):
+    """表達式語法錯誤"""
+
+
+def is_expression(keyword):
+    """判斷關鍵字是否為表達式（否則視為一般的子字串關鍵字）"""
+    keyword = keyword.strip()
+    return bool(OPERATOR_PATTERN.search(keyword)) or (
+        len(keyword) > 2 and keyword.startswith('/') and keyword.endswith('/')
+    )
+
+
+class Literal:
+    def __init__(self, text):
+        self.text = text
+        self.pattern_id = None
+
+    def bind(self, register):
+        self.pattern_id = register(self.text)
+
+    def required(self):
+        return [self.pattern_id]
+
+    def evaluate(self, hits, text):
+        return self.pattern_id in hits
+
+
+class Regex:
+    def __init__(self, source):
+        source = normalize_regex(source)
+        try:
+            self.regex = re.compile(source, re.IGNORECASE)
+        except re.error as e:
+            raise ExpressionError(f"正規表示式錯誤 /{source}/: {e}")
+        self.source = source
+        self.prefilter = _regex_literal(source)
+        self.pattern_id = None
+
+    def bind(self, register):
+        if self.prefilter:
+            self.pattern_id = register(self.prefilter)
+
+    def required(self):
+        return [self.pattern_id] if self.pattern_id is not None else None
+
+    def evaluate(self, hits, text):
+        if self.pattern_id is not None and self.pattern_id not in hits:
+            return False
+        return self.regex.search(text) is not None
+
+
+class And:
+    def __init__(self, children):
+        self.children = children
+
+    def bind(self, register):
+        for child in self.children:
+            child.bind(register)
+
+    def required(self):
+        # 任一子條件的必要字面詞都足以當作整個 AND 的預先篩選
+        candidates = [r for r in (child.required() for child in self.children) if r is not None]
+        return min(candidates, key=len) if candidates else None
+
+    def evaluate(self, hits, text):
+        # 字面詞條件放在前面，正規表示式放在最後才執行
+        return all(child.evaluate(hits, text) for child in self.children)
+
+
+class Or:
+    def __init__(self, children):
+        self.children = children
+
+    def bind(self, register):
+        for child in self.children:
+            child.bind(register)
+
+    def required(self):
+        required = []
+        for child in self.children:
+            child_required = child.required()
+            if child_required is None:
+                return None
+            required.extend(child_required)
+        return required
+
+    def evaluate(self, hits, text):
+        return any(child.evaluate(hits, text) for child in self.children)
+
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+
+    def bind(self, register):
+        self.child.bind(register)
+
+    def required(self):
+        return None
+
+    def evaluate(self, hits, text):
+        return not self.child.evaluate(hits, text)
+
+
+def _regex_literal(source):
+    """取出正規表示式中必定出現的最長字面字串，作為預先篩選條件"""
+    # 有頂層 | 或沒有固定字面時無法預先篩選
+    depth = 0
+    escaped = False
+    for char in source:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return None
+
+    best = ''
+    current = ''
+    index = 0
+    depth = 0
+    while index < len(source):
+        char = source[index]
+        next_char = source[index + 1] if index + 1 < len(source) else ''
+        if char == '\\':
+            # 跳脫字元（如 \d）不是字面
+            current = ''
+            index += 2
+            continue
+        if char == '{':
+            # {m,n} 量詞的內容不是字面，前一個字元已因量詞而不列入
+            closing = source.find('}', index)
+            current = ''
+            index = closing + 1 if closing != -1 else len(source)
+            continue
+        if char in '([':
+            depth += 1
+            current = ''
+        elif char in ')]':
+            depth -= 1
+            current = ''
+        elif depth == 0 and char not in REGEX_META and next_char not in ('*', '?', '{'):
+            current += char
+            if len(current) > len(best):
+                best = current
+        else:
+            current = ''
+        index += 1
+    return normalize_text(best) or None
+
+
+def _order_children(children):
+    # 讓字面詞先判斷，短路後就不必執行正規表示式
+    return sorted(children, key=lambda child: isinstance(child, Regex))
+
+
+class _Parser:
+    def __init__(self, source):
+        self.tokens = TOKEN_PATTERN.findall(source)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ExpressionError("表達式不可為空")
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise ExpressionError(f"無法解析的內容: {self.peek()}")
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == 'OR':
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek() not in (None, 'OR', ')'):
+            if self.peek() == 'AND':
+                self.take()
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else And(_order_children(children))
+
+    def parse_not(self):
+        if self.peek() == 'NOT':
+            self.take()
+            return Not(self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        token = self.take()
+        if token is None:
+            raise ExpressionError("表達式不完整")
+        if token == '(':
+            node = self.parse_or()
+            if self.take() != ')':
+                raise ExpressionError("缺少右括號")
+            return node
+        if token in (')', 'AND', 'OR'):
+            raise ExpressionError(f"位置錯誤的運算子: {token}")
+        if token.startswith('"') and token.endswith('"') and len(token) >= 2:
+            phrase = token[1:-1].replace('\\"', '"')
+            if not phrase:
+                raise ExpressionError("片語不可為空")
+            return Literal(normalize_text(phrase))
+        if len(token) > 2 and token.startswith('/') and token.endswith('/'):
+            return Regex(token[1:-1])
+        return Literal(normalize_text(token))
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_cached(source):
+    return _Parser(source).parse()
+
+
+def _is_positive(node):
+    """表達式是否包含至少一個正向條件（純 NOT 會匹配幾乎所有訊息）"""
+    if isinstance(node, Not):
+        return False
+    if isinstance(node, And):
+        return any(_is_positive(child) for child in node.children)
+    if isinstance(node, Or):
+        return all(_is_positive(child) for child in node.children)
+    return True
+
+
+def validate_expression(source):
+    """檢查表達式語法，錯誤時拋出 ExpressionError"""
+    if not _is_positive(_parse_cached(source.strip())):
+        raise ExpressionError("表達式至少需要一個正向條件，不能只有 NOT")
+
+
+def compile_expression(source, register):
+    """解析表達式並把字面詞註冊進自動機
+
+    register(literal) 回傳該字面詞在自動機中的模式編號。回傳
+    (node, trigger_ids)；trigger_ids 為 None 表示每條訊息都需要判斷。
+    """
+    # 解析結果有快取，每次重建索引只需重新綁定模式編號
+    validate_expression(source)
+    node = _bind_copy(_parse_cached(source.strip()))
+    node.bind(register)
+    return node, node.required()
+
+
+def _bind_copy(node):
+    if isinstance(node, Literal):
+        return Literal(node.text)
+    if isinstance(node, Regex):
+        copy = Regex.__new__(Regex)
+        copy.regex, copy.source, copy.prefilter, copy.pattern_id = node.regex, node.source, node.prefilter, None
+        return copy
+    if isinstance(node, Not):
+        return Not(_bind_copy(node.child))
+    return type(node)([_bind_copy(child) for child in node.children])
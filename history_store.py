@@ -0,0 +1,204 @@
+"""
+聊天歷史全文檢索
+
+把處理過的公頻訊息批次寫入 SQLite FTS5（trigram 分詞，適合中文），
+每天一個分區資料表，過期分區直接 DROP，不需要逐筆刪除。
+"""
+import asyncio
+import logging
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = "messages_"
+PARTITION_PATTERN = re.compile(r"^messages_(\d{8})$")
+
+
+class HistoryStore:
+    """以日期分區的聊天歷史資料庫"""
+
+    def __init__(self, path="chat_history.db", retention_days=7, batch_size=500, flush_interval=2.0):
+        self.path = path
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.stats = {"inserted": 0, "flushes": 0, "partitions_dropped": 0}
+        self._lock = threading.Lock()
+        self._known_partitions = set()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._known_partitions.update(self.partitions())
+
+    def partitions(self):
+        """回傳現有分區名稱（由新到舊）"""
+        rows = self._conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE ?", (PARTITION_PREFIX + "%",)
+        ).fetchall()
+        return sorted((name for (name,) in rows if PARTITION_PATTERN.match(name)), reverse=True)
+
+    def _ensure_partition(self, name):
+        if name in self._known_partitions:
+            return
+        self._conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5("
+            "text, username UNINDEXED, channel UNINDEXED, ts UNINDEXED, timestamp UNINDEXED, "
+            "tokenize='trigram')"
+        )
+        self._known_partitions.add(name)
+
+    @staticmethod
+    def _partition_for(ts):
+        return PARTITION_PREFIX + datetime.fromtimestamp(ts).strftime("%Y%m%d")
+
+    def add(self, message_data, ts=None):
+        """加入待寫入的訊息（只放進記憶體，由 flush 批次寫入）"""
+        self.pending.append((
+            message_data.get('text', ''),
+            message_data.get('username', ''),
+            message_data.get('channel', ''),
+            ts if ts is not None else time.time(),
+            str(message_data.get('timestamp', '')),
+        ))
+
+    def flush(self):
+        """把待寫入的訊息批次寫入資料庫，回傳寫入筆數"""
+        if not self.pending:
+            return 0
+        batch, self.pending = self.pending, []
+        by_partition = {}
+        for row in batch:
+            by_partition.setdefault(self._partition_for(row[3]), []).append(row)
+
+        with self._lock:
+            with self._conn:
+                for name, rows in by_partition.items():
+                    self._ensure_partition(name)
+                    self._conn.executemany(
+                        f"INSERT INTO {name} (text, username, channel, ts, timestamp) VALUES (?, ?, ?, ?, ?)", rows
+                    )
+        self.stats["inserted"] += len(batch)
+        self.stats["flushes"] += 1
+        return len(batch)
+
+    def prune(self, now=None):
+        """刪除超過保留天數的分區"""
+        cutoff = PARTITION_PREFIX + (
+            datetime.fromtimestamp(now or time.time()) - timedelta(days=self.retention_days)
+        ).strftime("%Y%m%d")
+        dropped = 0
+        with self._lock:
+            for name in self.partitions():
+                if name < cutoff:
+                    self._conn.execute(f"DROP TABLE IF EXISTS {name}")
+                    self._known_partitions.discard(name)
+                    dropped += 1
+            if dropped:
+                self._conn.commit()
+        if dropped:
+            self.stats["partitions_dropped"] += dropped
+            logger.info(f"🧹 已刪除 {dropped} 個過期的歷史分區")
+        return dropped
+
+    def _partitions_since(self, since_ts):
+        names = self.partitions()
+        if since_ts is None:
+            return names
+        oldest = self._partition_for(since_ts)
+        return [name for name in names if name >= oldest]
+
+    def search(self, query, hours=None, limit=20, channel=None):
+        """全文搜尋，結果由新到舊
+
+        查詢字串至少 3 個字時使用 trigram 索引；較短的查詢無法使用 trigram，
+        改用 instr() 掃描（部分 SQLite 版本的 trigram LIKE 對短中文字串會漏掉結果）。
+        """
+        query = query.strip()
+        if not query:
+            return []
+        since_ts = time.time() - hours * 3600 if hours else None
+        if len(query) >= 3:
+            condition = "text MATCH ?"
+            param = '"' + query.replace('"', '""') + '"'
+        else:
+            condition = "instr(text, ?) > 0"
+            param = query
+
+        results = []
+        with self._lock:
+            for name in self._partitions_since(since_ts):
+                sql = f"SELECT text, username, channel, ts, timestamp FROM {name} WHERE {condition}"
+                params = [param]
+                if since_ts is not None:
+                    sql += " AND ts >= ?"
+                    params.append(since_ts)
+                if channel:
+                    sql += " AND channel = ?"
+                    params.append(channel)
+                sql += " ORDER BY rowid DESC LIMIT ?"
+                params.append(limit - len(results))
+                results.extend(self._conn.execute(sql, params).fetchall())
+                if len(results) >= limit:
+                    break
+        return [self._row_to_dict(row) for row in results]
+
+    def iter_messages(self, hours):
+        """依時間順序逐批讀取最近 hours 小時的訊息（供回測等批次處理）"""
+        since_ts = time.time() - hours * 3600
+        for name in reversed(self._partitions_since(since_ts)):
+            last_rowid = 0
+            while True:
+                with self._lock:
+                    rows = self._conn.execute(
+                        f"SELECT rowid, text, username, channel, ts, timestamp FROM {name} "
+                        "WHERE rowid > ? AND ts >= ? ORDER BY rowid LIMIT 5000",
+                        (last_rowid, since_ts),
+                    ).fetchall()
+                if not rows:
+                    break
+                last_rowid = rows[-1][0]
+                yield [self._row_to_dict(row[1:]) for row in rows]
+
+    @staticmethod
+    def _row_to_dict(row):
+        text, username, channel, ts, timestamp = row
+        return {
+            'text': text,
+            'username': username,
+            'channel': channel,
+            'ts': ts,
+            'timestamp': timestamp,
+        }
+
+    def count(self):
+        with self._lock:
+            return sum(self._conn.execute(f"SELECT count(*) FROM {name}").fetchone()[0] for name in self.partitions())
+
+    async def run(self):
+        """定期批次寫入，每小時清理一次過期分區"""
+        last_prune = 0.0
+        while True:
+            # 等到間隔時間到或累積滿一個批次
+            waited = 0.0
+            while waited < self.flush_interval and len(self.pending) < self.batch_size:
+                await asyncio.sleep(0.2)
+                waited += 0.2
+            try:
+                if self.pending:
+                    await asyncio.to_thread(self.flush)
+                if time.time() - last_prune > 3600:
+                    last_prune = time.time()
+                    await asyncio.to_thread(self.prune)
+            except Exception as e:
+                logger.error(f"寫入聊天歷史時發生錯誤: {e}")
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._conn.close()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+獨立的公頻訊息接收服務
+
+只負責連線 wss://api.pal.tw、正規化與去重複，再把二進位紀錄發布到本機聊天
+匯流排（見 chat_bus.py）；比對與 Discord 通知由任意數量的 `CHAT_BUS=subscribe`
+機器人行程負責。聊天歷史也由這裡寫入（HISTORY_ENABLED、HISTORY_DB 與機器人相同），
+訂閱端的機器人只查詢，每則訊息只存一份。接收端與通知端可以各自擴充、各自重新啟動，通知端重新啟動時
+不會中斷 WebSocket 連線，接收端重新啟動時通知端會自動重新連線。
+
+    python ingest.py
+    python ingest.py --simulate --rate 50   # 不連線，改用合成訊息
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import ssl
+import time
+from collections import OrderedDict
+
+import websockets
+from dotenv import load_dotenv
+
+from chat_bus import DEFAULT_BUS_PATH, ChatBusPublisher
+from history_store import HistoryStore
+from message_buffer import normalize_channel
+from normalizer import normalize_text
+from simulator import ChatSimulator
+from ws_stream import connect_options, iter_websocket_json
+
+logger = logging.getLogger(__name__)
+
+WS_URL = "wss://api.pal.tw"
+
+
+class IngestService:
+    """接收、正規化、去重複後發布到匯流排"""
+
+    def __init__(self, publisher, dedup_size=10000, history=None):
+        self.publisher = publisher
+        self.history = history
+        self.dedup_size = dedup_size
+        self._seen = OrderedDict()
+        self.stats = {"received": 0, "duplicates": 0, "published": 0}
+
+    def is_new_message(self, text):
+        message_hash = hashlib.md5(text.encode()).digest()
+        if message_hash in self._seen:
+            self._seen.move_to_end(message_hash)
+            return False
+        self._seen[message_hash] = None
+        if len(self._seen) > self.dedup_size:
+            self._seen.popitem(last=False)
+        return True
+
+    def handle(self, msg):
+        if not isinstance(msg, dict) or not msg.get('text'):
+            return
+        self.stats["received"] += 1
+        if not self.is_new_message(msg['text']):
+            self.stats["duplicates"] += 1
+            return
+        self.publisher.publish(dict(msg, normalized=normalize_text(msg['text'])))
+        self.stats["published"] += 1
+        if self.history:
+            # 頻道與機器人寫入的格式相同（"[3362]"），搜尋時才能以頻道篩選
+            channel = msg.get('channel')
+            self.history.add(dict(msg, channel=f"[{normalize_channel(channel)}]" if channel else ''))
+
+    async def run_websocket(self, url=WS_URL):
+        """連線 WebSocket，斷線後 5 秒重連"""
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        while True:
+            try:
+                logger.info(f"🔌 正在連接 WebSocket: {url}")
+                async with websockets.connect(
+                    url, ssl=ssl_context if url.startswith('wss://') else None, **connect_options()
+                ) as websocket:
+                    logger.info("✅ WebSocket 連接成功！開始接收訊息...")
+                    async for msg in iter_websocket_json(websocket):
+                        self.handle(msg)
+            except Exception as e:
+                logger.error(f"❌ WebSocket 連接錯誤: {e}")
+                logger.info("⏳ 5秒後重新連接...")
+                await asyncio.sleep(5)
+
+    async def run_simulator(self, simulator):
+        await simulator.run(lambda batch: [self.handle(msg) for msg in batch], batch_size=100)
+
+    async def report(self, interval=60):
+        last = dict(self.stats)
+        started = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            elapsed = time.monotonic() - started
+            started = time.monotonic()
+            rate = (self.stats["published"] - last["published"]) / elapsed
+            logger.info(
+                f"📊 收到 {self.stats['received']} 條、重複 {self.stats['duplicates']} 條、"
+                f"發布 {self.stats['published']} 條（{rate:.1f} 條/秒），訂閱者 {self.publisher.subscribers} 個"
+            )
+            last = dict(self.stats)
+
+
+async def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="公頻訊息接收服務")
+    parser.add_argument("--bus-path", default=os.getenv('CHAT_BUS_PATH', DEFAULT_BUS_PATH))
+    parser.add_argument("--simulate", action="store_true", help="使用合成訊息代替 WebSocket")
+    parser.add_argument("--rate", type=float, default=10.0, help="合成訊息每秒條數")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--report-interval", type=float, default=60)
+    args = parser.parse_args()
+
+    publisher = ChatBusPublisher(args.bus_path)
+    await publisher.start()
+    history = HistoryStore(
+        path=os.getenv('HISTORY_DB', 'chat_history.db'),
+        retention_days=int(os.getenv('HISTORY_RETENTION_DAYS', 7)),
+    ) if os.getenv('HISTORY_ENABLED', '1') == '1' else None
+    service = IngestService(publisher, history=history)
+    report_task = asyncio.create_task(service.report(args.report_interval))
+    history_task = asyncio.create_task(history.run()) if history else None
+    try:
+        if args.simulate:
+            await service.run_simulator(ChatSimulator(seed=args.seed, rate=args.rate))
+        else:
+            await service.run_websocket()
+    finally:
+        report_task.cancel()
+        if history:
+            history_task.cancel()
+            await asyncio.gather(history_task, return_exceptions=True)
+            history.close()
+        await publisher.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
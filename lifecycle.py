@@ -0,0 +1,85 @@
+"""
+背景任務生命週期管理
+
+discord.py 在閘道重新連線後會再次觸發 on_ready，如果每次都建立新的
+WebSocket 任務，重連幾次後就會有好幾個消費者同時處理同一批訊息。
+TaskSupervisor 以名稱為鍵擁有每個背景任務：重複啟動同名任務不會有任何
+效果，任務意外結束時依設定延遲後重新啟動，關閉時統一取消。
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TaskSupervisor:
+    """以名稱管理、可自動重啟的背景任務"""
+
+    def __init__(self):
+        self._tasks = {}
+        self._info = {}
+
+    def is_running(self, name):
+        task = self._tasks.get(name)
+        return task is not None and not task.done()
+
+    def start(self, name, factory, restart=True, restart_delay=5):
+        """啟動 factory() 回傳的協程；同名任務已在執行時直接回傳既有任務"""
+        if self.is_running(name):
+            return self._tasks[name]
+        info = self._info.setdefault(name, {"restarts": 0, "last_error": None})
+        info["started_at"] = time.time()
+        task = asyncio.create_task(self._supervise(name, factory, restart, restart_delay), name=name)
+        self._tasks[name] = task
+        logger.info(f"▶️ 背景任務已啟動: {name}")
+        return task
+
+    async def _supervise(self, name, factory, restart, restart_delay):
+        info = self._info[name]
+        while True:
+            try:
+                await factory()
+                if not restart:
+                    return
+                logger.warning(f"⚠️ 背景任務 {name} 已結束，{restart_delay} 秒後重新啟動")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                info["last_error"] = str(e)
+                if not restart:
+                    logger.error(f"❌ 背景任務 {name} 發生錯誤: {e}")
+                    return
+                logger.error(f"❌ 背景任務 {name} 發生錯誤，{restart_delay} 秒後重新啟動: {e}")
+            await asyncio.sleep(restart_delay)
+            info["restarts"] += 1
+
+    async def stop(self, name):
+        task = self._tasks.pop(name, None)
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"停止背景任務 {name} 時發生錯誤: {e}")
+
+    async def shutdown(self):
+        for name in list(self._tasks):
+            await self.stop(name)
+
+    @property
+    def running_count(self):
+        return sum(1 for name in self._tasks if self.is_running(name))
+
+    def status(self):
+        return {
+            name: {
+                "running": self.is_running(name),
+                "restarts": info["restarts"],
+                "last_error": info["last_error"],
+            }
+            for name, info in self._info.items()
+        }
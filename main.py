@@ -1,6 +1,8 @@
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+import aiohttp
 import discord
+from discord import app_commands
 from discord.ext import commands, tasks
 import requests
 from bs4 import BeautifulSoup
@@ -11,9 +13,39 @@ import json
 import logging
 from dotenv import load_dotenv
 import hashlib
-import threading
+import re
+from contextlib import asynccontextmanager, contextmanager
+from collections import OrderedDict
+import tempfile
 import websockets
 import ssl
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，只支援單一行程
+    fcntl = None
+from simulator import ChatSimulator
+from matcher import SubscriptionIndex
+from normalizer import normalize_text
+from trade_parser import PRICE_ALERT_INTENTS, PriceAlertIndex, format_price_alert, parse_trades
+from market_stats import WINDOWS as MARKET_WINDOWS, MarketStats
+from near_duplicate import NearDuplicateFilter, simhash
+from cooldown import NotificationThrottle
+from chat_bus import DEFAULT_BUS_PATH, ChatBusPublisher, subscribe as subscribe_chat_bus
+from sharding import ShardPartition
+from lifecycle import TaskSupervisor
+from outbox import NotificationOutbox, OutboxDispatcher
+from digest import MAX_DIGEST_MINUTES, MIN_DIGEST_MINUTES, DigestScheduler
+from ws_stream import connect_options as websocket_options, iter_websocket_json
+from webhook_delivery import WEBHOOK_NAME, WebhookError, WebhookGone, WebhookSender, webhook_payload
+from channel_batch import chunk_recipients, group_by_channel, mention, recipient_line
+from snapshot import encode_snapshot, read_snapshot, write_snapshot
+from audience import AudienceIndex, format_channel_ranges, parse_channel_ranges
+from parallel import ParallelMatcher
+from dashboard import EventBroadcaster, StaticAsset
+from message_buffer import MessageBuffer, normalize_channel
+from history_store import HistoryStore
+from backtest import preview_keyword
+from expressions import ExpressionError, is_expression, validate_expression
 
 # 載入環境變數
 load_dotenv()
@@ -22,30 +54,157 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# FastAPI 應用程式
-app = FastAPI(title="MapleStory Worlds Artale 關鍵字監控", description="Discord 機器人 Web 控制台")
+# FastAPI 應用程式與 Discord 機器人共用同一個事件迴圈
+@asynccontextmanager
+async def lifespan(app):
+    if chat_bus_publisher:
+        await chat_bus_publisher.start()
+    bot_task = asyncio.create_task(run_discord_bot())
+    task_supervisor.start('dashboard_status', publish_dashboard_status)
+    task_supervisor.start('notification_throttle', run_notification_throttle)
+    task_supervisor.start('digests', run_digests)
+    # 通知佇列在此載入上次未送出的通知；發送任務等機器人登入後由 on_ready 啟動
+    outbox.open()
+    if webhook_sender:
+        await webhook_sender.start()
+    if history_writer:
+        task_supervisor.start('history_store', history_store.run)
+    try:
+        yield
+    finally:
+        # 先停止通知佇列，正在發送的通知放回佇列，不會在機器人關閉後被當成失敗
+        await task_supervisor.stop('outbox')
+        await shutdown_discord_bot(bot_task)
+        await task_supervisor.shutdown()
+        # 尚未到期的摘要交給通知佇列保存，重新啟動後送出
+        for user_id, digest in digest_scheduler.flush_all():
+            enqueue_digest(user_id, digest)
+        outbox.close()
+        if webhook_sender:
+            await webhook_sender.close()
+        # 只有還原過（或從頭開始）的狀態才寫回，避免尚未就緒時以空狀態覆蓋快照
+        if settings_loaded and SNAPSHOT_INTERVAL > 0:
+            save_snapshot()
+        if history_store:
+            history_store.close()
+        if chat_bus_publisher:
+            await chat_bus_publisher.close()
+
+app = FastAPI(title="MapleStory Worlds Artale 關鍵字監控", description="Discord 機器人 Web 控制台", lifespan=lifespan)
 
 # Discord 機器人設置
 intents = discord.Intents.default()
-intents.message_content = True
+# 主要指令都有斜線指令版本，預設不需要訊息內容權限；
+# 提及機器人的訊息與私訊在沒有此權限時仍會帶有內容，@機器人 !指令 照常可用
+intents.message_content = os.getenv('MESSAGE_CONTENT_INTENT', '0') == '1'
+
+MENTION_PATTERN = re.compile(r'<@[!&]?\d+>')
 
 # 自定義前綴函數 - 只在被提及時才處理指令
 def get_prefix(bot, message):
     # 如果機器人被提及，則允許 ! 前綴
-    if bot.user and bot.user.mentioned_in(message):
+    if bot.user and bot.user in message.mentions:
         return '!'
     # 否則返回一個不可能的前綴，這樣就不會處理指令
     return "NEVER_MATCH_THIS_PREFIX_12345"
 
-bot = commands.Bot(command_prefix=get_prefix, intents=intents)
+# 分片：SHARD_COUNT + SHARD_IDS 指定本行程負責的分片，AUTO_SHARD=1 由 Discord 決定分片數
+shard_partition = ShardPartition.from_env()
+if shard_partition.shard_count or os.getenv('AUTO_SHARD') == '1':
+    bot = commands.AutoShardedBot(
+        command_prefix=get_prefix, intents=intents,
+        shard_count=shard_partition.shard_count, shard_ids=shard_partition.shard_ids
+    )
+else:
+    bot = commands.Bot(command_prefix=get_prefix, intents=intents)
+
+# 聊天匯流排：publish 模式持有 WebSocket 連線並廣播給其他行程，subscribe 模式從匯流排接收
+CHAT_BUS_MODE = os.getenv('CHAT_BUS', '')
+CHAT_BUS_PATH = os.getenv('CHAT_BUS_PATH', DEFAULT_BUS_PATH)
+chat_bus_publisher = ChatBusPublisher(CHAT_BUS_PATH) if CHAT_BUS_MODE == 'publish' else None
+multi_process_mode = bool(CHAT_BUS_MODE) or shard_partition.enabled
 
 # 全域變數
 monitored_keywords = {}
+excluded_keywords = {}  # 每個用戶的排除關鍵字，匹配時出現就不通知
+user_filters = {}  # 每個用戶的遊戲頻道範圍與發言者允許／封鎖名單
+watched_players = {}  # 每個用戶關注的玩家，該玩家發言就通知
+price_alerts = {}  # 每個用戶的價格提醒，例如賣拳套 ≤ 5
+spam_filters = {}  # 每個用戶的近似重複抑制設定 {"similarity": 0.9, "minutes": 10}
+cooldown_settings = {}  # 每個用戶的通知冷卻設定 {"default": 秒數, "keywords": {關鍵字: 秒數}, "fold": True}
+digest_settings = {}  # 每個用戶的摘要模式設定 {"minutes": 15}
 user_notification_channels = {}  # 儲存每個用戶的通知頻道
-previous_messages = set()
+channel_webhooks = {}  # 通知頻道的 webhook 網址（WEBHOOK_DELIVERY=1 時使用）
+user_guilds = {}  # 每個用戶的主要伺服器（決定由哪個分片行程負責）
+settings_mtimes = {}  # 多行程模式下設定檔的修改時間
+previous_messages = OrderedDict()  # 已處理訊息的雜湊，依處理順序保存
+MAX_PREVIOUS_MESSAGES = 1000
 notification_channel = None  # 全域通知頻道（備用）
 last_warning_time = None
+slash_commands_synced = False
+settings_loaded = False  # 設定檔只在第一次 on_ready 時載入
+def process_state_path(filename):
+    """多行程部署時在預設檔名加上本行程負責的分片（沒有指定分片時用 PORT），各行程的狀態檔互不覆蓋"""
+    if not multi_process_mode:
+        return filename
+    if shard_partition.shard_ids:
+        tag = "shard" + "-".join(str(shard_id) for shard_id in shard_partition.shard_ids)
+    else:
+        tag = f"port{os.getenv('PORT', 8000)}"
+    base, ext = os.path.splitext(filename)
+    return f"{base}.{tag}{ext}"
+
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH') or process_state_path('state_snapshot.bin')
+SNAPSHOT_INTERVAL = float(os.getenv('SNAPSHOT_INTERVAL', 60))
+snapshot_stats = {"restored_messages": 0, "restored_hashes": 0, "restore_ms": None, "last_saved": None}
+task_supervisor = TaskSupervisor()  # 擁有所有背景任務，on_ready 重複觸發也只會啟動一次
 bot_status = {"status": "停止", "last_update": None, "users_count": 0, "keywords_count": 0}
+keyword_index = None  # 編譯後的關鍵字比對索引
+match_stats = {"excluded": 0, "dropped_by_filters": 0}  # 比對統計（排除關鍵字省下的通知、篩選略過的訊息）
+audience_index = None  # 頻道／發言者篩選索引
+price_alert_index = None  # 依物品與價格排序的價格提醒索引
+keywords_version = 0  # 關鍵字變更時遞增，用來判斷索引是否需要重建
+parallel_matcher = None  # 平行比對模式（PARALLEL_MATCHING=1）時的行程池
+dashboard_events = EventBroadcaster(
+    client_buffer=int(os.getenv('DASHBOARD_CLIENT_BUFFER', 100)),
+    samples_per_interval=int(os.getenv('DASHBOARD_MATCH_SAMPLES', 5)),
+)
+# 聊天歷史全文檢索（HISTORY_ENABLED=0 可關閉）
+history_store = HistoryStore(
+    path=os.getenv('HISTORY_DB', 'chat_history.db'),
+    retention_days=int(os.getenv('HISTORY_RETENTION_DAYS', 7)),
+) if os.getenv('HISTORY_ENABLED', '1') == '1' else None
+# 多行程部署時只由持有 WebSocket 連線的行程（或 ingest.py）寫入歷史，訂閱端只查詢，
+# 否則每則訊息會被每個行程各寫一份
+history_writer = history_store is not None and CHAT_BUS_MODE != 'subscribe'
+market_stats = MarketStats()  # 物品與頻道的滾動市場統計
+near_duplicate_filter = NearDuplicateFilter()  # 依用戶設定抑制近似重複的通知
+notification_throttle = NotificationThrottle(
+    cooldown_settings,
+    default_cooldown=int(os.getenv('NOTIFY_COOLDOWN_SECONDS', 0)),
+    per_minute=int(os.getenv('NOTIFY_MAX_PER_MINUTE', 30)),
+)
+digest_scheduler = DigestScheduler(
+    digest_settings,
+    max_items=int(os.getenv('DIGEST_MAX_ITEMS', 50)),
+    top_n=int(os.getenv('DIGEST_TOP_N', 10)),
+)
+# 持久化的通知佇列：Discord 無法連線時先累積，超過記憶體上限寫入磁碟，重新啟動後補發
+# （目錄由 OUTBOX_DIR 設定，第一次使用時才建立）
+outbox = NotificationOutbox(
+    os.getenv('OUTBOX_DIR', 'outbox'),
+    memory_limit=int(os.getenv('OUTBOX_MEMORY_LIMIT', 1000)),
+)
+NOTIFICATION_FIELDS = ('text', 'full_text', 'username', 'channel', 'timestamp')
+# 頻道通知改用 webhook 發送（需要「管理 Webhook」權限，沒有權限的頻道照常由機器人發送）
+webhook_sender = WebhookSender(
+    pool_size=int(os.getenv('WEBHOOK_POOL_SIZE', 100)),
+) if os.getenv('WEBHOOK_DELIVERY', '0') == '1' else None
+channel_batch_stats = {"posts": 0, "recipients": 0}  # 共用通知頻道合併發送的貼文數與涵蓋的用戶數
+dashboard_page = StaticAsset(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'dashboard.html'),
+    media_type="text/html; charset=utf-8",
+)
 
 class KeywordCatcher:
     def __init__(self):
@@ -55,9 +214,18 @@ class KeywordCatcher:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         self.test_mode = True
-        self.message_counter = 0
-        self.latest_messages = []
+        self.message_buffer = MessageBuffer(int(os.getenv('MESSAGE_BUFFER_SIZE', 1000)))
+        self.monitor_cursor = 0  # 監控任務已處理到的訊息序號
         self.ws_connected = False
+        self.match_queue = asyncio.Queue()  # 平行比對模式下等待批次比對的訊息
+        self.match_batch_size = int(os.getenv('MATCH_BATCH_SIZE', 512))
+        # 測試模式的合成訊息來源（預設約每 5 分鐘一條，與舊版每 10 次抓取一條相近）
+        # 訊息內容依種子重現，時間戳從啟動時間起算
+        self.simulator = ChatSimulator(
+            seed=int(os.getenv('SIM_SEED', 42)),
+            rate=float(os.getenv('SIM_RATE', 1 / 300)),
+            start_time=datetime.now(),
+        )
     
     async def connect_websocket(self):
         """連接到 WebSocket 並監聽訊息"""
@@ -68,28 +236,25 @@ class KeywordCatcher:
                 ssl_context.check_hostname = False
                 ssl_context.verify_mode = ssl.CERT_NONE
                 
-                async with websockets.connect(self.ws_url, ssl=ssl_context) as websocket:
+                async with websockets.connect(
+                    self.ws_url,
+                    ssl=ssl_context if self.ws_url.startswith('wss://') else None,
+                    **websocket_options()
+                ) as websocket:
                     self.ws_connected = True
                     logger.info("✅ WebSocket 連接成功！開始監聽訊息...")
                     
-                    async for message in websocket:
+                    # 批次訊息逐一解碼、逐一處理，不會一次建立整個列表
+                    processed = 0
+                    async for msg in iter_websocket_json(websocket):
                         try:
-                            data = json.loads(message)
-                            logger.info(f"📦 收到原始訊息: {len(data) if isinstance(data, list) else 1} 條")
-                            
-                            if isinstance(data, list):
-                                logger.info(f"📋 處理訊息批次: {len(data)} 條訊息")
-                                for msg in data:
-                                    self.process_message(msg)
-                            else:
-                                logger.info("📋 處理單條訊息")
-                                self.process_message(data)
-                                
-                        except json.JSONDecodeError as e:
-                            logger.error(f"❌ JSON 解析錯誤: {e}")
-                            logger.error(f"原始訊息: {message}")
+                            self.process_message(msg)
                         except Exception as e:
                             logger.error(f"❌ 處理 WebSocket 訊息時發生錯誤: {e}")
+                        processed += 1
+                        if processed % 64 == 0:
+                            # 讓比對任務有機會執行；處理跟不上時接收佇列會滿，由 TCP 背壓讓上游放慢
+                            await asyncio.sleep(0)
                             
             except Exception as e:
                 logger.error(f"❌ WebSocket 連接錯誤: {e}")
@@ -97,6 +262,47 @@ class KeywordCatcher:
                 logger.info("⏳ 5秒後重新連接...")
                 await asyncio.sleep(5)
     
+    async def connect_chat_bus(self):
+        """從本機聊天匯流排接收其他行程轉發的訊息（取代 WebSocket 連線）"""
+        while True:
+            try:
+                logger.info(f"🔌 正在連接聊天匯流排: {CHAT_BUS_PATH}")
+                async for msg in subscribe_chat_bus(CHAT_BUS_PATH):
+                    if not self.ws_connected:
+                        self.ws_connected = True
+                        logger.info("✅ 聊天匯流排連接成功！開始接收訊息...")
+                    self.process_message(msg)
+            except Exception as e:
+                logger.error(f"❌ 聊天匯流排連接錯誤: {e}")
+            self.ws_connected = False
+            await asyncio.sleep(1)
+    
+    def parse_message(self, msg):
+        """把原始訊息轉換成內部使用的訊息格式，空訊息回傳 None"""
+        channel = msg.get('channel', '')
+        username = msg.get('username', '')
+        text = msg.get('text', '')
+        timestamp = msg.get('timestamp', datetime.now().isoformat())
+        
+        if not text:
+            return None
+        
+        channel_display = f"[{str(channel).zfill(4)}]" if channel else ""
+        full_message = f"{channel_display} {username}: {text}"
+        
+        # 只正規化一次，供所有比對使用（匯流排上的紀錄已經由發布端正規化）
+        normalized = msg.get('normalized') or normalize_text(text)
+        return {
+            'text': text,
+            'normalized': normalized,
+            'trades': parse_trades(normalized),  # 結構化的交易紀錄（意圖、物品、屬性、價格）
+            'full_text': full_message,
+            'channel': channel_display,
+            'channel_id': int(channel) if str(channel).isdigit() else None,
+            'username': username,
+            'timestamp': timestamp
+        }
+    
     def process_message(self, msg):
         """處理單條訊息"""
         try:
@@ -104,202 +310,386 @@ class KeywordCatcher:
                 logger.warning(f"收到非字典格式訊息: {type(msg)} - {msg}")
                 return
                 
-            channel = msg.get('channel', '')
-            username = msg.get('username', '')
-            text = msg.get('text', '')
-            timestamp = msg.get('timestamp', datetime.now().isoformat())
+            message_data = self.parse_message(msg)
             
-            if text:
-                channel_display = f"[{str(channel).zfill(4)}]" if channel else ""
-                full_message = f"{channel_display} {username}: {text}"
+            if message_data:
+                # 把原始訊息轉發給其他分片行程
+                if chat_bus_publisher:
+                    chat_bus_publisher.publish(dict(msg, normalized=message_data['normalized']))
                 
-                message_data = {
-                    'text': text,
-                    'full_text': full_message,
-                    'channel': channel_display,
-                    'username': username,
-                    'timestamp': timestamp
-                }
+                full_message = message_data['full_text']
                 
-                # 保留最新的 100 條訊息
-                self.latest_messages.append(message_data)
-                if len(self.latest_messages) > 100:
-                    self.latest_messages.pop(0)
+                # 加入訊息緩衝區（保留最新的 MESSAGE_BUFFER_SIZE 條）
+                self.message_buffer.append(message_data)
+                market_stats.record(message_data)
+                if history_writer:
+                    history_store.add(message_data)
                 
                 # 詳細日誌記錄每條訊息
-                logger.info(f"📨 WebSocket 訊息: {channel_display} {username}: {text}")
+                logger.info(f"📨 WebSocket 訊息: {full_message}")
                 
                 # 如果訊息包含常見關鍵字，特別標記
-                if any(keyword in text.lower() for keyword in ['雪', '楓葉', '收', '賣', '組隊']):
+                if any(keyword in message_data['normalized'] for keyword in ['雪', '楓葉', '收', '賣', '組隊']):
                     logger.info(f"🎯 包含關鍵字的訊息: {full_message}")
                 
-                # 立即檢查用戶關鍵字並發送通知
-                asyncio.create_task(self.check_user_keywords_and_notify(message_data))
+                # 立即檢查用戶關鍵字並發送通知（平行模式下交給批次比對）
+                if parallel_matcher:
+                    self.match_queue.put_nowait(message_data)
+                else:
+                    asyncio.create_task(self.check_user_keywords_and_notify(message_data))
             else:
                 logger.debug(f"收到空訊息: {msg}")
                 
         except Exception as e:
             logger.error(f"處理訊息時發生錯誤: {e}")
     
+    def is_new_message(self, message_text):
+        """檢查訊息是否為新訊息，並記錄到已處理集合"""
+        message_hash = hashlib.md5(message_text.encode()).hexdigest()
+        if message_hash in previous_messages:
+            logger.debug(f"⏭️ 跳過重複訊息: {message_hash[:8]}")
+            return False
+        
+        previous_messages[message_hash] = None
+        
+        # 清理最舊的訊息哈希（集合切片會丟掉任意的雜湊，剛處理過的訊息可能被重新比對）
+        while len(previous_messages) > MAX_PREVIOUS_MESSAGES:
+            previous_messages.popitem(last=False)
+        return True
+    
     async def check_user_keywords_and_notify(self, message_data):
         """檢查用戶關鍵字並發送通知"""
         try:
-            global monitored_keywords, previous_messages
-            
             message_text = message_data['text']
-            message_hash = hashlib.md5(message_text.encode()).hexdigest()
             
             # 詳細調試日誌
             logger.info(f"🔍 檢查訊息: {message_text[:50]}...")
             logger.info(f"📊 當前監控用戶數: {len(monitored_keywords)}")
             
             # 避免重複通知
-            if message_hash in previous_messages:
-                logger.debug(f"⏭️ 跳過重複訊息: {message_hash[:8]}")
+            if not self.is_new_message(message_text):
                 return
             
-            previous_messages.add(message_hash)
-            
-            # 檢查每個用戶的關鍵字
-            notifications_sent = 0
-            for user_id, keywords in monitored_keywords.items():
-                if keywords:
-                    logger.info(f"👤 檢查用戶 {user_id} 的關鍵字: {keywords}")
-                    matched_keywords = self.check_keywords(message_text, keywords)
-                    
-                    if matched_keywords:
-                        logger.info(f"🔔 為用戶 {user_id} 找到匹配關鍵字: {matched_keywords}")
-                        await send_notification(user_id, message_data, matched_keywords)
-                        notifications_sent += 1
-                    else:
-                        logger.debug(f"❌ 用戶 {user_id} 無匹配關鍵字")
-                else:
-                    logger.debug(f"⚠️ 用戶 {user_id} 沒有設定關鍵字")
-            
-            if notifications_sent == 0:
-                logger.info(f"📝 訊息 '{message_text[:30]}...' 沒有匹配任何用戶關鍵字")
-            else:
-                logger.info(f"📤 發送了 {notifications_sent} 個通知")
-            
-            # 清理舊的訊息哈希
-            if len(previous_messages) > 1000:
-                previous_messages = set(list(previous_messages)[-500:])
+            # 先依頻道／發言者篩選，再一次掃描比對所有用戶的關鍵字
+            matches = self.match_message(message_data)
+            await self.notify_matches(message_data, matches)
                 
         except Exception as e:
             logger.error(f"檢查用戶關鍵字時發生錯誤: {e}")
             import traceback
             logger.error(f"詳細錯誤: {traceback.format_exc()}")
     
-    def fetch_messages(self):
-        """獲取最新訊息（用於定時檢查）"""
-        global last_warning_time
+    def route_message(self, message_data):
+        """依頻道與發言者篩選，回傳 (略過的用戶, 關注者)；沒有人需要這條訊息時回傳 None"""
+        audience = get_audience_index()
+        skip_users, watchers = audience.route(message_data.get('channel_id'), message_data.get('username'))
+        if audience.should_drop(skip_users, watchers):
+            match_stats["dropped_by_filters"] += 1
+            return None
+        return skip_users, watchers
+    
+    def needs_scan(self, route):
+        """篩選後是否還有需要比對關鍵字的訂閱者"""
+        return route is not None and len(route[0]) < len(get_audience_index().subscribers)
+    
+    def match_message(self, message_data, pattern_ids=None, route=None):
+        """比對單條訊息，回傳 {user_id: [keyword, ...]}
+
+        pattern_ids 為平行比對模式下工作行程算出的結果。
+        """
+        if route is None:
+            route = self.route_message(message_data)
+            if route is None:
+                return {}
+        skip_users, watchers = route
         
-        # 如果 WebSocket 連接正常，返回最新訊息
-        if self.ws_connected and self.latest_messages:
-            messages = self.latest_messages.copy()
-            self.latest_messages.clear()  # 清空已處理的訊息
-            return messages
+        matches = {}
+        index = get_keyword_index()
+        normalized = message_data.get('normalized') or normalize_text(message_data['text'])
+        if self.needs_scan(route):
+            if pattern_ids is None:
+                pattern_ids = index.match_ids(normalized)
+            matches = index.resolve(pattern_ids, normalized, skip_users)
         
-        # 如果沒有 WebSocket 連接，使用測試模式
-        current_time = datetime.now()
+        extra = {}
+        # 價格提醒直接查詢解析好的交易紀錄，不需要再掃描文字
+        if message_data.get('trades'):
+            alerts = get_price_alert_index()
+            if len(alerts):
+                for user_id, labels in alerts.match(message_data['trades'], skip_users).items():
+                    extra.setdefault(user_id, []).extend(labels)
         
-        if (last_warning_time is None or 
-            current_time - last_warning_time > timedelta(minutes=5)):
-            logger.warning("WebSocket 未連接，使用測試模式")
-            last_warning_time = current_time
+        # 關注玩家的訂閱不需要關鍵字
+        for user_id in watchers:
+            extra.setdefault(user_id, []).append(f"👀 {message_data.get('username')}")
         
-        # 測試模式：每10次抓取生成一個測試訊息
-        self.message_counter += 1
-        if self.message_counter % 10 == 0:
-            test_messages = [
-                "3362頻6洞收拳套攻擊10% 1:5雪/收拉圖斯腰帶談價",
-                "收楓葉 1:100 大量收購",
-                "賣+7武器 屬性優秀 價格面議",
-                "組隊打扎昆 缺坦克和治療",
-                "公會招募 歡迎新手加入"
-            ]
-            
-            import random
-            test_msg = random.choice(test_messages)
-            return [{
-                'text': test_msg,
-                'full_text': f"[測試] TestUser#1234: {test_msg}",
-                'channel': "[測試]",
-                'username': "TestUser#1234",
-                'timestamp': datetime.now().isoformat()
-            }]
+        # 排除關鍵字同樣適用於價格提醒與關注玩家
+        if extra and index.has_exclusions:
+            if pattern_ids is None:
+                pattern_ids = index.match_ids(normalized)
+            for user_id in index.excluded_users(pattern_ids) & extra.keys():
+                del extra[user_id]
+                match_stats["excluded"] += 1
+        for user_id, labels in extra.items():
+            matches.setdefault(user_id, []).extend(labels)
+        return matches
+    
+    async def notify_matches(self, message_data, matches):
+        """依比對結果發送通知"""
+        if matches:
+            dashboard_events.publish_match(message_data, matches)
         
-        return []
+        deliveries = {}
+        for user_id, matched_keywords in matches.items():
+            if near_duplicate_filter.active and near_duplicate_filter.should_suppress(user_id, self.fingerprint(message_data)):
+                logger.info(f"🔁 用戶 {user_id} 最近已收到相似訊息，略過通知")
+                continue
+            if digest_scheduler.add(user_id, message_data, matched_keywords):
+                continue
+            allowed_keywords = notification_throttle.admit(user_id, message_data, matched_keywords)
+            if not allowed_keywords:
+                logger.info(f"⏳ 用戶 {user_id} 的關鍵字 {matched_keywords} 冷卻中或已達每分鐘上限")
+                continue
+            matched_keywords = allowed_keywords
+            logger.info(f"🔔 為用戶 {user_id} 找到匹配關鍵字: {matched_keywords}")
+            deliveries[user_id] = matched_keywords
+        
+        if not deliveries:
+            logger.info(f"📝 訊息 '{message_data['text'][:30]}...' 沒有匹配任何用戶關鍵字")
+        else:
+            enqueue_notifications(message_data, deliveries)
+            # 被冷卻或摘要攔下的訊息不算送出，確定排入通知佇列後才記錄指紋
+            if near_duplicate_filter.active:
+                for user_id in deliveries:
+                    near_duplicate_filter.record(user_id, self.fingerprint(message_data))
+            logger.info(f"📤 發送了 {len(deliveries)} 個通知")
+    
+    def fingerprint(self, message_data):
+        """訊息的 SimHash 指紋，第一次需要時才計算"""
+        if 'simhash' not in message_data:
+            message_data['simhash'] = simhash(message_data.get('normalized') or normalize_text(message_data['text']))
+        return message_data['simhash']
+    
+    async def run_batch_matcher(self):
+        """平行比對模式：把佇列中的訊息分批交給行程池比對"""
+        logger.info(f"🧵 批次比對任務已啟動，批次上限 {self.match_batch_size} 條")
+        while True:
+            batch = [await self.match_queue.get()]
+            # 稍等片刻讓突發流量累積成較大的批次
+            await asyncio.sleep(0.02)
+            while len(batch) < self.match_batch_size and not self.match_queue.empty():
+                batch.append(self.match_queue.get_nowait())
+            
+            try:
+                # 去重複並先做頻道／發言者篩選，沒有人需要的訊息不送進行程池
+                routed = []
+                for message_data in batch:
+                    if self.is_new_message(message_data['text']):
+                        route = self.route_message(message_data)
+                        if route is not None:
+                            routed.append((message_data, route))
+                if not routed:
+                    continue
+                
+                to_scan = [(m, route) for m, route in routed if self.needs_scan(route)]
+                results = {}
+                if to_scan:
+                    pattern_ids = await parallel_matcher.match_batch(
+                        get_keyword_index(), [m['normalized'] for m, _ in to_scan]
+                    )
+                    results = {id(m): ids for (m, _), ids in zip(to_scan, pattern_ids)}
+                
+                for message_data, route in routed:
+                    matches = self.match_message(message_data, results.get(id(message_data)), route)
+                    if matches:
+                        await self.notify_matches(message_data, matches)
+            except Exception as e:
+                logger.error(f"批次比對時發生錯誤: {e}")
     
-    def check_keywords(self, message_text, keywords):
-        message_lower = message_text.lower()
-        matched_keywords = []
+    def fetch_messages(self):
+        """獲取自上次呼叫以來的新訊息（用於定時檢查，只推進監控任務自己的游標）"""
+        global last_warning_time
         
-        for keyword in keywords:
-            if keyword.lower() in message_lower:
-                matched_keywords.append(keyword)
+        # 如果沒有 WebSocket 連接，使用測試模式
+        if not self.ws_connected:
+            current_time = datetime.now()
+            
+            if (last_warning_time is None or 
+                current_time - last_warning_time > timedelta(minutes=5)):
+                logger.warning("WebSocket 未連接，使用測試模式")
+                last_warning_time = current_time
+            
+            # 測試模式：由合成訊息產生器依設定速率提供訊息（合成訊息不計入市場統計）
+            for msg in self.simulator.poll():
+                message_data = self.parse_message(msg)
+                if message_data:
+                    self.message_buffer.append(message_data)
         
-        return matched_keywords
+        messages, self.monitor_cursor, _ = self.message_buffer.since(
+            self.monitor_cursor, limit=self.message_buffer.capacity
+        )
+        return messages
+    
+    def snapshot(self):
+        """把去重複快取、訊息緩衝區與游標編碼成快照"""
+        return encode_snapshot(
+            self.message_buffer.latest_seq,
+            self.monitor_cursor,
+            list(previous_messages),
+            self.message_buffer.recent(self.message_buffer.capacity),
+        )
+    
+    def restore(self, state):
+        """從快照還原（在開始接收訊息之前呼叫）"""
+        messages = []
+        for msg in state['messages']:
+            message_data = self.parse_message(msg)
+            if message_data:
+                message_data['seq'] = msg['seq']
+                messages.append(message_data)
+        self.message_buffer.restore(messages, state['latest_seq'])
+        self.monitor_cursor = max(self.monitor_cursor, state['monitor_cursor'])
+        previous_messages.update(dict.fromkeys(state['dedup_hashes']))
+        return len(messages)
+    
+    def recent_messages(self, limit=10):
+        """讀取最新訊息快照，不影響監控任務"""
+        return self.message_buffer.recent(limit)
 
 keyword_catcher = KeywordCatcher()
 
 # Discord 機器人事件和指令
 @bot.event
 async def on_ready():
-    global bot_status
+    global bot_status, parallel_matcher, slash_commands_synced, settings_loaded
     print(f'{bot.user} 已經上線!')
     logger.info(f'🤖 Bot {bot.user} is ready!')
     
     bot_status["status"] = "運行中"
     bot_status["last_update"] = datetime.now().isoformat()
+    bot_status["ready_count"] = bot_status.get("ready_count", 0) + 1
     
-    load_keywords()
-    load_user_settings()
+    # 閘道重新連線也會觸發 on_ready，以下都必須是冪等的
+    if not settings_loaded:
+        load_keywords()
+        load_exclusions()
+        load_filters()
+        load_price_alerts()
+        load_spam_filters()
+        load_cooldowns()
+        load_digests()
+        load_user_settings()
+        load_webhooks()
+        load_user_guilds()
+        restore_snapshot()
+        settings_loaded = True
+    else:
+        logger.info(f"🔁 閘道重新連線（第 {bot_status['ready_count']} 次 on_ready），背景任務維持不變")
     
-    # 啟動 WebSocket 連接
-    asyncio.create_task(keyword_catcher.connect_websocket())
+    # 啟動 WebSocket 連接（訂閱模式改由聊天匯流排接收）
+    if CHAT_BUS_MODE == 'subscribe':
+        task_supervisor.start('chat_bus', keyword_catcher.connect_chat_bus)
+    else:
+        task_supervisor.start('websocket', keyword_catcher.connect_websocket)
+    
+    if SNAPSHOT_INTERVAL > 0:
+        task_supervisor.start('snapshot', run_snapshots)
+    
+    # 機器人登入後才開始發送通知；沒有設定 DISCORD_TOKEN 或登入失敗時通知留在佇列
+    task_supervisor.start('outbox', run_outbox)
+    
+    # 平行比對模式：比對交給行程池，避免阻塞事件迴圈
+    if os.getenv('PARALLEL_MATCHING') == '1':
+        if parallel_matcher is None:
+            workers = int(os.getenv('MATCH_WORKERS', 0)) or None
+            parallel_matcher = ParallelMatcher(workers=workers)
+        task_supervisor.start('batch_matcher', keyword_catcher.run_batch_matcher)
     
     if not monitor_website.is_running():
         monitor_website.start()
         logger.info("📊 網站監控任務已啟動")
+    
+    # 斜線指令只需要同步一次（重新連線時會再次觸發 on_ready）
+    if not slash_commands_synced and os.getenv('SYNC_SLASH_COMMANDS', '1') == '1':
+        try:
+            synced = await bot.tree.sync()
+            slash_commands_synced = True
+            logger.info(f"⚡ 已同步 {len(synced)} 個斜線指令")
+        except Exception as e:
+            logger.error(f"同步斜線指令時發生錯誤: {e}")
 
 @bot.event
 async def on_message(message):
-    # 記錄所有非機器人訊息
-    if not message.author.bot:
-        logger.info(f"💬 收到訊息: {message.author.name}: {message.content}")
-        
-        # 檢查是否提及機器人且包含指令
-        if bot.user.mentioned_in(message):
-            logger.info(f"📢 收到提及: {message.author.name}: {message.content}")
-            
-            # 提取指令部分（移除 @ 機器人的部分）
-            content = message.content
-            # 移除所有提及（包括用戶和角色）
-            import re
-            content = re.sub(r'<@[!&]?\d+>', '', content).strip()
-            
-            # 檢查是否為指令
-            if content.startswith('!'):
-                logger.info(f"🎯 檢測到提及指令: {content}")
-                # 創建一個新的訊息對象來處理指令
-                message.content = content
+    # 只處理提及機器人的訊息，其他伺服器聊天直接略過
+    if message.author.bot or bot.user not in message.mentions:
+        return
+    
+    logger.info(f"📢 收到提及: {message.author.name}: {message.content}")
     
-    # 處理指令
-    await bot.process_commands(message)
+    # 提取指令部分（移除所有提及，包括用戶和角色）
+    content = MENTION_PATTERN.sub('', message.content).strip()
+    if content.startswith('!'):
+        logger.info(f"🎯 檢測到提及指令: {content}")
+        message.content = content
+        await bot.process_commands(message)
+
+@bot.before_invoke
+async def record_user_guild(ctx):
+    """記錄用戶的主要伺服器：設定通知頻道的伺服器，或第一次使用指令的伺服器"""
+    if ctx.guild is None:
+        return
+    user_id = ctx.author.id
+    if user_guilds.get(user_id) != ctx.guild.id and (ctx.command.name == 'set_channel' or user_id not in user_guilds):
+        user_guilds[user_id] = ctx.guild.id
+        mark_keywords_changed()
+        save_user_guilds(user_id)
 
-@bot.command(name='add_keyword')
+async def autocomplete_user_keywords(interaction, current):
+    """斜線指令自動完成：用戶目前的關鍵字"""
+    current = current.casefold()
+    return [
+        app_commands.Choice(name=keyword[:100], value=keyword[:100])
+        for keyword in monitored_keywords.get(interaction.user.id, [])
+        if current in keyword.casefold()
+    ][:25]
+
+async def autocomplete_trending_items(interaction, current):
+    """斜線指令自動完成：最近一小時的熱門物品"""
+    current = normalize_text(current)
+    return [
+        app_commands.Choice(name=f"{item['item']}（{item['mentions']} 次）"[:100], value=item['item'][:100])
+        for item in market_stats.trending('1h', limit=25)
+        if current in item['item']
+    ]
+
+@bot.hybrid_command(name='add_keyword', description="添加要監控的關鍵字")
+@app_commands.describe(keyword="關鍵字或表達式，例如 拳套 AND 收")
+@app_commands.autocomplete(keyword=autocomplete_trending_items)
 async def add_keyword(ctx, *, keyword):
     logger.info(f"🎯 收到添加關鍵字指令: 用戶={ctx.author.name}({ctx.author.id}), 關鍵字={keyword}")
     user_id = ctx.author.id
     
+    # 表達式型關鍵字在加入前先檢查語法
+    if is_expression(keyword):
+        try:
+            validate_expression(keyword)
+        except ExpressionError as e:
+            embed = discord.Embed(
+                title="❌ 表達式格式錯誤",
+                description=f"**{keyword}**\n{e}",
+                color=discord.Color.red()
+            )
+            await ctx.send(embed=embed)
+            return
+    
     if user_id not in monitored_keywords:
         monitored_keywords[user_id] = []
         logger.info(f"👤 為新用戶 {ctx.author.name} 創建關鍵字列表")
     
     if keyword not in monitored_keywords[user_id]:
         monitored_keywords[user_id].append(keyword)
-        save_keywords()
+        mark_keywords_changed()
+        save_keywords(user_id)
         update_bot_status()
         
         embed = discord.Embed(
@@ -318,13 +708,16 @@ async def add_keyword(ctx, *, keyword):
         await ctx.send(embed=embed)
         logger.info(f"⚠️ 用戶 {ctx.author.name} 嘗試添加已存在的關鍵字: {keyword}")
 
-@bot.command(name='remove_keyword')
+@bot.hybrid_command(name='remove_keyword', description="移除監控的關鍵字")
+@app_commands.describe(keyword="要移除的關鍵字")
+@app_commands.autocomplete(keyword=autocomplete_user_keywords)
 async def remove_keyword(ctx, *, keyword):
     user_id = ctx.author.id
     
     if user_id in monitored_keywords and keyword in monitored_keywords[user_id]:
         monitored_keywords[user_id].remove(keyword)
-        save_keywords()
+        mark_keywords_changed()
+        save_keywords(user_id)
         update_bot_status()
         
         embed = discord.Embed(
@@ -342,7 +735,7 @@ async def remove_keyword(ctx, *, keyword):
         )
         await ctx.send(embed=embed)
 
-@bot.command(name='list_keywords')
+@bot.hybrid_command(name='list_keywords', description="查看您的監控關鍵字與通知設定")
 async def list_keywords(ctx):
     user_id = ctx.author.id
     
@@ -360,16 +753,376 @@ async def list_keywords(ctx):
             color=discord.Color.blue()
         )
     
+    if excluded_keywords.get(user_id):
+        embed.add_field(
+            name="🚫 排除關鍵字",
+            value=", ".join(excluded_keywords[user_id]),
+            inline=False
+        )
+    
+    filters = user_filters.get(user_id, {})
+    if filters.get("channels"):
+        embed.add_field(name="📡 遊戲頻道", value=format_channel_ranges(filters["channels"]), inline=False)
+    if filters.get("allow_speakers"):
+        embed.add_field(name="✅ 只看這些發言者", value=", ".join(filters["allow_speakers"]), inline=False)
+    if filters.get("deny_speakers"):
+        embed.add_field(name="⛔ 封鎖的發言者", value=", ".join(filters["deny_speakers"]), inline=False)
+    if watched_players.get(user_id):
+        embed.add_field(name="👀 關注的玩家", value=", ".join(watched_players[user_id]), inline=False)
+    if cooldown_settings.get(user_id):
+        setting = cooldown_settings[user_id]
+        lines = []
+        if setting.get("default"):
+            lines.append(f"所有關鍵字: {setting['default']} 秒")
+        lines.extend(f"{keyword}: {value} 秒" for keyword, value in setting.get("keywords", {}).items())
+        if lines:
+            lines.append("冷卻期間折疊" if setting.get("fold", True) else "冷卻期間略過")
+            embed.add_field(name="⏳ 通知冷卻", value="\n".join(lines), inline=False)
+    if digest_settings.get(user_id):
+        embed.add_field(name="📬 摘要模式", value=f"每 {digest_settings[user_id]['minutes']} 分鐘一則摘要", inline=False)
+    if spam_filters.get(user_id):
+        setting = spam_filters[user_id]
+        embed.add_field(
+            name="🔁 近似重複抑制",
+            value=f"{setting['similarity']:.0%} / {setting['minutes']} 分鐘"
+                  f"（已略過 {near_duplicate_filter.suppressed.get(user_id, 0)} 則）",
+            inline=False
+        )
+    if price_alerts.get(user_id):
+        embed.add_field(
+            name="💰 價格提醒",
+            value="\n".join(format_price_alert(alert) for alert in price_alerts[user_id]),
+            inline=False
+        )
+    
+    await ctx.send(embed=embed)
+
+def parse_price_alert_args(args):
+    """把「賣 拳套 5」解析成價格提醒，格式錯誤時拋出 ValueError"""
+    parts = args.replace('<=', ' ').replace('>=', ' ').split()
+    if len(parts) < 3 or parts[0] not in PRICE_ALERT_INTENTS:
+        raise ValueError("用法: `!price_alert 賣|收 <物品> <價格>`，例如 `!price_alert 賣 拳套 5`")
+    try:
+        price = float(parts[-1])
+    except ValueError:
+        raise ValueError(f"無法解析的價格: {parts[-1]}")
+    return {"intent": parts[0], "item": " ".join(parts[1:-1]), "price": int(price) if price == int(price) else price}
+
+@bot.command(name='price_alert')
+async def price_alert(ctx, *, args):
+    """價格提醒：有人以門檻以下的價格賣出（或以上的價格收購）時通知"""
+    user_id = ctx.author.id
+    try:
+        alert = parse_price_alert_args(args)
+    except ValueError as e:
+        await ctx.send(embed=discord.Embed(title="❌ 價格提醒格式錯誤", description=str(e), color=discord.Color.red()))
+        return
+    
+    # 同一物品與意圖只保留一個門檻
+    user_alerts = [a for a in price_alerts.get(user_id, [])
+                   if not (a["intent"] == alert["intent"] and a["item"] == alert["item"])]
+    user_alerts.append(alert)
+    price_alerts[user_id] = user_alerts
+    mark_keywords_changed()
+    save_price_alerts(user_id)
+    
+    embed = discord.Embed(
+        title="✅ 價格提醒已設定",
+        description=f"**{format_price_alert(alert)}** 時會通知您",
+        color=discord.Color.green()
+    )
+    await ctx.send(embed=embed)
+    logger.info(f"用戶 {ctx.author.name} 設定價格提醒: {format_price_alert(alert)}")
+
+@bot.command(name='remove_price_alert')
+async def remove_price_alert(ctx, intent, *, item):
+    user_id = ctx.author.id
+    user_alerts = price_alerts.get(user_id, [])
+    remaining = [a for a in user_alerts if not (a["intent"] == intent and a["item"] == item)]
+    
+    if len(remaining) < len(user_alerts):
+        price_alerts[user_id] = remaining
+        mark_keywords_changed()
+        save_price_alerts(user_id)
+        embed = discord.Embed(title="✅ 價格提醒已移除", description=f"已移除 **{intent} {item}** 的價格提醒", color=discord.Color.green())
+        logger.info(f"用戶 {ctx.author.name} 移除價格提醒: {intent} {item}")
+    else:
+        embed = discord.Embed(title="❌ 價格提醒不存在", description=f"您沒有 **{intent} {item}** 的價格提醒", color=discord.Color.red())
+    
     await ctx.send(embed=embed)
 
-@bot.command(name='set_channel')
+@bot.command(name='filter_channels')
+async def filter_channels(ctx, *, ranges):
+    """只接收指定遊戲頻道的通知，例如 1-100,3362；clear 清除"""
+    user_id = ctx.author.id
+    filters = user_filters.setdefault(user_id, {})
+    
+    if ranges.strip().lower() == 'clear':
+        filters.pop("channels", None)
+        description = "已清除遊戲頻道篩選，將接收所有頻道的通知"
+    else:
+        try:
+            filters["channels"] = parse_channel_ranges(ranges)
+        except ValueError as e:
+            await ctx.send(embed=discord.Embed(title="❌ 頻道格式錯誤", description=str(e), color=discord.Color.red()))
+            return
+        description = f"只接收這些遊戲頻道的通知: **{format_channel_ranges(filters['channels'])}**"
+    
+    mark_keywords_changed()
+    save_filters(user_id)
+    await ctx.send(embed=discord.Embed(title="✅ 遊戲頻道篩選已更新", description=description, color=discord.Color.green()))
+    logger.info(f"用戶 {ctx.author.name} 設定遊戲頻道篩選: {ranges}")
+
+@bot.command(name='filter_speakers')
+async def filter_speakers(ctx, action, *, name=None):
+    """發言者篩選：allow <名稱>、deny <名稱>、remove <名稱>、clear"""
+    user_id = ctx.author.id
+    filters = user_filters.setdefault(user_id, {})
+    action = action.lower()
+    
+    if action == 'clear':
+        filters.pop("allow_speakers", None)
+        filters.pop("deny_speakers", None)
+        description = "已清除所有發言者篩選"
+    elif action in ('allow', 'deny', 'remove') and name:
+        for key in ("allow_speakers", "deny_speakers"):
+            if name in filters.get(key, []):
+                filters[key].remove(name)
+        if action == 'allow':
+            filters.setdefault("allow_speakers", []).append(name)
+            description = f"只接收 **{name}** 等允許名單中玩家的通知"
+        elif action == 'deny':
+            filters.setdefault("deny_speakers", []).append(name)
+            description = f"不再接收 **{name}** 的訊息通知"
+        else:
+            description = f"已從發言者篩選中移除 **{name}**"
+    else:
+        await ctx.send(embed=discord.Embed(
+            title="❌ 指令格式錯誤",
+            description="用法: `!filter_speakers allow|deny|remove <玩家名稱>` 或 `!filter_speakers clear`",
+            color=discord.Color.red()
+        ))
+        return
+    
+    mark_keywords_changed()
+    save_filters(user_id)
+    await ctx.send(embed=discord.Embed(title="✅ 發言者篩選已更新", description=description, color=discord.Color.green()))
+    logger.info(f"用戶 {ctx.author.name} 更新發言者篩選: {action} {name or ''}")
+
+@bot.command(name='watch_player')
+async def watch_player(ctx, *, name):
+    """關注玩家，該玩家發言時通知（不需要關鍵字）"""
+    user_id = ctx.author.id
+    players = watched_players.setdefault(user_id, [])
+    
+    if name in players:
+        embed = discord.Embed(title="⚠️ 已經在關注", description=f"您已經在關注 **{name}**", color=discord.Color.orange())
+    else:
+        players.append(name)
+        mark_keywords_changed()
+        save_filters(user_id)
+        embed = discord.Embed(
+            title="✅ 已關注玩家",
+            description=f"**{name}** 在公頻發言時會通知您（可填完整名稱含 #編號，或只填名稱）",
+            color=discord.Color.green()
+        )
+        logger.info(f"用戶 {ctx.author.name} 關注玩家: {name}")
+    
+    await ctx.send(embed=embed)
+
+@bot.command(name='unwatch_player')
+async def unwatch_player(ctx, *, name):
+    user_id = ctx.author.id
+    
+    if name in watched_players.get(user_id, []):
+        watched_players[user_id].remove(name)
+        mark_keywords_changed()
+        save_filters(user_id)
+        embed = discord.Embed(title="✅ 已取消關注", description=f"不再關注 **{name}**", color=discord.Color.green())
+        logger.info(f"用戶 {ctx.author.name} 取消關注玩家: {name}")
+    else:
+        embed = discord.Embed(title="❌ 沒有關注此玩家", description=f"您沒有關注 **{name}**", color=discord.Color.red())
+    
+    await ctx.send(embed=embed)
+
+@bot.command(name='spam_filter')
+async def spam_filter(ctx, similarity='90', minutes: int = 10):
+    """近似重複抑制：最近 minutes 分鐘內收過相似度達 similarity% 的訊息就不再通知；off 關閉"""
+    user_id = ctx.author.id
+    
+    if similarity.lower() == 'off':
+        spam_filters.pop(user_id, None)
+        near_duplicate_filter.remove(user_id)
+        save_spam_filters(user_id)
+        await ctx.send(embed=discord.Embed(title="✅ 已關閉近似重複抑制", color=discord.Color.green()))
+        logger.info(f"用戶 {ctx.author.name} 關閉近似重複抑制")
+        return
+    
+    try:
+        ratio = float(similarity.rstrip('%')) / 100
+        near_duplicate_filter.configure(user_id, ratio, minutes)
+    except ValueError as e:
+        await ctx.send(embed=discord.Embed(
+            title="❌ 設定錯誤",
+            description=f"{e}\n用法: `!spam_filter <相似度%> [分鐘]`，例如 `!spam_filter 90 10`；`!spam_filter off` 關閉",
+            color=discord.Color.red()
+        ))
+        return
+    
+    spam_filters[user_id] = {"similarity": ratio, "minutes": minutes}
+    save_spam_filters(user_id)
+    embed = discord.Embed(
+        title="✅ 近似重複抑制已設定",
+        description=f"與 {minutes} 分鐘內已通知的訊息相似度達 **{ratio:.0%}** 時不再通知"
+                    "（忽略表情、空白、符號與數字差異）",
+        color=discord.Color.green()
+    )
+    await ctx.send(embed=embed)
+    logger.info(f"用戶 {ctx.author.name} 設定近似重複抑制: {ratio:.0%} / {minutes} 分鐘")
+
+@bot.command(name='cooldown')
+async def cooldown(ctx, seconds, *, keyword=None):
+    """通知冷卻：同一個關鍵字通知後 seconds 秒內不再通知；不指定關鍵字時套用到所有關鍵字"""
+    user_id = ctx.author.id
+    
+    if seconds.lower() in ('fold', 'nofold'):
+        cooldown_settings.setdefault(user_id, {})["fold"] = seconds.lower() == 'fold'
+        save_cooldowns(user_id)
+        description = ("冷卻期間的匹配會在冷卻結束時合併成一則通知" if seconds.lower() == 'fold'
+                       else "冷卻期間的匹配會直接略過")
+        await ctx.send(embed=discord.Embed(title="✅ 冷卻折疊已更新", description=description, color=discord.Color.green()))
+        return
+    
+    try:
+        value = 0 if seconds.lower() == 'off' else int(seconds)
+        if value < 0:
+            raise ValueError
+    except ValueError:
+        await ctx.send(embed=discord.Embed(
+            title="❌ 指令格式錯誤",
+            description="用法: `!cooldown <秒數|off> [關鍵字]`，或 `!cooldown fold|nofold` 設定冷卻期間是否折疊",
+            color=discord.Color.red()
+        ))
+        return
+    
+    setting = cooldown_settings.setdefault(user_id, {})
+    if keyword:
+        if value:
+            setting.setdefault("keywords", {})[keyword] = value
+        else:
+            setting.get("keywords", {}).pop(keyword, None)
+        target = f"關鍵字 **{keyword}**"
+    else:
+        if value:
+            setting["default"] = value
+        else:
+            setting.pop("default", None)
+        target = "所有關鍵字"
+    save_cooldowns(user_id)
+    
+    description = f"{target}通知後 **{value}** 秒內不再通知" if value else f"已取消{target}的冷卻"
+    await ctx.send(embed=discord.Embed(title="✅ 通知冷卻已更新", description=description, color=discord.Color.green()))
+    logger.info(f"用戶 {ctx.author.name} 設定通知冷卻: {keyword or '全部'} {value} 秒")
+
+@bot.command(name='digest')
+async def digest(ctx, minutes):
+    """摘要模式：匹配不即時通知，改為每 minutes 分鐘收到一則摘要；off 恢復即時通知"""
+    user_id = ctx.author.id
+    
+    if minutes.lower() == 'off':
+        digest_settings.pop(user_id, None)
+        save_digests(user_id)
+        pending = digest_scheduler.take(user_id)
+        if pending:
+            enqueue_digest(user_id, pending)
+        await ctx.send(embed=discord.Embed(
+            title="✅ 已關閉摘要模式",
+            description="之後的匹配會即時通知" + ("，尚未送出的摘要會立即送出" if pending else ""),
+            color=discord.Color.green()
+        ))
+        logger.info(f"用戶 {ctx.author.name} 關閉摘要模式")
+        return
+    
+    try:
+        value = int(minutes)
+        if not MIN_DIGEST_MINUTES <= value <= MAX_DIGEST_MINUTES:
+            raise ValueError
+    except ValueError:
+        await ctx.send(embed=discord.Embed(
+            title="❌ 指令格式錯誤",
+            description=f"用法: `!digest <分鐘|off>`，分鐘數需介於 {MIN_DIGEST_MINUTES} 到 {MAX_DIGEST_MINUTES}",
+            color=discord.Color.red()
+        ))
+        return
+    
+    digest_settings[user_id] = {"minutes": value}
+    save_digests(user_id)
+    await ctx.send(embed=discord.Embed(
+        title="✅ 已開啟摘要模式",
+        description=f"匹配不再即時通知，改為每 **{value}** 分鐘收到一則摘要",
+        color=discord.Color.green()
+    ))
+    logger.info(f"用戶 {ctx.author.name} 開啟摘要模式: 每 {value} 分鐘")
+
+@bot.command(name='add_exclusion')
+async def add_exclusion(ctx, *, keyword):
+    user_id = ctx.author.id
+    user_exclusions = excluded_keywords.setdefault(user_id, [])
+    
+    if keyword not in user_exclusions:
+        user_exclusions.append(keyword)
+        mark_keywords_changed()
+        save_exclusions(user_id)
+        
+        embed = discord.Embed(
+            title="✅ 排除關鍵字已添加",
+            description=f"訊息包含 **{keyword}** 時將不會通知您",
+            color=discord.Color.green()
+        )
+        logger.info(f"用戶 {ctx.author.name} 添加排除關鍵字: {keyword}")
+    else:
+        embed = discord.Embed(
+            title="⚠️ 排除關鍵字已存在",
+            description=f"**{keyword}** 已經在排除列表中",
+            color=discord.Color.orange()
+        )
+    
+    await ctx.send(embed=embed)
+
+@bot.command(name='remove_exclusion')
+async def remove_exclusion(ctx, *, keyword):
+    user_id = ctx.author.id
+    
+    if keyword in excluded_keywords.get(user_id, []):
+        excluded_keywords[user_id].remove(keyword)
+        mark_keywords_changed()
+        save_exclusions(user_id)
+        
+        embed = discord.Embed(
+            title="✅ 排除關鍵字已移除",
+            description=f"已移除排除關鍵字: **{keyword}**",
+            color=discord.Color.green()
+        )
+        logger.info(f"用戶 {ctx.author.name} 移除排除關鍵字: {keyword}")
+    else:
+        embed = discord.Embed(
+            title="❌ 排除關鍵字不存在",
+            description=f"**{keyword}** 不在您的排除列表中",
+            color=discord.Color.red()
+        )
+    
+    await ctx.send(embed=embed)
+
+@bot.hybrid_command(name='set_channel', description="把目前的頻道設為您的通知頻道")
 async def set_notification_channel(ctx):
     global user_notification_channels
     user_id = ctx.author.id
     user_notification_channels[user_id] = ctx.channel.id
     
     # 同時儲存到文件
-    save_user_settings()
+    save_user_settings(user_id)
+    if webhook_sender:
+        await ensure_channel_webhook(ctx.channel)
     
     embed = discord.Embed(
         title="✅ 個人通知頻道已設定",
@@ -379,7 +1132,7 @@ async def set_notification_channel(ctx):
     await ctx.send(embed=embed)
     logger.info(f"用戶 {ctx.author.name} 設定通知頻道為: {ctx.channel.name}")
 
-@bot.command(name='channel_info')
+@bot.hybrid_command(name='channel_info', description="查看您的通知頻道設定")
 async def channel_info(ctx):
     user_id = ctx.author.id
     
@@ -410,7 +1163,7 @@ async def channel_info(ctx):
 async def test_fetch(ctx):
     await ctx.send("🔍 正在測試抓取網站內容...")
     
-    messages = keyword_catcher.fetch_messages()
+    messages = keyword_catcher.recent_messages(10)
     
     if messages:
         embed = discord.Embed(
@@ -434,7 +1187,7 @@ async def test_fetch(ctx):
     
     await ctx.send(embed=embed)
 
-@bot.command(name='debug_status')
+@bot.hybrid_command(name='debug_status', description="顯示機器人的詳細狀態")
 async def debug_status(ctx):
     """顯示機器人的詳細狀態信息"""
     embed = discord.Embed(
@@ -465,10 +1218,55 @@ async def debug_status(ctx):
         inline=True
     )
     
+    # 排除關鍵字省下的通知數
+    embed.add_field(
+        name="排除省下的通知",
+        value=str(match_stats["excluded"]),
+        inline=True
+    )
+    
+    # 篩選略過的訊息數
+    embed.add_field(
+        name="篩選略過的訊息",
+        value=str(match_stats["dropped_by_filters"]),
+        inline=True
+    )
+    
+    # 背景任務
+    embed.add_field(
+        name="背景任務",
+        value="\n".join(
+            f"{'🟢' if info['running'] else '🔴'} {name}" + (f"（重啟 {info['restarts']} 次）" if info['restarts'] else "")
+            for name, info in task_supervisor.status().items()
+        ) or "無",
+        inline=False
+    )
+    
+    # 冷卻與每分鐘上限擋下的通知數
+    embed.add_field(
+        name="冷卻／上限略過的通知",
+        value=f"{notification_throttle.stats['cooled_down']} / {notification_throttle.stats['capped']}",
+        inline=True
+    )
+    
+    # 通知佇列
+    embed.add_field(
+        name="通知佇列",
+        value=f"待送 {len(outbox)} 則（磁碟 {outbox.pending_disk}），已送 {outbox.stats['delivered']}、無法送達 {outbox.stats['failed']}",
+        inline=False
+    )
+    
+    # 近似重複抑制略過的通知數
+    embed.add_field(
+        name="近似重複略過的通知",
+        value=str(near_duplicate_filter.stats["suppressed"]),
+        inline=True
+    )
+    
     # 最新訊息數
     embed.add_field(
         name="緩存訊息數",
-        value=str(len(keyword_catcher.latest_messages)),
+        value=str(len(keyword_catcher.message_buffer)),
         inline=True
     )
     
@@ -515,8 +1313,8 @@ async def test_notify(ctx):
         await ctx.send(embed=embed)
         return
     
-    # 獲取訊息並檢查關鍵字
-    messages = keyword_catcher.fetch_messages()
+    # 讀取最新訊息快照並檢查關鍵字（不影響監控任務）
+    messages = keyword_catcher.recent_messages(keyword_catcher.message_buffer.capacity)[::-1]
     
     if not messages:
         # 如果沒有真實訊息，創建測試訊息
@@ -530,10 +1328,16 @@ async def test_notify(ctx):
         }
         messages = [test_message]
     
+    # 只包含此用戶的索引，與即時比對的規則（表達式、排除關鍵字）一致
+    user_index = SubscriptionIndex(
+        {user_id: monitored_keywords[user_id]},
+        exclusions={user_id: excluded_keywords.get(user_id, [])}
+    )
+    
     notification_sent = False
     for message in messages:
         message_text = message['text']
-        matched_keywords = keyword_catcher.check_keywords(message_text, monitored_keywords[user_id])
+        matched_keywords = user_index.match(message_text, message.get('normalized')).get(user_id)
         
         if matched_keywords:
             await send_notification(user_id, message, matched_keywords)
@@ -571,6 +1375,123 @@ async def test_notify(ctx):
             )
         await ctx.send(embed=embed)
 
+@bot.command(name='search')
+async def search_history(ctx, *, query):
+    """搜尋聊天歷史"""
+    if not history_store:
+        await ctx.send(embed=discord.Embed(
+            title="⚠️ 歷史搜尋未啟用",
+            description="請設定 HISTORY_ENABLED=1 後重新啟動機器人",
+            color=discord.Color.orange()
+        ))
+        return
+    
+    results = await asyncio.to_thread(history_store.search, query, None, 10)
+    if not results:
+        embed = discord.Embed(
+            title="🔎 搜尋結果",
+            description=f"找不到包含 **{query}** 的訊息",
+            color=discord.Color.blue()
+        )
+    else:
+        lines = []
+        for result in results:
+            time_display = datetime.fromtimestamp(result['ts']).strftime('%m/%d %H:%M')
+            text = result['text'][:80] + "..." if len(result['text']) > 80 else result['text']
+            lines.append(f"`{time_display}` {result['channel']} **{result['username']}**: {text}")
+        embed = discord.Embed(
+            title=f"🔎 搜尋結果: {query}",
+            description="\n".join(lines)[:4000],
+            color=discord.Color.blue()
+        )
+        embed.set_footer(text=f"顯示最新 {len(results)} 條，保留最近 {history_store.retention_days} 天")
+    
+    await ctx.send(embed=embed)
+    logger.info(f"用戶 {ctx.author.name} 搜尋歷史: {query}")
+
+@bot.command(name='trending')
+async def trending(ctx, window='1h'):
+    """顯示最近熱門的交易物品"""
+    if window not in MARKET_WINDOWS:
+        await ctx.send(embed=discord.Embed(
+            title="❌ 不支援的時間範圍",
+            description=f"可用的時間範圍: {', '.join(MARKET_WINDOWS)}",
+            color=discord.Color.red()
+        ))
+        return
+    
+    snapshot = market_stats.snapshot(window, limit=10)
+    if not snapshot['items']:
+        embed = discord.Embed(
+            title=f"📈 熱門物品（{window}）",
+            description="這段時間還沒有交易訊息",
+            color=discord.Color.blue()
+        )
+    else:
+        lines = []
+        for rank, item in enumerate(snapshot['items'], 1):
+            line = f"**{rank}. {item['item']}** — {item['mentions']} 次（收 {item['buy']} / 賣 {item['sell']}）"
+            if item['avg_sell_price'] is not None:
+                line += f" 賣均價 {item['avg_sell_price']}"
+            if item['avg_buy_price'] is not None:
+                line += f" 收均價 {item['avg_buy_price']}"
+            lines.append(line)
+        embed = discord.Embed(
+            title=f"📈 熱門物品（{window}）",
+            description="\n".join(lines),
+            color=discord.Color.blue()
+        )
+        if snapshot['channels']:
+            embed.add_field(
+                name="最熱鬧的頻道",
+                value=", ".join(f"{str(c['channel']).zfill(4)} ({c['messages']})" for c in snapshot['channels'][:5]),
+                inline=False
+            )
+    embed.set_footer(text=f"共 {snapshot['messages']} 條訊息、{snapshot['trades']} 筆交易")
+    await ctx.send(embed=embed)
+
+@bot.command(name='preview_keyword')
+async def preview_keyword_command(ctx, *, keyword):
+    """用聊天歷史回測關鍵字的命中頻率"""
+    if not history_store:
+        await ctx.send(embed=discord.Embed(
+            title="⚠️ 歷史搜尋未啟用",
+            description="請設定 HISTORY_ENABLED=1 後重新啟動機器人",
+            color=discord.Color.orange()
+        ))
+        return
+    
+    hours = float(os.getenv('PREVIEW_HOURS', 24))
+    try:
+        result = await asyncio.to_thread(preview_keyword, history_store, keyword, hours)
+    except ExpressionError as e:
+        await ctx.send(embed=discord.Embed(
+            title="❌ 表達式格式錯誤",
+            description=f"**{keyword}**\n{e}",
+            color=discord.Color.red()
+        ))
+        return
+    # 每小時命中太多次的關鍵字以橘色提醒
+    noisy = result['hits_per_hour'] >= 30
+    embed = discord.Embed(
+        title=f"🧪 關鍵字回測: {keyword}",
+        description=f"最近 {result['covered_hours']} 小時共檢查 {result['scanned']} 條訊息",
+        color=discord.Color.orange() if noisy else discord.Color.green()
+    )
+    embed.add_field(name="命中次數", value=str(result['hits']), inline=True)
+    embed.add_field(name="每小時命中", value=str(result['hits_per_hour']), inline=True)
+    if result['samples']:
+        embed.add_field(
+            name="範例訊息",
+            value="\n".join(f"{m['channel']} {m['username']}: {m['text'][:80]}" for m in result['samples'])[:1024],
+            inline=False
+        )
+    if noisy:
+        embed.set_footer(text="這個關鍵字很常出現，訂閱後可能會收到大量通知")
+    
+    await ctx.send(embed=embed)
+    logger.info(f"用戶 {ctx.author.name} 回測關鍵字: {keyword} ({result['hits']} 次)")
+
 @bot.command(name='toggle_test_mode')
 async def toggle_test_mode(ctx):
     keyword_catcher.test_mode = not keyword_catcher.test_mode
@@ -596,7 +1517,22 @@ async def help_command(ctx):
         name="📝 關鍵字管理",
         value="`@機器人 !add_keyword <關鍵字>` - 添加監控關鍵字\n"
               "`@機器人 !remove_keyword <關鍵字>` - 移除監控關鍵字\n"
-              "`@機器人 !list_keywords` - 查看您的關鍵字列表",
+              "`@機器人 !list_keywords` - 查看您的關鍵字列表\n"
+              "`@機器人 !add_exclusion <關鍵字>` - 訊息包含此關鍵字時不通知\n"
+              "`@機器人 !remove_exclusion <關鍵字>` - 移除排除關鍵字\n"
+              "`@機器人 !watch_player <玩家>` / `!unwatch_player <玩家>` - 關注玩家發言\n"
+              "`@機器人 !price_alert 賣|收 <物品> <價格>` - 價格提醒（`!remove_price_alert` 移除）\n"
+              "`@機器人 !spam_filter <相似度%> [分鐘]` - 抑制近似重複的通知（off 關閉）\n"
+              "`@機器人 !cooldown <秒數|off> [關鍵字]` - 通知冷卻（`!cooldown fold|nofold` 折疊設定）\n"
+              "`@機器人 !digest <分鐘|off>` - 摘要模式，定時收到一則匹配摘要\n"
+              "`@機器人 !preview_keyword <關鍵字>` - 用歷史訊息回測關鍵字命中頻率",
+        inline=False
+    )
+    
+    embed.add_field(
+        name="🧮 進階關鍵字",
+        value="支援 `AND` / `OR` / `NOT`、括號、`\"片語\"` 與 `/正規表示式/`\n"
+              "例如 `@機器人 !add_keyword 拳套 AND (收 OR 買) NOT 賣`",
         inline=False
     )
     
@@ -604,6 +1540,10 @@ async def help_command(ctx):
         name="⚙️ 設定",
         value="`@機器人 !set_channel` - 設定個人通知頻道\n"
               "`@機器人 !channel_info` - 查看通知頻道設定\n"
+              "`@機器人 !search <關鍵字>` - 搜尋聊天歷史\n"
+              "`@機器人 !trending [1m|1h|24h]` - 熱門交易物品\n"
+              "`@機器人 !filter_channels <1-100,3362|clear>` - 只接收指定遊戲頻道\n"
+              "`@機器人 !filter_speakers allow|deny|remove <玩家>` - 發言者篩選\n"
               "`@機器人 !commands` - 顯示此說明訊息",
         inline=False
     )
@@ -619,7 +1559,7 @@ async def help_command(ctx):
     
     embed.add_field(
         name="📋 使用說明",
-        value="• **必須先 @ 機器人才能使用指令**\n"
+        value="• **必須先 @ 機器人才能使用指令**，或使用 `/add_keyword` 等斜線指令\n"
               "• 機器人會監控 pal.tw 網站的聊天訊息\n"
               "• 當出現您設定的關鍵字時會自動通知\n"
               "• 通知優先發送私訊，如設定頻道則備援發送\n"
@@ -640,107 +1580,126 @@ async def help_command(ctx):
 
 @tasks.loop(seconds=30)
 async def monitor_website():
-    global previous_messages, notification_channel, bot_status
+    global notification_channel, bot_status
     
     try:
+        if multi_process_mode:
+            reload_settings_if_changed()
+        
         messages = keyword_catcher.fetch_messages()
         bot_status["last_update"] = datetime.now().isoformat()
         
         for message in messages:
-            message_text = message['text']
-            message_hash = hashlib.md5(message_text.encode()).hexdigest()
-            
-            if message_hash in previous_messages:
+            if not keyword_catcher.is_new_message(message['text']):
                 continue
             
-            previous_messages.add(message_hash)
-            
-            for user_id, keywords in monitored_keywords.items():
-                if keywords:
-                    matched_keywords = keyword_catcher.check_keywords(message_text, keywords)
-                    
-                    if matched_keywords:
-                        await send_notification(user_id, message, matched_keywords)
-        
-        if len(previous_messages) > 1000:
-            previous_messages = set(list(previous_messages)[-500:])
+            # 與即時路徑相同：經過近似重複抑制、摘要模式與冷卻限制
+            matches = keyword_catcher.match_message(message)
+            if matches:
+                await keyword_catcher.notify_matches(message, matches)
     
     except Exception as e:
         logger.error(f"監控任務發生錯誤: {e}")
         bot_status["status"] = f"錯誤: {e}"
 
-async def send_notification(user_id, message_data, matched_keywords):
+def is_transient_error(error):
+    """Discord 伺服器錯誤、限速與網路錯誤稍後重試即可能成功"""
+    if isinstance(error, discord.HTTPException):
+        return error.status == 429 or error.status >= 500
+    if isinstance(error, WebhookError):
+        return error.transient
+    return isinstance(error, (aiohttp.ClientError, discord.GatewayNotFound, asyncio.TimeoutError, OSError))
+
+def build_notification_embed(message_data, keywords_value, folded=0):
+    """建立通知的 embed；keywords_value 是「匹配的關鍵字」欄位的內容"""
+    # 處理訊息數據格式
+    if isinstance(message_data, dict):
+        message_text = message_data.get('text', '')
+        full_text = message_data.get('full_text', message_text)
+        username = message_data.get('username', '未知用戶')
+        channel = message_data.get('channel', '')
+    else:
+        message_text = str(message_data)
+        full_text = message_text
+        username = '未知用戶'
+        channel = ''
+    
+    embed = discord.Embed(
+        title="🎯 關鍵字匹配通知",
+        description=f"在 [pal.tw](https://pal.tw/) 發現匹配的訊息!",
+        color=discord.Color.gold(),
+        timestamp=datetime.now()
+    )
+    
+    embed.add_field(
+        name="匹配的關鍵字",
+        value=keywords_value,
+        inline=False
+    )
+    
+    if username and username != '未知用戶':
+        embed.add_field(
+            name="發言者",
+            value=f"`{username}`",
+            inline=True
+        )
+    
+    if channel:
+        embed.add_field(
+            name="頻道",
+            value=f"`{channel}`",
+            inline=True
+        )
+    
+    embed.add_field(
+        name="訊息內容",
+        value=f"```{message_text[:800]}```" + ("..." if len(message_text) > 800 else ""),
+        inline=False
+    )
+    
+    if folded:
+        embed.add_field(
+            name="🗂️ 冷卻期間的匹配",
+            value=f"冷卻期間共有 {folded} 則匹配，以上為最新一則",
+            inline=False
+        )
+    
+    embed.set_footer(text="MapleStory Worlds Artale 公頻監控")
+    return embed
+
+async def send_notification(user_id, message_data, matched_keywords, folded=0, embed=None):
+    """發送通知，送達時回傳 True、無法送達（找不到用戶或沒有可用頻道）時回傳 False；
+    Discord 暫時無法使用時拋出例外，由通知佇列稍後重試。指定 embed 時（例如摘要）直接發送"""
     try:
         logger.info(f"🚀 開始發送通知: 用戶={user_id}, 關鍵字={matched_keywords}")
         
         user = bot.get_user(user_id)
         if not user:
-            logger.error(f"❌ 找不到用戶: {user_id}")
-            return
+            try:
+                user = await bot.fetch_user(user_id)
+            except discord.NotFound:
+                logger.error(f"❌ 找不到用戶: {user_id}")
+                return False
             
         logger.info(f"👤 找到用戶: {user.name}#{user.discriminator}")
         
-        # 處理訊息數據格式
-        if isinstance(message_data, dict):
-            message_text = message_data.get('text', '')
-            full_text = message_data.get('full_text', message_text)
-            username = message_data.get('username', '未知用戶')
-            channel = message_data.get('channel', '')
-        else:
-            message_text = str(message_data)
-            full_text = message_text
-            username = '未知用戶'
-            channel = ''
-        
-        logger.info(f"📝 訊息內容: {message_text[:50]}...")
-        
-        embed = discord.Embed(
-            title="🎯 關鍵字匹配通知",
-            description=f"在 [pal.tw](https://pal.tw/) 發現匹配的訊息!",
-            color=discord.Color.gold(),
-            timestamp=datetime.now()
-        )
-        
-        embed.add_field(
-            name="匹配的關鍵字",
-            value=", ".join([f"**{kw}**" for kw in matched_keywords]),
-            inline=False
-        )
-        
-        if username and username != '未知用戶':
-            embed.add_field(
-                name="發言者",
-                value=f"`{username}`",
-                inline=True
-            )
-        
-        if channel:
-            embed.add_field(
-                name="頻道",
-                value=f"`{channel}`",
-                inline=True
+        if embed is None:
+            embed = build_notification_embed(
+                message_data, ", ".join([f"**{kw}**" for kw in matched_keywords]), folded
             )
         
-        embed.add_field(
-            name="訊息內容",
-            value=f"```{message_text[:800]}```" + ("..." if len(message_text) > 800 else ""),
-            inline=False
-        )
-        
-        embed.set_footer(text="MapleStory Worlds Artale 公頻監控")
-        
         # 優先發送到用戶設定的通知頻道
         if user_id in user_notification_channels and user_notification_channels[user_id]:
             try:
                 logger.info(f"🎯 嘗試發送到用戶設定的頻道: {user_notification_channels[user_id]}")
-                channel_obj = bot.get_channel(user_notification_channels[user_id])
-                if channel_obj:
-                    await channel_obj.send(f"{user.mention}", embed=embed)
+                if await post_to_channel(user_notification_channels[user_id], user.mention, embed, [user_id]):
                     logger.info(f"✅ 已發送通知到用戶 {user.name} 的設定頻道: {matched_keywords}")
-                    return
+                    return True
                 else:
                     logger.warning(f"⚠️ 找不到頻道: {user_notification_channels[user_id]}")
             except Exception as e:
+                if is_transient_error(e):
+                    raise
                 logger.error(f"❌ 發送到用戶設定頻道失敗: {e}")
         
         # 如果沒有設定個人頻道，嘗試發送私訊
@@ -748,41 +1707,175 @@ async def send_notification(user_id, message_data, matched_keywords):
             logger.info(f"💬 嘗試發送私訊給用戶 {user.name}")
             await user.send(embed=embed)
             logger.info(f"✅ 已發送私訊通知給用戶 {user.name}: {matched_keywords}")
+            return True
         except discord.Forbidden:
             logger.warning(f"⚠️ 私訊被拒絕，嘗試發送到全域頻道")
             # 私訊失敗，發送到全域通知頻道
             if notification_channel:
                 await notification_channel.send(f"{user.mention}", embed=embed)
                 logger.info(f"✅ 已發送通知到全域頻道: {matched_keywords}")
-            else:
-                logger.warning(f"❌ 無法發送通知給用戶 {user.name}，請設定通知頻道")
+                return True
+            logger.warning(f"❌ 無法發送通知給用戶 {user.name}，請設定通知頻道")
+            return False
         except Exception as e:
+            if is_transient_error(e):
+                raise
             logger.error(f"❌ 發送私訊時發生錯誤: {e}")
             # 嘗試發送到全域頻道作為備援
             if notification_channel:
-                try:
-                    await notification_channel.send(f"{user.mention}", embed=embed)
-                    logger.info(f"✅ 已發送通知到全域頻道（備援）: {matched_keywords}")
-                except Exception as e2:
-                    logger.error(f"❌ 發送到全域頻道也失敗: {e2}")
+                await notification_channel.send(f"{user.mention}", embed=embed)
+                logger.info(f"✅ 已發送通知到全域頻道（備援）: {matched_keywords}")
+                return True
+            return False
     
     except Exception as e:
+        if is_transient_error(e):
+            raise
         logger.error(f"發送通知時發生錯誤: {e}")
+        return False
 
-def save_keywords():
+def build_digest_embed(digest):
+    """建立摘要通知的 embed"""
+    embed = discord.Embed(
+        title="📬 關鍵字匹配摘要",
+        description=f"過去 {digest['minutes']} 分鐘在 [pal.tw](https://pal.tw/) 共有 **{digest['total']}** 則匹配的訊息",
+        color=discord.Color.gold(),
+        timestamp=datetime.now()
+    )
+    embed.add_field(
+        name="匹配的關鍵字",
+        value="\n".join(f"**{keyword}** × {count}" for keyword, count in digest["keywords"][:10])[:1024],
+        inline=False
+    )
+    for item in digest["items"]:
+        channel = f"[{item['channel']}] " if item.get('channel') else ""
+        embed.add_field(
+            name=f"{channel}{item.get('username', '未知用戶')}"[:256],
+            value=f"```{item.get('text', '')[:200]}```",
+            inline=False
+        )
+    shown = len(digest["items"])
+    if digest["total"] > shown:
+        embed.set_footer(text=f"MapleStory Worlds Artale 公頻監控｜只列出 {shown} 則")
+    else:
+        embed.set_footer(text="MapleStory Worlds Artale 公頻監控")
+    return embed
+
+async def send_digest(user_id, digest):
+    keywords = [keyword for keyword, _ in digest["keywords"]]
+    return await send_notification(user_id, None, keywords, embed=build_digest_embed(digest))
+
+def merge_user_entry(on_disk, data, user_id):
+    """以記憶體中 user_id 的設定覆蓋檔案中的同一筆，其他用戶保持檔案內容"""
+    merged = {int(k): v for k, v in on_disk.items()}
+    if user_id in data:
+        merged[user_id] = data[user_id]
+    else:
+        merged.pop(user_id, None)
+    return merged
+
+@contextmanager
+def settings_file_lock(path):
+    """多行程模式下，讀取、合併到寫入設定檔之間持有檔案鎖，避免其他行程同時寫入"""
+    if not multi_process_mode or fcntl is None:
+        yield
+        return
+    with open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def write_user_data(path, data, user_id=None, sections=None):
+    """寫出 {user_id: 設定} 格式的檔案
+
+    多行程模式下各行程共用同一批檔案，只更新這次變更的用戶，
+    避免覆蓋其他行程寫入的設定。
+    """
+    with settings_file_lock(path):
+        if user_id is not None and multi_process_mode and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                on_disk = json.load(f)
+            if sections:
+                data = {section: merge_user_entry(on_disk.get(section, {}), data[section], user_id) for section in sections}
+            else:
+                data = merge_user_entry(on_disk, data, user_id)
+        # 暫存檔名不重複，同時寫入的行程不會寫進同一個暫存檔
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.', suffix='.tmp'
+        )
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+def save_user_guilds(user_id=None):
     try:
-        with open('keywords.json', 'w', encoding='utf-8') as f:
-            json.dump(monitored_keywords, f, ensure_ascii=False, indent=2)
+        write_user_data('user_guilds.json', user_guilds, user_id)
+    except Exception as e:
+        logger.error(f"儲存用戶主要伺服器時發生錯誤: {e}")
+
+def save_keywords(user_id=None):
+    try:
+        write_user_data('keywords.json', monitored_keywords, user_id)
     except Exception as e:
         logger.error(f"儲存關鍵字時發生錯誤: {e}")
 
-def save_user_settings():
+def save_exclusions(user_id=None):
     try:
-        with open('user_settings.json', 'w', encoding='utf-8') as f:
-            json.dump(user_notification_channels, f, ensure_ascii=False, indent=2)
+        write_user_data('exclusions.json', excluded_keywords, user_id)
+    except Exception as e:
+        logger.error(f"儲存排除關鍵字時發生錯誤: {e}")
+
+def save_filters(user_id=None):
+    try:
+        write_user_data(
+            'filters.json', {"filters": user_filters, "watched_players": watched_players}, user_id,
+            sections=("filters", "watched_players")
+        )
+    except Exception as e:
+        logger.error(f"儲存篩選設定時發生錯誤: {e}")
+
+def save_price_alerts(user_id=None):
+    try:
+        write_user_data('price_alerts.json', price_alerts, user_id)
+    except Exception as e:
+        logger.error(f"儲存價格提醒時發生錯誤: {e}")
+
+def save_spam_filters(user_id=None):
+    try:
+        write_user_data('spam_filters.json', spam_filters, user_id)
+    except Exception as e:
+        logger.error(f"儲存近似重複抑制設定時發生錯誤: {e}")
+
+def save_cooldowns(user_id=None):
+    try:
+        write_user_data('cooldowns.json', cooldown_settings, user_id)
+    except Exception as e:
+        logger.error(f"儲存通知冷卻設定時發生錯誤: {e}")
+
+def save_digests(user_id=None):
+    try:
+        write_user_data('digests.json', digest_settings, user_id)
+    except Exception as e:
+        logger.error(f"儲存摘要模式設定時發生錯誤: {e}")
+
+def save_user_settings(user_id=None):
+    try:
+        write_user_data('user_settings.json', user_notification_channels, user_id)
     except Exception as e:
         logger.error(f"儲存用戶設定時發生錯誤: {e}")
 
+def save_webhooks(channel_id=None):
+    try:
+        write_user_data('webhooks.json', channel_webhooks, channel_id)
+    except Exception as e:
+        logger.error(f"儲存 webhook 設定時發生錯誤: {e}")
+
 def load_keywords():
     global monitored_keywords
     try:
@@ -791,10 +1884,98 @@ def load_keywords():
                 loaded_data = json.load(f)
                 monitored_keywords = {int(k): v for k, v in loaded_data.items()}
                 logger.info(f"已載入 {len(monitored_keywords)} 個用戶的關鍵字")
+        mark_keywords_changed()
         update_bot_status()
     except Exception as e:
         logger.error(f"載入關鍵字時發生錯誤: {e}")
         monitored_keywords = {}
+        mark_keywords_changed()
+
+def load_exclusions():
+    global excluded_keywords
+    try:
+        if os.path.exists('exclusions.json'):
+            with open('exclusions.json', 'r', encoding='utf-8') as f:
+                loaded_data = json.load(f)
+                excluded_keywords = {int(k): v for k, v in loaded_data.items()}
+                logger.info(f"已載入 {len(excluded_keywords)} 個用戶的排除關鍵字")
+    except Exception as e:
+        logger.error(f"載入排除關鍵字時發生錯誤: {e}")
+        excluded_keywords = {}
+    mark_keywords_changed()
+
+def load_filters():
+    global user_filters, watched_players
+    try:
+        if os.path.exists('filters.json'):
+            with open('filters.json', 'r', encoding='utf-8') as f:
+                loaded_data = json.load(f)
+                user_filters = {int(k): v for k, v in loaded_data.get("filters", {}).items()}
+                watched_players = {int(k): v for k, v in loaded_data.get("watched_players", {}).items()}
+                logger.info(f"已載入 {len(user_filters)} 個用戶的篩選設定、{len(watched_players)} 個用戶的關注玩家")
+    except Exception as e:
+        logger.error(f"載入篩選設定時發生錯誤: {e}")
+        user_filters = {}
+        watched_players = {}
+    mark_keywords_changed()
+
+def load_price_alerts():
+    global price_alerts
+    try:
+        if os.path.exists('price_alerts.json'):
+            with open('price_alerts.json', 'r', encoding='utf-8') as f:
+                loaded_data = json.load(f)
+                price_alerts = {int(k): v for k, v in loaded_data.items()}
+                logger.info(f"已載入 {len(price_alerts)} 個用戶的價格提醒")
+    except Exception as e:
+        logger.error(f"載入價格提醒時發生錯誤: {e}")
+        price_alerts = {}
+    mark_keywords_changed()
+
+def load_spam_filters():
+    global spam_filters
+    try:
+        if os.path.exists('spam_filters.json'):
+            with open('spam_filters.json', 'r', encoding='utf-8') as f:
+                loaded_data = json.load(f)
+                spam_filters = {int(k): v for k, v in loaded_data.items()}
+                logger.info(f"已載入 {len(spam_filters)} 個用戶的近似重複抑制設定")
+    except Exception as e:
+        logger.error(f"載入近似重複抑制設定時發生錯誤: {e}")
+        spam_filters = {}
+    for user_id in near_duplicate_filter.users() - set(spam_filters):
+        near_duplicate_filter.remove(user_id)
+    for user_id, setting in spam_filters.items():
+        try:
+            near_duplicate_filter.configure(user_id, setting["similarity"], setting["minutes"])
+        except (KeyError, ValueError) as e:
+            logger.warning(f"⚠️ 略過無效的近似重複抑制設定（用戶 {user_id}）: {e}")
+
+def load_cooldowns():
+    global cooldown_settings
+    try:
+        if os.path.exists('cooldowns.json'):
+            with open('cooldowns.json', 'r', encoding='utf-8') as f:
+                loaded_data = json.load(f)
+                cooldown_settings = {int(k): v for k, v in loaded_data.items()}
+                logger.info(f"已載入 {len(cooldown_settings)} 個用戶的通知冷卻設定")
+    except Exception as e:
+        logger.error(f"載入通知冷卻設定時發生錯誤: {e}")
+        cooldown_settings = {}
+    notification_throttle.settings = cooldown_settings
+
+def load_digests():
+    global digest_settings
+    try:
+        if os.path.exists('digests.json'):
+            with open('digests.json', 'r', encoding='utf-8') as f:
+                loaded_data = json.load(f)
+                digest_settings = {int(k): v for k, v in loaded_data.items()}
+                logger.info(f"已載入 {len(digest_settings)} 個用戶的摘要模式設定")
+    except Exception as e:
+        logger.error(f"載入摘要模式設定時發生錯誤: {e}")
+        digest_settings = {}
+    digest_scheduler.settings = digest_settings
 
 def load_user_settings():
     global user_notification_channels
@@ -808,6 +1989,90 @@ def load_user_settings():
         logger.error(f"載入用戶設定時發生錯誤: {e}")
         user_notification_channels = {}
 
+def load_webhooks():
+    global channel_webhooks
+    try:
+        if os.path.exists('webhooks.json'):
+            with open('webhooks.json', 'r', encoding='utf-8') as f:
+                loaded_data = json.load(f)
+                channel_webhooks = {int(k): v for k, v in loaded_data.items()}
+                logger.info(f"已載入 {len(channel_webhooks)} 個頻道的 webhook")
+    except Exception as e:
+        logger.error(f"載入 webhook 設定時發生錯誤: {e}")
+        channel_webhooks = {}
+
+def load_user_guilds():
+    global user_guilds
+    try:
+        if os.path.exists('user_guilds.json'):
+            with open('user_guilds.json', 'r', encoding='utf-8') as f:
+                loaded_data = json.load(f)
+                user_guilds = {int(k): v for k, v in loaded_data.items()}
+    except Exception as e:
+        logger.error(f"載入用戶主要伺服器時發生錯誤: {e}")
+        user_guilds = {}
+    mark_keywords_changed()
+
+# 多行程模式下，其他行程寫入的設定檔在下一次監控週期重新載入
+SETTINGS_LOADERS = {
+    'keywords.json': lambda: load_keywords(),
+    'exclusions.json': lambda: load_exclusions(),
+    'filters.json': lambda: load_filters(),
+    'price_alerts.json': lambda: load_price_alerts(),
+    'spam_filters.json': lambda: load_spam_filters(),
+    'cooldowns.json': lambda: load_cooldowns(),
+    'digests.json': lambda: load_digests(),
+    'user_settings.json': lambda: load_user_settings(),
+    'webhooks.json': lambda: load_webhooks(),
+    'user_guilds.json': lambda: load_user_guilds(),
+}
+
+def reload_settings_if_changed():
+    for path, loader in SETTINGS_LOADERS.items():
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        if settings_mtimes.get(path) != mtime:
+            if path in settings_mtimes:
+                logger.info(f"🔄 設定檔已被其他行程更新，重新載入: {path}")
+                loader()
+            settings_mtimes[path] = mtime
+
+def owned(mapping):
+    """只保留本行程負責的用戶（未分片時回傳原本的 dict）"""
+    return shard_partition.filter(mapping, user_guilds)
+
+def mark_keywords_changed():
+    global keywords_version
+    keywords_version += 1
+
+def get_keyword_index():
+    """取得最新的關鍵字比對索引，關鍵字有變更時才重新編譯"""
+    global keyword_index
+    if keyword_index is None or keyword_index.version != keywords_version:
+        keyword_index = SubscriptionIndex(
+            owned(monitored_keywords), version=keywords_version, exclusions=owned(excluded_keywords), stats=match_stats
+        )
+        logger.info(f"🧩 已編譯關鍵字索引 v{keywords_version}: {len(keyword_index)} 個關鍵字")
+    return keyword_index
+
+def get_audience_index():
+    """取得最新的頻道／發言者篩選索引"""
+    global audience_index
+    if audience_index is None or audience_index.version != keywords_version:
+        subscribers = [user_id for user_id, keywords in owned(monitored_keywords).items() if keywords]
+        subscribers += [user_id for user_id, alerts in owned(price_alerts).items() if alerts]
+        audience_index = AudienceIndex(subscribers, user_filters, owned(watched_players), version=keywords_version)
+    return audience_index
+
+def get_price_alert_index():
+    """取得最新的價格提醒索引"""
+    global price_alert_index
+    if price_alert_index is None or price_alert_index.version != keywords_version:
+        price_alert_index = PriceAlertIndex(owned(price_alerts), version=keywords_version)
+    return price_alert_index
+
 def update_bot_status():
     global bot_status
     bot_status["users_count"] = len(monitored_keywords)
@@ -828,73 +2093,20 @@ async def on_command_error(ctx, error):
 
 # FastAPI 路由
 @app.get("/", response_class=HTMLResponse)
-async def home():
-    html_content = f"""
-    <!DOCTYPE html>
-    <html lang="zh-TW">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>MapleStory Worlds Artale 關鍵字監控</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; margin: 40px; background-color: #f5f5f5; }}
-            .container {{ max-width: 800px; margin: 0 auto; background: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-            h1 {{ color: #333; text-align: center; }}
-            .status {{ padding: 15px; margin: 20px 0; border-radius: 5px; }}
-            .status.running {{ background-color: #d4edda; border: 1px solid #c3e6cb; color: #155724; }}
-            .status.stopped {{ background-color: #f8d7da; border: 1px solid #f5c6cb; color: #721c24; }}
-            .stats {{ display: grid; grid-template-columns: 1fr 1fr; gap: 20px; margin: 20px 0; }}
-            .stat-card {{ background: #e9ecef; padding: 20px; border-radius: 5px; text-align: center; }}
-            .commands {{ background: #f8f9fa; padding: 20px; border-radius: 5px; margin: 20px 0; }}
-            .btn {{ display: inline-block; padding: 10px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 5px; margin: 5px; }}
-            .btn:hover {{ background: #0056b3; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>🤖 MapleStory Worlds Artale 關鍵字監控</h1>
-            
-            <div class="status {'running' if bot_status['status'] == '運行中' else 'stopped'}">
-                <strong>機器人狀態:</strong> {bot_status['status']}<br>
-                <strong>最後更新:</strong> {bot_status.get('last_update', '未知')}
-            </div>
-            
-            <div class="stats">
-                <div class="stat-card">
-                    <h3>{bot_status['users_count']}</h3>
-                    <p>註冊用戶</p>
-                </div>
-                <div class="stat-card">
-                    <h3>{bot_status['keywords_count']}</h3>
-                    <p>監控關鍵字</p>
-                </div>
-            </div>
-            
-            <div class="commands">
-                <h3>🎮 Discord 機器人指令</h3>
-                <p><code>!add_keyword &lt;關鍵字&gt;</code> - 添加監控關鍵字</p>
-                <p><code>!remove_keyword &lt;關鍵字&gt;</code> - 移除監控關鍵字</p>
-                <p><code>!list_keywords</code> - 查看你的關鍵字</p>
-                <p><code>!set_channel</code> - 設定通知頻道</p>
-                <p><code>!test_fetch</code> - 測試網站抓取</p>
-                <p><code>!toggle_test_mode</code> - 切換測試模式</p>
-            </div>
-            
-            <div style="text-align: center; margin: 30px 0;">
-                <a href="/api/status" class="btn">查看 API 狀態</a>
-                <a href="/api/test" class="btn">測試網站抓取</a>
-                <a href="/health" class="btn">健康檢查</a>
-            </div>
-            
-            <div style="text-align: center; margin-top: 30px; color: #6c757d;">
-                <p>監控網站: <a href="https://pal.tw/" target="_blank">pal.tw</a></p>
-                <p>檢查頻率: 每 30 秒</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    return HTMLResponse(content=html_content)
+async def home(request: Request):
+    # 控制台頁面是靜態檔案，狀態由 /api/stream 即時推送
+    if dashboard_page.not_modified(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=dashboard_page.headers)
+    return Response(content=dashboard_page.content, media_type=dashboard_page.media_type, headers=dashboard_page.headers)
+
+@app.get("/api/stream")
+async def api_stream():
+    client = dashboard_events.subscribe()
+    return StreamingResponse(
+        dashboard_events.stream(client),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/health")
 async def health_check():
@@ -904,23 +2116,302 @@ async def health_check():
 async def api_status():
     return {
         "bot_status": bot_status,
+        "ws_connected": keyword_catcher.ws_connected,
+        "dashboard_clients": len(dashboard_events.clients),
         "monitored_users": len(monitored_keywords),
         "total_keywords": sum(len(keywords) for keywords in monitored_keywords.values()),
+        "notifications_excluded": match_stats["excluded"],
+        "messages_dropped_by_filters": match_stats["dropped_by_filters"],
+        "notifications_near_duplicate": near_duplicate_filter.stats["suppressed"],
+        "notifications_cooled_down": notification_throttle.stats["cooled_down"],
+        "notifications_capped": notification_throttle.stats["capped"],
+        "cooldowns_active": len(notification_throttle.wheel),
+        "digests_pending": len(digest_scheduler),
+        "digest_matches_buffered": digest_scheduler.stats["buffered"],
+        "digests_sent": digest_scheduler.stats["digests_sent"],
+        "shards": shard_partition.describe(),
+        "ready_count": bot_status.get("ready_count", 0),
+        "running_tasks": task_supervisor.running_count,
+        "snapshot": snapshot_stats,
+        "outbox": dict(outbox.stats, **outbox_dispatcher.stats, pending=len(outbox), destinations=outbox_dispatcher.destinations),
+        "channel_batches": channel_batch_stats,
+        "webhooks": dict(webhook_sender.stats, channels=len(channel_webhooks)) if webhook_sender else None,
+        "tasks": task_supervisor.status(),
+        "owned_users": len(owned(monitored_keywords)),
+        "chat_bus": CHAT_BUS_MODE or None,
+        "chat_bus_subscribers": chat_bus_publisher.subscribers if chat_bus_publisher else 0,
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/api/search")
+async def api_search(
+    q: str = Query(..., min_length=1, description="搜尋字串"),
+    hours: float = Query(None, gt=0, description="只搜尋最近幾小時"),
+    limit: int = Query(20, ge=1, le=200),
+    channel: str = Query(None, description="遊戲頻道，例如 3362"),
+):
+    if not history_store:
+        return JSONResponse(status_code=503, content={"error": "歷史搜尋未啟用"})
+    if channel:
+        channel = f"[{normalize_channel(channel)}]"
+    started = datetime.now()
+    results = await asyncio.to_thread(history_store.search, q, hours, limit, channel)
+    return {
+        "query": q,
+        "results": results,
+        "count": len(results),
+        "elapsed_ms": round((datetime.now() - started).total_seconds() * 1000, 2),
+    }
+
+@app.get("/api/preview")
+async def api_preview(
+    keyword: str = Query(..., min_length=1),
+    hours: float = Query(24, gt=0, le=24 * 30),
+    samples: int = Query(5, ge=0, le=50),
+):
+    """用聊天歷史回測關鍵字"""
+    if not history_store:
+        return JSONResponse(status_code=503, content={"error": "歷史搜尋未啟用"})
+    try:
+        return await asyncio.to_thread(preview_keyword, history_store, keyword, hours, samples)
+    except ExpressionError as e:
+        return JSONResponse(status_code=400, content={"error": f"表達式格式錯誤: {e}"})
+
+@app.get("/api/market")
+async def api_market(
+    window: str = Query("1h", pattern="^(" + "|".join(MARKET_WINDOWS) + ")$"),
+    limit: int = Query(10, ge=1, le=50),
+):
+    """滾動視窗內的熱門物品、均價與最熱鬧的頻道"""
+    return market_stats.snapshot(window, limit)
+
 @app.get("/api/test")
 async def api_test():
-    messages = keyword_catcher.fetch_messages()
+    messages = keyword_catcher.recent_messages(10)
     return {
         "success": len(messages) > 0,
         "message_count": len(messages),
-        "messages": messages[:3],
+        "messages": messages[-3:],
         "timestamp": datetime.now().isoformat()
     }
 
-# 在背景運行 Discord 機器人
-def run_discord_bot():
+@app.get("/api/messages")
+async def api_messages(
+    request: Request,
+    since: int = Query(0, ge=0, description="只回傳序號大於此值的訊息"),
+    limit: int = Query(50, ge=1, le=500),
+    channel: str = Query(None, description="遊戲頻道，例如 3362"),
+    username: str = Query(None),
+):
+    """唯讀的訊息歷史分頁 API，以序號作為游標"""
+    buffer = keyword_catcher.message_buffer
+    # 內容只會在有新訊息時改變，因此 ETag 由最新序號與查詢參數組成
+    query_hash = hashlib.md5(str(request.query_params).encode()).hexdigest()[:8]
+    etag = f'"{buffer.latest_seq}-{query_hash}"'
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    messages, next_since, has_more = buffer.since(since, limit, channel=channel, username=username)
+    return JSONResponse(
+        content={
+            "messages": messages,
+            "next_since": next_since,
+            "latest_seq": buffer.latest_seq,
+            "has_more": has_more,
+            "truncated": since < buffer.first_seq - 1,
+        },
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
+
+def dashboard_status():
+    """控制台顯示的狀態欄位"""
+    return {
+        "status": bot_status["status"],
+        "last_update": bot_status["last_update"],
+        "users_count": bot_status["users_count"],
+        "keywords_count": bot_status["keywords_count"],
+        "ws_connected": keyword_catcher.ws_connected,
+    }
+
+async def publish_dashboard_status():
+    """定期比較狀態，只在有控制台連線且狀態變化時推送差異"""
+    while True:
+        if dashboard_events.clients:
+            dashboard_events.publish_status(dashboard_status())
+        else:
+            dashboard_events.last_status = dashboard_status()
+        await asyncio.sleep(1)
+
+def restore_snapshot():
+    """在開始接收訊息前還原熱重啟快照"""
+    state = read_snapshot(
+        SNAPSHOT_PATH,
+        max_dedup=int(os.getenv('SNAPSHOT_MAX_HASHES', 100000)),
+        max_messages=keyword_catcher.message_buffer.capacity,
+    )
+    if state is None:
+        return
+    snapshot_stats["restored_messages"] = keyword_catcher.restore(state)
+    snapshot_stats["restored_hashes"] = len(state['dedup_hashes'])
+    snapshot_stats["restore_ms"] = state['elapsed_ms']
+    logger.info(
+        f"♻️ 已還原快照: {snapshot_stats['restored_messages']} 條訊息、"
+        f"{snapshot_stats['restored_hashes']} 筆去重複雜湊（{state['elapsed_ms']} ms）"
+    )
+
+def save_snapshot():
+    try:
+        write_snapshot(SNAPSHOT_PATH, keyword_catcher.snapshot())
+        snapshot_stats["last_saved"] = datetime.now().isoformat()
+    except Exception as e:
+        logger.error(f"寫入快照時發生錯誤: {e}")
+
+async def run_snapshots():
+    """定期寫入熱重啟快照（編碼在事件迴圈中完成以取得一致的狀態，寫檔交給執行緒）"""
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        data = keyword_catcher.snapshot()
+        await asyncio.to_thread(write_snapshot, SNAPSHOT_PATH, data)
+        snapshot_stats["last_saved"] = datetime.now().isoformat()
+
+async def run_notification_throttle():
+    """每秒推進冷卻時間輪，送出冷卻結束時折疊的通知"""
+    while True:
+        await asyncio.sleep(1)
+        for user_id, message_data, keywords, folded in notification_throttle.advance():
+            logger.info(f"🗂️ 用戶 {user_id} 冷卻結束，送出 {folded} 則折疊的匹配")
+            enqueue_notification(user_id, message_data, keywords, folded=folded)
+
+async def run_digests():
+    """每秒推進摘要排程，一次把所有到期的摘要放入通知佇列"""
+    while True:
+        await asyncio.sleep(1)
+        due = digest_scheduler.advance()
+        for user_id, digest in due:
+            enqueue_digest(user_id, digest)
+        if due:
+            logger.info(f"📬 送出 {len(due)} 則到期的摘要")
+
+def enqueue_digest(user_id, digest):
+    outbox.put({"user_id": user_id, "digest": digest})
+
+def notification_message(message_data):
+    """通知佇列只保留發送需要的訊息欄位"""
+    return {field: message_data[field] for field in NOTIFICATION_FIELDS if field in message_data}
+
+def enqueue_notification(user_id, message_data, matched_keywords, folded=0):
+    """把通知放入持久化佇列，由 run_outbox 依目的地發送"""
+    outbox.put({
+        "user_id": user_id,
+        "keywords": list(matched_keywords),
+        "folded": folded,
+        "message": notification_message(message_data),
+    })
+
+def enqueue_notifications(message_data, deliveries):
+    """同一則訊息的所有通知；通知頻道相同的用戶合併成一則頻道貼文"""
+    batches, singles = group_by_channel(deliveries, user_notification_channels)
+    for channel_id, recipients in batches.items():
+        for chunk in chunk_recipients([(user_id, list(keywords)) for user_id, keywords in recipients]):
+            if len(chunk) == 1:
+                enqueue_notification(chunk[0][0], message_data, chunk[0][1])
+                continue
+            outbox.put({
+                "channel_id": channel_id,
+                "recipients": chunk,
+                "message": notification_message(message_data),
+            })
+    for user_id, matched_keywords in singles.items():
+        enqueue_notification(user_id, message_data, matched_keywords)
+
+async def send_channel_batch(channel_id, recipients, message_data):
+    """在共用的通知頻道發一則提及所有收件者的貼文；頻道無法使用時改為逐一通知"""
+    embed = build_notification_embed(
+        message_data, "\n".join(recipient_line(user_id, keywords) for user_id, keywords in recipients)
+    )
+    user_ids = [user_id for user_id, _ in recipients]
+    try:
+        if await post_to_channel(channel_id, " ".join(mention(user_id) for user_id in user_ids), embed, user_ids):
+            channel_batch_stats["posts"] += 1
+            channel_batch_stats["recipients"] += len(recipients)
+            logger.info(f"✅ 已在頻道 {channel_id} 合併通知 {len(recipients)} 位用戶")
+            return True
+        logger.warning(f"⚠️ 找不到頻道: {channel_id}")
+    except Exception as e:
+        if is_transient_error(e):
+            raise
+        logger.error(f"❌ 發送合併通知到頻道 {channel_id} 失敗: {e}")
+    for user_id, keywords in recipients:
+        enqueue_notification(user_id, message_data, keywords)
+    return True
+
+async def post_to_channel(channel_id, content, embed, user_ids):
+    """發送到通知頻道：有 webhook 時走 webhook，否則由機器人發送；找不到頻道時回傳 False"""
+    url = channel_webhooks.get(channel_id) if webhook_sender else None
+    if url:
+        try:
+            await webhook_sender.send(url, webhook_payload(content, embed.to_dict(), user_ids))
+            return True
+        except WebhookGone as e:
+            logger.warning(f"⚠️ 頻道 {channel_id} 的 webhook 已失效，改由機器人發送: {e}")
+            channel_webhooks.pop(channel_id, None)
+            save_webhooks(channel_id)
+    channel_obj = bot.get_channel(channel_id)
+    if not channel_obj:
+        return False
+    await channel_obj.send(
+        content,
+        embed=embed,
+        allowed_mentions=discord.AllowedMentions(everyone=False, roles=False, users=True),
+    )
+    return True
+
+async def ensure_channel_webhook(channel):
+    """建立或重用通知頻道的 webhook；沒有權限或不是文字頻道時回傳 None，改由機器人發送"""
+    if channel.id in channel_webhooks:
+        return channel_webhooks[channel.id]
+    if not isinstance(channel, discord.TextChannel):
+        return None
+    try:
+        webhook = next(
+            (hook for hook in await channel.webhooks() if hook.name == WEBHOOK_NAME and hook.token),
+            None
+        ) or await channel.create_webhook(name=WEBHOOK_NAME)
+    except discord.Forbidden:
+        logger.warning(f"⚠️ 沒有在頻道 {channel.id} 管理 webhook 的權限，改由機器人發送")
+        return None
+    channel_webhooks[channel.id] = webhook.url
+    save_webhooks(channel.id)
+    logger.info(f"🪝 頻道 {channel.id} 的通知改由 webhook 發送")
+    return webhook.url
+
+def notification_destination(entry):
+    """通知的目的地：頻道貼文以頻道區分，個人通知以用戶設定的通知頻道（沒有時以用戶）區分"""
+    if "channel_id" in entry:
+        return ("channel", entry["channel_id"])
+    channel_id = user_notification_channels.get(entry["user_id"])
+    return ("channel", channel_id) if channel_id else ("user", entry["user_id"])
+
+async def deliver_entry(entry):
+    """發送一則佇列中的通知；Discord 暫時無法使用時拋出例外，由該目的地稍後重試"""
+    if "digest" in entry:
+        return await send_digest(entry["user_id"], entry["digest"])
+    if "channel_id" in entry:
+        return await send_channel_batch(entry["channel_id"], entry["recipients"], entry["message"])
+    return await send_notification(entry["user_id"], entry["message"], entry["keywords"], folded=entry["folded"])
+
+# 同一個頻道或用戶的通知依序發送，不同目的地並行，一個 webhook 被限速時不會擋住其他頻道
+outbox_dispatcher = OutboxDispatcher(
+    outbox, deliver_entry, notification_destination,
+    max_in_flight=int(os.getenv('OUTBOX_MAX_IN_FLIGHT', 200)),
+)
+
+async def run_outbox():
+    """依目的地並行發送佇列中的通知（由 on_ready 啟動）；停止時尚未送出的通知放回佇列"""
+    await outbox_dispatcher.run()
+
+# 在同一個事件迴圈中運行 Discord 機器人
+async def run_discord_bot():
     token = os.getenv('DISCORD_TOKEN')
     if not token:
         logger.error("請在環境變數中設定 DISCORD_TOKEN")
@@ -928,24 +2419,48 @@ def run_discord_bot():
     
     logger.info("正在啟動 Discord 機器人...")
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        bot.run(token)
+        await bot.start(token)
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         logger.error(f"Discord 機器人啟動失敗: {e}")
+        bot_status["status"] = f"錯誤: {e}"
 
-# 啟動 Discord 機器人
-if __name__ == "__main__":
-    # 在背景執行緒中啟動 Discord 機器人
-    bot_thread = threading.Thread(target=run_discord_bot, daemon=True)
-    bot_thread.start()
+async def shutdown_discord_bot(bot_task):
+    """Web 服務器關閉時一併關閉機器人與背景任務"""
+    global parallel_matcher
+    logger.info("🛑 正在關閉 Discord 機器人...")
+    bot_status["status"] = "停止"
+    
+    if monitor_website.is_running():
+        monitor_website.cancel()
+    if not bot.is_closed():
+        await bot.close()
     
-    # 啟動 FastAPI 服務器
+    bot_task.cancel()
+    try:
+        await bot_task
+    except (asyncio.CancelledError, Exception):
+        pass
+    
+    if parallel_matcher:
+        parallel_matcher.close()
+        parallel_matcher = None
+    logger.info("✅ Discord 機器人已關閉")
+
+async def run_services():
+    """以 uvicorn Server.serve() 啟動 Web 服務器，機器人由 lifespan 在同一迴圈中啟動"""
     import uvicorn
     port = int(os.getenv("PORT", 8000))
     logger.info(f"正在啟動 Web 服務器，端口: {port}")
-    uvicorn.run(app, host="0.0.0.0", port=port)
-else:
-    # 如果被其他模組導入，在背景啟動機器人
-    bot_thread = threading.Thread(target=run_discord_bot, daemon=True)
-    bot_thread.start() 
\ No newline at end of file
+    config = uvicorn.Config(app, host="0.0.0.0", port=port)
+    server = uvicorn.Server(config)
+    await server.serve()
+
+# 啟動 Web 服務器與 Discord 機器人
+# 被其他模組導入時（例如 uvicorn main:app），機器人同樣由 lifespan 啟動
+if __name__ == "__main__":
+    try:
+        asyncio.run(run_services())
+    except KeyboardInterrupt:
+        logger.info("👋 服務已停止")
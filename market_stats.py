@@ -0,0 +1,232 @@
+"""
+公頻市場統計
+
+由訊息處理流程逐條餵入解析好的交易紀錄，增量維護每個物品、每個遊戲頻道在
+1 分鐘／1 小時／24 小時的滾動視窗統計。視窗是固定大小的環狀陣列，舊的
+時間桶在時間前進時直接扣掉；熱門物品由 count-min sketch 加上固定容量的
+候選集合找出。所有查詢只讀取預先算好的狀態，不會重新掃描聊天歷史。
+"""
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# 視窗名稱 → (每個時間桶的秒數, 時間桶數量)
+WINDOWS = {
+    '1m': (1, 60),
+    '1h': (60, 60),
+    '24h': (3600, 24),
+}
+
+# 物品統計欄位
+ITEM_FIELDS = ('mentions', 'buy', 'sell', 'buy_price_sum', 'buy_price_count', 'sell_price_sum', 'sell_price_count')
+
+
+class RingWindow:
+    """以環狀陣列實作的滾動視窗，每個時間桶可存多個欄位的累計值"""
+
+    def __init__(self, width, slots, fields=1):
+        self.width = width
+        self.slots = slots
+        self.fields = fields
+        self._buckets = [None] * slots
+        self._totals = [0] * fields
+        self._epoch = None
+
+    def _advance(self, now):
+        """時間前進時清掉過期的時間桶，並從總計中扣除"""
+        epoch = int(now // self.width)
+        if self._epoch is None:
+            self._epoch = epoch
+        elif epoch > self._epoch:
+            for expired in range(self._epoch + 1, min(epoch, self._epoch + self.slots) + 1):
+                slot = expired % self.slots
+                bucket = self._buckets[slot]
+                if bucket is not None:
+                    for field, value in enumerate(bucket):
+                        self._totals[field] -= value
+                    self._buckets[slot] = None
+            self._epoch = epoch
+        # 時間倒退（亂序訊息）時計入目前的時間桶
+        return self._epoch
+
+    def add(self, now, values):
+        slot = self._advance(now) % self.slots
+        bucket = self._buckets[slot]
+        if bucket is None:
+            bucket = self._buckets[slot] = [0] * self.fields
+        for field, value in enumerate(values):
+            if value:
+                bucket[field] += value
+                self._totals[field] += value
+
+    def totals(self, now):
+        self._advance(now)
+        return list(self._totals)
+
+
+class CountMinSketch:
+    """count-min sketch：以固定記憶體估計每個詞的出現次數（只會高估）"""
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self._rows = [[0] * width for _ in range(depth)]
+
+    def add(self, key, count=1):
+        """累加並回傳新的估計值"""
+        estimate = None
+        for row_index, row in enumerate(self._rows):
+            slot = hash((row_index, key)) % self.width
+            row[slot] += count
+            estimate = row[slot] if estimate is None else min(estimate, row[slot])
+        return estimate
+
+    def estimate(self, key):
+        return min(row[hash((row_index, key)) % self.width] for row_index, row in enumerate(self._rows))
+
+    def decay(self):
+        """所有計數減半，讓舊的熱門詞逐漸退出"""
+        self._rows = [[value >> 1 for value in row] for row in self._rows]
+
+
+class HeavyHitters:
+    """熱門詞候選：count-min sketch 估計值最高的 capacity 個詞"""
+
+    def __init__(self, capacity=64, width=2048, depth=4):
+        self.capacity = capacity
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates = {}
+        self._floor = 0  # 候選估計值的下界，低於此值的詞不需要比較
+
+    def offer(self, key, count=1):
+        estimate = self.sketch.add(key, count)
+        if key in self.candidates or len(self.candidates) < self.capacity:
+            self.candidates[key] = estimate
+            return
+        if estimate <= self._floor:
+            return
+        victim = min(self.candidates, key=self.candidates.get)
+        if estimate > self.candidates[victim]:
+            del self.candidates[victim]
+            self.candidates[key] = estimate
+        self._floor = min(self.candidates.values())
+
+    def decay(self):
+        self.sketch.decay()
+        self.candidates = {key: estimate >> 1 for key, estimate in self.candidates.items()}
+        self._floor >>= 1
+
+
+def _new_windows(fields):
+    return {name: RingWindow(width, slots, fields) for name, (width, slots) in WINDOWS.items()}
+
+
+class MarketStats:
+    """物品與頻道的增量市場統計
+
+    max_keys 限制追蹤的物品與頻道數量，超過時淘汰最久沒有出現的；
+    top_capacity 是熱門候選集合的大小，查詢前 K 名時只排序這些候選。
+    """
+
+    def __init__(self, max_keys=2000, top_capacity=64, decay_interval=3600):
+        self.max_keys = max_keys
+        self.decay_interval = decay_interval
+        self._items = OrderedDict()
+        self._channels = OrderedDict()
+        self._totals = _new_windows(2)  # 訊息數、交易紀錄數
+        self._trending_items = HeavyHitters(top_capacity)
+        self._trending_channels = HeavyHitters(top_capacity)
+        self._last_decay = time.time()
+        self.recorded = 0
+
+    def _windows(self, table, key, fields):
+        windows = table.get(key)
+        if windows is None:
+            windows = table[key] = _new_windows(fields)
+            if len(table) > self.max_keys:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return windows
+
+    def record(self, message_data, now=None):
+        """把一條已解析的訊息計入統計"""
+        now = time.time() if now is None else now
+        if now - self._last_decay >= self.decay_interval:
+            self._trending_items.decay()
+            self._trending_channels.decay()
+            self._last_decay = now
+
+        trades = message_data.get('trades') or []
+        for window in self._totals.values():
+            window.add(now, (1, len(trades)))
+
+        channel = message_data.get('channel_id')
+        if channel is not None:
+            for window in self._windows(self._channels, channel, 1).values():
+                window.add(now, (1,))
+            self._trending_channels.offer(channel)
+
+        for trade in trades:
+            price = trade.get('price')
+            buy = trade['intent'] == '收'
+            sell = trade['intent'] == '賣'
+            values = (
+                1, buy, sell,
+                price if buy and price is not None else 0, buy and price is not None,
+                price if sell and price is not None else 0, sell and price is not None,
+            )
+            for window in self._windows(self._items, trade['item'], len(ITEM_FIELDS)).values():
+                window.add(now, values)
+            self._trending_items.offer(trade['item'])
+        self.recorded += 1
+
+    def item_stats(self, item, window='1h', now=None):
+        windows = self._items.get(item)
+        if windows is None:
+            return None
+        totals = dict(zip(ITEM_FIELDS, windows[window].totals(time.time() if now is None else now)))
+        return {
+            'item': item,
+            'mentions': totals['mentions'],
+            'buy': totals['buy'],
+            'sell': totals['sell'],
+            'avg_buy_price': round(totals['buy_price_sum'] / totals['buy_price_count'], 2) if totals['buy_price_count'] else None,
+            'avg_sell_price': round(totals['sell_price_sum'] / totals['sell_price_count'], 2) if totals['sell_price_count'] else None,
+        }
+
+    def trending(self, window='1h', limit=10, now=None):
+        """視窗內提及次數最多的物品（只排序熱門候選）"""
+        now = time.time() if now is None else now
+        stats = [self.item_stats(item, window, now) for item in self._trending_items.candidates]
+        stats = [s for s in stats if s and s['mentions']]
+        stats.sort(key=lambda s: s['mentions'], reverse=True)
+        return stats[:limit]
+
+    def busiest_channels(self, window='1h', limit=10, now=None):
+        now = time.time() if now is None else now
+        channels = []
+        for channel in self._trending_channels.candidates:
+            windows = self._channels.get(channel)
+            if windows is not None:
+                messages = windows[window].totals(now)[0]
+                if messages:
+                    channels.append({'channel': channel, 'messages': messages})
+        channels.sort(key=lambda c: c['messages'], reverse=True)
+        return channels[:limit]
+
+    def snapshot(self, window='1h', limit=10, now=None):
+        """/api/market 的回應內容"""
+        if window not in WINDOWS:
+            raise ValueError(f"不支援的視窗: {window}（可用: {', '.join(WINDOWS)}）")
+        now = time.time() if now is None else now
+        messages, trades = self._totals[window].totals(now)
+        return {
+            'window': window,
+            'messages': messages,
+            'trades': trades,
+            'items': self.trending(window, limit, now),
+            'channels': self.busiest_channels(window, limit, now),
+        }
@@ -0,0 +1,196 @@
+"""
+關鍵字比對引擎
+
+把所有用戶的關鍵字編譯成一個 Aho-Corasick 自動機，每條訊息只需掃描一次，
+不論訂閱的關鍵字有多少，比對成本都只和訊息長度有關。
+"""
+import logging
+
+from expressions import ExpressionError, compile_expression, is_expression
+from normalizer import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 多模式字串比對自動機
+
+    狀態轉移使用 dict 列表儲存，整個結構只包含內建型別，可以直接 pickle
+    後廣播給其他行程。
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        self._build()
+
+    def _build(self):
+        goto, output = self._goto, self._output
+        pending_outputs = [[]]
+        for pattern_id, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    self._fail.append(0)
+                    pending_outputs.append([])
+                state = next_state
+            pending_outputs[state].append(pattern_id)
+
+        # 以 BFS 建立失敗連結，並把失敗狀態的輸出合併進來
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in goto[fail]:
+                    fail = self._fail[fail]
+                candidate = goto[fail].get(char, 0)
+                self._fail[next_state] = candidate if candidate != next_state else 0
+                pending_outputs[next_state].extend(pending_outputs[self._fail[next_state]])
+
+        output[:] = [tuple(sorted(set(ids))) for ids in pending_outputs]
+
+    def find(self, text):
+        """回傳 text 中出現的所有模式編號"""
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class SubscriptionIndex:
+    """所有用戶關鍵字的編譯結果
+
+    關鍵字在編譯時正規化（見 normalizer.py），相同的關鍵字只會進入自動機一次，比對結果再展開成
+    {user_id: [keyword, ...]}，關鍵字順序與用戶設定的順序一致。表達式型
+    關鍵字（見 expressions.py）的字面詞同樣進入自動機，只有預先篩選的
+    字面詞命中時才會判斷整個表達式。
+
+    exclusions（{user_id: [keyword, ...]}）是排除關鍵字，和正向關鍵字在同一次
+    掃描中比對；訊息包含排除關鍵字時，該用戶的匹配會被取消，並在
+    stats["excluded"] 中計數。
+    """
+
+    def __init__(self, subscriptions, version=0, exclusions=None, stats=None):
+        self.version = version
+        self.stats = stats if stats is not None else {}
+        self.stats.setdefault("excluded", 0)
+        self._owners = []
+        self._excluders = {}
+        self._expressions = []
+        self._triggers = {}
+        self._always = []
+        self._pattern_ids = {}
+        self._patterns = []
+        for user_id, keywords in subscriptions.items():
+            for position, keyword in enumerate(keywords or []):
+                if is_expression(keyword):
+                    self._add_expression(user_id, position, keyword)
+                    continue
+                key = normalize_text(keyword)
+                if not key:
+                    continue
+                self._owners[self._register(key)].append((user_id, position, keyword))
+        for user_id, keywords in (exclusions or {}).items():
+            for keyword in keywords or []:
+                key = normalize_text(keyword)
+                if key:
+                    self._excluders.setdefault(self._register(key), set()).add(user_id)
+        self.automaton = KeywordAutomaton(self._patterns)
+
+    def _register(self, key):
+        pattern_id = self._pattern_ids.get(key)
+        if pattern_id is None:
+            pattern_id = self._pattern_ids[key] = len(self._patterns)
+            self._patterns.append(key)
+            self._owners.append([])
+        return pattern_id
+
+    def _add_expression(self, user_id, position, keyword):
+        try:
+            node, trigger_ids = compile_expression(keyword, self._register)
+        except ExpressionError as e:
+            logger.warning(f"⚠️ 略過無效的表達式 {keyword!r}（用戶 {user_id}）: {e}")
+            return
+        expression_id = len(self._expressions)
+        self._expressions.append((user_id, position, keyword, node))
+        if trigger_ids is None:
+            self._always.append(expression_id)
+        else:
+            for pattern_id in set(trigger_ids):
+                self._triggers.setdefault(pattern_id, []).append(expression_id)
+
+    def __len__(self):
+        return len(self.automaton.patterns)
+
+    def match_ids(self, normalized):
+        """回傳正規化後的訊息命中的模式編號（可在其他行程中執行）"""
+        return self.automaton.find(normalized)
+
+    def resolve(self, pattern_ids, normalized="", skip_users=None):
+        """把模式編號展開成 {user_id: [keyword, ...]}
+
+        normalized 是正規化後的訊息，用於判斷表達式中的正規表示式；
+        skip_users 是已被頻道／發言者篩選排除的用戶。
+        """
+        hits = {}
+        excluded = set()
+        skip_users = skip_users or ()
+        candidates = set(self._always)
+        for pattern_id in pattern_ids:
+            for user_id, position, keyword in self._owners[pattern_id]:
+                if user_id not in skip_users:
+                    hits.setdefault(user_id, []).append((position, keyword))
+            candidates.update(self._triggers.get(pattern_id, ()))
+            if pattern_id in self._excluders:
+                excluded.update(self._excluders[pattern_id])
+
+        if candidates:
+            pattern_ids = pattern_ids if isinstance(pattern_ids, (set, frozenset)) else set(pattern_ids)
+            for expression_id in candidates:
+                user_id, position, keyword, node = self._expressions[expression_id]
+                if user_id not in excluded and user_id not in skip_users and node.evaluate(pattern_ids, normalized):
+                    hits.setdefault(user_id, []).append((position, keyword))
+
+        # 排除關鍵字在通知送出前取消匹配
+        for user_id in excluded:
+            if hits.pop(user_id, None) is not None:
+                self.stats["excluded"] += 1
+        return {user_id: [keyword for _, keyword in sorted(entries)] for user_id, entries in hits.items()}
+
+    @property
+    def has_exclusions(self):
+        return bool(self._excluders)
+
+    def excluded_users(self, pattern_ids):
+        """訊息包含排除關鍵字的用戶（用於價格提醒、關注玩家等不經過 resolve 的匹配）"""
+        excluded = set()
+        for pattern_id in pattern_ids:
+            excluded.update(self._excluders.get(pattern_id, ()))
+        return excluded
+
+    def match(self, text, normalized=None, skip_users=None):
+        """比對單條訊息，回傳 {user_id: [keyword, ...]}
+
+        訊息已經正規化過時傳入 normalized，避免重複計算。
+        """
+        if normalized is None:
+            normalized = normalize_text(text)
+        return self.resolve(self.match_ids(normalized), normalized, skip_users)
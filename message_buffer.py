@@ -0,0 +1,75 @@
+"""
+記憶體訊息緩衝區
+
+為每條訊息配發遞增序號，讀取者以序號作為游標分頁讀取，讀取不會清除或
+影響其他讀取者（監控任務、Web API、Discord 測試指令）。
+"""
+import itertools
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_channel(channel):
+    """把 '3362'、'[3362]'、3362 統一成 '3362' 的比較格式"""
+    value = str(channel).strip().strip('[]')
+    return value.zfill(4) if value.isdigit() else value
+
+
+class MessageBuffer:
+    """固定容量、以序號定位的訊息環形緩衝區"""
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self._messages = deque(maxlen=capacity)
+        self.latest_seq = 0
+
+    def __len__(self):
+        return len(self._messages)
+
+    @property
+    def first_seq(self):
+        return self._messages[0]['seq'] if self._messages else self.latest_seq + 1
+
+    def append(self, message_data):
+        """加入訊息並回傳配發的序號"""
+        self.latest_seq += 1
+        message_data['seq'] = self.latest_seq
+        self._messages.append(message_data)
+        return self.latest_seq
+
+    def restore(self, messages, latest_seq):
+        """以快照還原緩衝區，保留原本的序號讓讀取者的游標繼續有效"""
+        self._messages.clear()
+        self._messages.extend(messages[-self.capacity:])
+        self.latest_seq = max(latest_seq, self._messages[-1]['seq'] if self._messages else 0)
+
+    def recent(self, limit=10):
+        """回傳最新的 limit 條訊息（由舊到新）"""
+        if limit <= 0:
+            return []
+        return list(itertools.islice(self._messages, max(0, len(self._messages) - limit), None))
+
+    def since(self, since=0, limit=50, channel=None, username=None):
+        """讀取序號大於 since 的訊息
+
+        回傳 (messages, next_since, has_more)。有篩選條件時 next_since 是最後一條
+        「被檢查過」的訊息序號，下一頁不會重複掃描已略過的訊息。
+        """
+        start = max(0, since + 1 - self.first_seq)
+        channel = normalize_channel(channel) if channel else None
+        messages = []
+        next_since = max(since, self.first_seq - 1)
+        has_more = False
+        for message_data in itertools.islice(self._messages, start, None):
+            if len(messages) >= limit:
+                has_more = True
+                break
+            next_since = message_data['seq']
+            if channel and normalize_channel(message_data.get('channel', '')) != channel:
+                continue
+            if username and message_data.get('username') != username:
+                continue
+            messages.append(message_data)
+        return messages, next_since, has_more
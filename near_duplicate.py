@@ -0,0 +1,163 @@
+"""
+近似重複訊息抑制
+
+洗版廣告常常只改一個表情符號、空白或價格就重新發送，精確雜湊去重擋不住。
+這裡對每條訊息計算 64 位元 SimHash 指紋（數字與符號先去除，價格改變也
+視為同一則廣告），並為每位用戶維護一段時間內已送出通知的指紋。指紋依
+漢明距離上限切成多個區段建立索引：距離在上限內的兩個指紋至少有一個區段
+完全相同，因此只需要比較落在同一區段桶內的候選，而不是整個視窗。
+"""
+import hashlib
+import logging
+import re
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_BITS = 64
+MIN_SIMILARITY = 0.75
+DEFAULT_SIMILARITY = 0.9
+DEFAULT_WINDOW_MINUTES = 10
+
+DIGITS_PATTERN = re.compile(r'\d+')
+NON_WORD_PATTERN = re.compile(r'[\W_]+')
+
+
+def canonical_text(normalized):
+    """去除空白、符號與表情，數字一律視為相同"""
+    return NON_WORD_PATTERN.sub('', DIGITS_PATTERN.sub('0', normalized))
+
+
+def _shingles(text, size=2):
+    if len(text) <= size:
+        return [text] if text else []
+    return [text[i:i + size] for i in range(len(text) - size + 1)]
+
+
+def simhash(normalized):
+    """計算正規化訊息的 64 位元 SimHash 指紋"""
+    weights = [0] * FINGERPRINT_BITS
+    for shingle in _shingles(canonical_text(normalized)):
+        value = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'big')
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def similarity(a, b):
+    return 1 - hamming_distance(a, b) / FINGERPRINT_BITS
+
+
+class NearDuplicateWindow:
+    """一位用戶在滑動時間視窗內已送出通知的指紋"""
+
+    def __init__(self, similarity=DEFAULT_SIMILARITY, window_seconds=DEFAULT_WINDOW_MINUTES * 60):
+        self.similarity = similarity
+        self.window_seconds = window_seconds
+        self.max_distance = int((1 - similarity) * FINGERPRINT_BITS)
+        # 切成 max_distance + 1 個區段（鴿籠原理保證至少一段相同）
+        bands = min(self.max_distance + 1, FINGERPRINT_BITS)
+        bounds = [round(i * FINGERPRINT_BITS / bands) for i in range(bands + 1)]
+        self._bands = [(low, (1 << (high - low)) - 1) for low, high in zip(bounds, bounds[1:])]
+        self._tables = [{} for _ in self._bands]
+        self._entries = deque()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _band_keys(self, fingerprint):
+        return [fingerprint >> shift & mask for shift, mask in self._bands]
+
+    def _expire(self, now):
+        while self._entries and self._entries[0][0] <= now:
+            _, fingerprint = self._entries.popleft()
+            for table, key in zip(self._tables, self._band_keys(fingerprint)):
+                bucket = table[key]
+                bucket[fingerprint] -= 1
+                if not bucket[fingerprint]:
+                    del bucket[fingerprint]
+                    if not bucket:
+                        del table[key]
+
+    def find(self, fingerprint, now=None):
+        """回傳視窗內最相似且達到門檻的指紋，沒有時回傳 None"""
+        self._expire(time.time() if now is None else now)
+        checked = set()
+        for table, key in zip(self._tables, self._band_keys(fingerprint)):
+            for candidate in table.get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if hamming_distance(candidate, fingerprint) <= self.max_distance:
+                    return candidate
+        return None
+
+    def add(self, fingerprint, now=None):
+        now = time.time() if now is None else now
+        self._expire(now)
+        self._entries.append((now + self.window_seconds, fingerprint))
+        for table, key in zip(self._tables, self._band_keys(fingerprint)):
+            bucket = table.setdefault(key, {})
+            bucket[fingerprint] = bucket.get(fingerprint, 0) + 1
+
+
+class NearDuplicateFilter:
+    """每位用戶各自設定的近似重複抑制
+
+    settings 格式為 {user_id: {"similarity": 0.9, "minutes": 10}}。
+    """
+
+    def __init__(self, settings=None):
+        self._windows = {}
+        self.suppressed = {}
+        self.stats = {"suppressed": 0}
+        for user_id, setting in (settings or {}).items():
+            self.configure(user_id, setting.get("similarity", DEFAULT_SIMILARITY),
+                           setting.get("minutes", DEFAULT_WINDOW_MINUTES))
+
+    @property
+    def active(self):
+        return bool(self._windows)
+
+    def configure(self, user_id, similarity=DEFAULT_SIMILARITY, minutes=DEFAULT_WINDOW_MINUTES):
+        if not MIN_SIMILARITY <= similarity <= 1:
+            raise ValueError(f"相似度必須介於 {int(MIN_SIMILARITY * 100)}% 到 100% 之間")
+        if minutes <= 0:
+            raise ValueError("時間視窗必須大於 0 分鐘")
+        window = self._windows.get(user_id)
+        if window is not None and window.similarity == similarity and window.window_seconds == minutes * 60:
+            return
+        self._windows[user_id] = NearDuplicateWindow(similarity, minutes * 60)
+
+    def users(self):
+        return set(self._windows)
+
+    def remove(self, user_id):
+        self._windows.pop(user_id, None)
+
+    def should_suppress(self, user_id, fingerprint, now=None):
+        """已送過相似訊息時回傳 True 並計數；只檢查，送出後再呼叫 record"""
+        window = self._windows.get(user_id)
+        if window is None:
+            return False
+        now = time.time() if now is None else now
+        if window.find(fingerprint, now) is not None:
+            self.suppressed[user_id] = self.suppressed.get(user_id, 0) + 1
+            self.stats["suppressed"] += 1
+            return True
+        return False
+
+    def record(self, user_id, fingerprint, now=None):
+        """記錄已交給通知佇列的訊息指紋"""
+        window = self._windows.get(user_id)
+        if window is not None:
+            window.add(fingerprint, time.time() if now is None else now)
@@ -0,0 +1,49 @@
+"""
+訊息文字正規化
+
+每條公頻訊息只正規化一次（NFKC、大小寫摺疊、標點壓縮、簡繁摺疊），結果
+存在訊息的 'normalized' 欄位供所有比對使用；關鍵字在訂閱時以相同規則
+正規化，因此 １：５ 與 1:5、卖 與 賣 會被視為相同。
+"""
+import os
+import re
+import unicodedata
+
+# 設定 CHINESE_FOLDING=0 可關閉簡繁摺疊
+FOLD_CHINESE = os.getenv('CHINESE_FOLDING', '1') == '1'
+
+# 交易訊息常見的簡體字 → 繁體字
+SIMPLIFIED_TO_TRADITIONAL = str.maketrans({
+    '卖': '賣', '买': '買', '换': '換', '价': '價', '议': '議', '谈': '談', '钱': '錢', '币': '幣',
+    '万': '萬', '亿': '億', '个': '個', '张': '張', '点': '點', '数': '數', '单': '單', '双': '雙',
+    '枫': '楓', '叶': '葉', '剑': '劍', '击': '擊', '属': '屬', '优': '優', '带': '帶', '头': '頭',
+    '轴': '軸', '运': '運', '长': '長', '绿': '綠', '蓝': '藍', '红': '紅', '图': '圖', '风': '風',
+    '环': '環', '经': '經', '验': '驗', '级': '級', '练': '練', '宠': '寵', '装': '裝', '备': '備',
+    '饰': '飾', '项': '項', '链': '鍊', '书': '書', '药': '藥', '补': '補', '枪': '槍', '锤': '錘',
+    '镖': '鏢', '标': '標', '飞': '飛', '组': '組', '队': '隊', '会': '會', '团': '團', '疗': '療',
+    '问': '問', '讯': '訊', '频': '頻', '无': '無', '号': '號', '发': '發', '这': '這', '么': '麼',
+    '来': '來', '们': '們', '请': '請', '谢': '謝', '还': '還', '进': '進', '满': '滿', '卫': '衛',
+    '赛': '賽', '战': '戰', '斗': '鬥', '灵': '靈', '龙': '龍', '鸟': '鳥', '鱼': '魚', '马': '馬',
+    '贵': '貴', '减': '減', '够': '夠', '购': '購',
+})
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+REPEATED_PUNCTUATION_PATTERN = re.compile(r'([^\w\s])\1+')
+
+
+def fold_chinese(text):
+    """把常見簡體字轉成繁體字"""
+    return text.translate(SIMPLIFIED_TO_TRADITIONAL) if FOLD_CHINESE else text
+
+
+def normalize_text(text):
+    """訊息與關鍵字共用的正規化規則"""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = fold_chinese(text)
+    text = WHITESPACE_PATTERN.sub(' ', text).strip()
+    return REPEATED_PUNCTUATION_PATTERN.sub(r'\1', text)
+
+
+def normalize_regex(source):
+    """正規表示式只做 NFKC 與簡繁摺疊，避免大小寫摺疊改變 \\D、\\S 等語法"""
+    return fold_chinese(unicodedata.normalize('NFKC', source))
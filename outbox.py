@@ -0,0 +1,316 @@
+"""
+持久化的通知發送佇列
+
+Discord 無法連線或嚴重限速時，待送的通知先放在記憶體佇列；超過上限後改為
+附加寫入磁碟上的分段日誌（segment log），讓長時間中斷時記憶體用量仍有上限。
+發送成功後確認（ack），確認游標寫入 cursor 檔，完全確認過的分段直接刪除。
+重新啟動時從游標位置重播尚未確認的通知；關閉時記憶體中尚未送出的通知
+也會寫入日誌。分段日誌的每筆紀錄是 長度(4) CRC32(4) JSON，寫到一半的
+紀錄在讀取時會被忽略。
+
+OutboxDispatcher 把佇列中的通知依目的地（頻道、webhook 或用戶）分派給
+各自的工作任務：同一目的地依序發送，不同目的地並行，一個 webhook 等待
+限速重置或重試時不會擋住其他目的地。
+"""
+import asyncio
+import json
+import logging
+import os
+import struct
+import zlib
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct('>II')
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+CURSOR_FILE = 'cursor'
+
+
+def _segment_name(segment_id):
+    return f"{SEGMENT_PREFIX}{segment_id:08d}{SEGMENT_SUFFIX}"
+
+
+class NotificationOutbox:
+    """記憶體優先、超過 memory_limit 時溢寫到磁碟的 FIFO 佇列
+
+    每筆通知是可以 JSON 序列化的 dict；從磁碟讀回的通知帶有 '_disk' 欄位
+    （所在分段與結束位置），確認時以此推進游標。確認可以不依讀出的順序，
+    游標只推進到最前面一則尚未確認的通知之前。
+    """
+
+    def __init__(self, directory, memory_limit=1000, segment_bytes=4 << 20):
+        self.directory = directory
+        self.memory_limit = memory_limit
+        self.segment_bytes = segment_bytes
+        self._memory = deque()
+        self._ready = asyncio.Event()
+        self._writer = None
+        self._opened = False
+        self._unacked = OrderedDict()  # 從磁碟讀出、尚未推進游標的位置 -> 是否已確認
+        self.pending_disk = 0
+        self.stats = {"enqueued": 0, "delivered": 0, "spilled": 0, "replayed": 0, "failed": 0}
+
+    def open(self):
+        """建立目錄並載入上次尚未送出的通知；第一次使用時才執行，建立物件不會碰到磁碟"""
+        if self._opened:
+            return
+        self._opened = True
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self._segments()
+        self._cursor = self._load_cursor(segments)
+        self._read_pos = self._cursor
+        # 上次可能寫到一半就中斷，新的通知一律寫到新的分段
+        self._write_segment = max(segments[-1] + 1 if segments else 0, self._cursor[0])
+        self._write_size = 0
+        self.pending_disk = self._count_pending()
+        if self.pending_disk:
+            self.stats["replayed"] = self.pending_disk
+            logger.info(f"📮 通知佇列有 {self.pending_disk} 則尚未送出的通知，將重新發送")
+            self._ready.set()
+
+    # ---- 磁碟 ----
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _segments(self):
+        return sorted(
+            int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _segment_size(self, segment_id):
+        try:
+            return os.path.getsize(self._path(_segment_name(segment_id)))
+        except OSError:
+            return 0
+
+    def _load_cursor(self, segments):
+        try:
+            with open(self._path(CURSOR_FILE), 'r') as f:
+                segment_id, offset = map(int, f.read().split())
+            return segment_id, offset
+        except (OSError, ValueError):
+            return (segments[0] if segments else 0), 0
+
+    def _save_cursor(self):
+        tmp_path = self._path(CURSOR_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(f"{self._cursor[0]} {self._cursor[1]}")
+        os.replace(tmp_path, self._path(CURSOR_FILE))
+
+    def _read_records(self, position, limit):
+        """從 position 開始讀取最多 limit 筆紀錄，回傳 [(entry, 結束位置), ...]"""
+        records = []
+        segment_id, offset = position
+        while len(records) < limit and (segment_id, offset) < (self._write_segment, self._write_size):
+            path = self._path(_segment_name(segment_id))
+            if not os.path.exists(path):
+                segment_id, offset = segment_id + 1, 0
+                continue
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                while len(records) < limit:
+                    header = f.read(RECORD_HEADER.size)
+                    if len(header) < RECORD_HEADER.size:
+                        break
+                    length, checksum = RECORD_HEADER.unpack(header)
+                    payload = f.read(length)
+                    if len(payload) < length or zlib.crc32(payload) != checksum:
+                        logger.warning(f"⚠️ 通知佇列分段 {segment_id} 在位置 {offset} 之後損毀，略過其餘內容")
+                        offset = self._segment_size(segment_id)
+                        break
+                    offset += RECORD_HEADER.size + length
+                    records.append((json.loads(payload), (segment_id, offset)))
+            if len(records) < limit and segment_id < self._write_segment:
+                segment_id, offset = segment_id + 1, 0
+            elif len(records) < limit:
+                break
+        self._read_pos = (segment_id, offset)
+        return records
+
+    def _count_pending(self):
+        count = 0
+        position = self._read_pos
+        while True:
+            records = self._read_records(position, 1000)
+            if not records:
+                break
+            count += len(records)
+            position = self._read_pos
+        self._read_pos = self._cursor
+        return count
+
+    def _append(self, entry):
+        if self._writer is None or self._write_size >= self.segment_bytes:
+            if self._writer is not None:
+                self._writer.close()
+                self._write_segment += 1
+                self._write_size = 0
+            self._writer = open(self._path(_segment_name(self._write_segment)), 'ab')
+        payload = json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode()
+        self._writer.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._writer.flush()
+        self._write_size += RECORD_HEADER.size + len(payload)
+        self.pending_disk += 1
+
+    def _compact(self):
+        """刪除已完全確認的分段；全部確認時從新的分段重新開始"""
+        for segment_id in self._segments():
+            if segment_id < self._cursor[0]:
+                os.remove(self._path(_segment_name(segment_id)))
+        if self._cursor == (self._write_segment, self._write_size) and self._write_size:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            os.remove(self._path(_segment_name(self._write_segment)))
+            self._write_segment += 1
+            self._write_size = 0
+            self._cursor = self._read_pos = (self._write_segment, 0)
+            self._save_cursor()
+
+    # ---- 佇列 ----
+
+    def __len__(self):
+        return len(self._memory) + self.pending_disk
+
+    def put(self, entry):
+        """加入一則通知；磁碟上還有待送通知時也寫到磁碟，維持先進先出"""
+        self.open()
+        self.stats["enqueued"] += 1
+        if self.pending_disk == 0 and len(self._memory) < self.memory_limit:
+            self._memory.append(entry)
+        else:
+            self._append(entry)
+            self.stats["spilled"] += 1
+        self._ready.set()
+
+    def requeue(self, entry):
+        """發送失敗的通知放回佇列最前面，稍後重試"""
+        self._memory.appendleft(entry)
+        self._ready.set()
+
+    async def get(self):
+        self.open()
+        while True:
+            if not self._memory and self.pending_disk:
+                # 從磁碟補充一批（最多半個記憶體上限）
+                for entry, position in self._read_records(self._read_pos, max(1, self.memory_limit // 2)):
+                    entry['_disk'] = position
+                    self._unacked[position] = False
+                    self._memory.append(entry)
+                    self.pending_disk -= 1
+            if self._memory:
+                return self._memory.popleft()
+            self._ready.clear()
+            await self._ready.wait()
+
+    def ack(self, entry, delivered=True):
+        """確認通知已處理（delivered=False 表示永久失敗，不再重試）"""
+        self.stats["delivered" if delivered else "failed"] += 1
+        position = entry.get('_disk')
+        if position is None or position not in self._unacked:
+            return
+        self._unacked[position] = True
+        position = None
+        while self._unacked and next(iter(self._unacked.values())):
+            position, _ = self._unacked.popitem(last=False)
+        if position is None:
+            return
+        segment_id, offset = position
+        if segment_id < self._write_segment and offset >= self._segment_size(segment_id):
+            segment_id, offset = segment_id + 1, 0
+        self._cursor = (segment_id, offset)
+        self._save_cursor()
+        self._compact()
+
+    def close(self):
+        """把記憶體中尚未寫入磁碟的通知寫入日誌，下次啟動時重新發送"""
+        if self._memory:
+            self.open()
+        spilled = 0
+        while self._memory:
+            entry = self._memory.popleft()
+            if '_disk' not in entry:
+                self._append(entry)
+                spilled += 1
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if spilled:
+            logger.info(f"📮 已把 {spilled} 則尚未送出的通知寫入 {self.directory}")
+
+
+class OutboxDispatcher:
+    """依目的地並行發送佇列中的通知
+
+    key(entry) 決定目的地；deliver(entry) 是協程，回傳 True（送達）或 False
+    （無法送達，不再重試），拋出例外表示暫時無法發送，該目的地以指數退避
+    重試。同時在處理中的通知最多 max_in_flight 則。
+    """
+
+    def __init__(self, outbox, deliver, key, max_in_flight=200, max_delay=60):
+        self.outbox = outbox
+        self.deliver = deliver
+        self.key = key
+        self.max_in_flight = max_in_flight
+        self.max_delay = max_delay
+        self._queues = {}
+        self._workers = {}
+        self.stats = {"retries": 0, "peak_destinations": 0}
+
+    @property
+    def destinations(self):
+        return len(self._queues)
+
+    async def run(self):
+        """從佇列取出通知並分派；取消時停止所有目的地，尚未送出的通知放回佇列"""
+        slots = asyncio.Semaphore(self.max_in_flight)
+        try:
+            while True:
+                await slots.acquire()
+                entry = await self.outbox.get()
+                key = self.key(entry)
+                queue = self._queues.setdefault(key, deque())
+                queue.append(entry)
+                worker = self._workers.get(key)
+                if worker is None or worker.done():
+                    self._workers[key] = asyncio.create_task(self._work(key, queue, slots))
+                    self.stats["peak_destinations"] = max(self.stats["peak_destinations"], len(self._queues))
+        finally:
+            await self._stop()
+
+    async def _work(self, key, queue, slots):
+        delay = 1
+        while queue:
+            entry = queue[0]
+            try:
+                delivered = await self.deliver(entry)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["retries"] += 1
+                logger.warning(f"⏳ {key} 暫時無法發送，{delay} 秒後重試（此目的地待送 {len(queue)} 則）: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_delay)
+                continue
+            delay = 1
+            queue.popleft()
+            self.outbox.ack(entry, delivered)
+            slots.release()
+        del self._queues[key]
+        del self._workers[key]
+
+    async def _stop(self):
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for queue in self._queues.values():
+            for entry in reversed(queue):
+                self.outbox.requeue(entry)
+        self._queues.clear()
+        self._workers.clear()
@@ -0,0 +1,98 @@
+"""
+多核心關鍵字比對
+
+把訊息批次分給 ProcessPoolExecutor 的工作行程，讓比對不佔用 Discord
+事件迴圈的執行緒。編譯好的自動機會寫成快照檔廣播給所有工作行程，
+訂閱變更時只需寫出新版本，工作行程在下一個批次自動重新載入。
+"""
+import asyncio
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 工作行程內快取的自動機（每個行程各自一份）
+_worker_state = {'version': None, 'automaton': None}
+
+
+def _load_automaton(path, version):
+    if _worker_state['version'] != version:
+        with open(path, 'rb') as f:
+            _worker_state['automaton'] = pickle.load(f)
+        _worker_state['version'] = version
+    return _worker_state['automaton']
+
+
+def _match_chunk(path, version, texts):
+    """在工作行程中比對一批已正規化的訊息，回傳每條訊息命中的模式編號"""
+    automaton = _load_automaton(path, version)
+    return [tuple(automaton.find(text)) for text in texts]
+
+
+class ParallelMatcher:
+    """以行程池執行批次比對"""
+
+    def __init__(self, workers=None, min_chunk=64):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_chunk = min_chunk
+        self.version = None
+        self._snapshot_dir = tempfile.mkdtemp(prefix="keyword_automaton_")
+        self._snapshot_path = None
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        logger.info(f"🧵 平行比對已啟用: {self.workers} 個工作行程")
+
+    def update(self, index):
+        """廣播新的訂閱索引給工作行程"""
+        if index.version == self.version:
+            return
+        path = os.path.join(self._snapshot_dir, f"automaton-{index.version}.pkl")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(index.automaton, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        # 只保留前一版快照，給還在處理舊批次的工作行程使用
+        for name in os.listdir(self._snapshot_dir):
+            old_path = os.path.join(self._snapshot_dir, name)
+            if old_path not in (path, self._snapshot_path):
+                os.remove(old_path)
+        self._snapshot_path = path
+        self.version = index.version
+        logger.info(f"📡 已廣播關鍵字自動機 v{index.version}: {len(index)} 個關鍵字")
+
+    def _chunks(self, texts):
+        size = max(self.min_chunk, -(-len(texts) // self.workers))
+        return [texts[i:i + size] for i in range(0, len(texts), size)]
+
+    async def match_batch(self, index, texts):
+        """比對一批正規化後的訊息，回傳與 texts 對應的模式編號列表"""
+        self.update(index)
+        loop = asyncio.get_running_loop()
+        futures = [
+            loop.run_in_executor(self._executor, _match_chunk, self._snapshot_path, self.version, chunk)
+            for chunk in self._chunks(texts)
+        ]
+        results = []
+        for chunk_result in await asyncio.gather(*futures):
+            results.extend(chunk_result)
+        return results
+
+    def map_batch(self, index, texts):
+        """同步版本的 match_batch（供基準測試使用）"""
+        self.update(index)
+        futures = [
+            self._executor.submit(_match_chunk, self._snapshot_path, self.version, chunk)
+            for chunk in self._chunks(texts)
+        ]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        shutil.rmtree(self._snapshot_dir, ignore_errors=True)
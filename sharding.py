@@ -0,0 +1,72 @@
+"""
+分片與訂閱分割
+
+機器人以多個行程執行時，每個行程負責一組 Discord 分片，並只比對「主要
+伺服器」落在自己分片上的用戶。用戶的主要伺服器是設定通知頻道的伺服器，
+沒有設定時為第一次使用指令的伺服器；只用私訊的用戶由負責分片 0 的行程處理。
+"""
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def shard_for_guild(guild_id, shard_count):
+    """Discord 的分片計算方式"""
+    return (guild_id >> 22) % shard_count
+
+
+def parse_shard_ids(text):
+    """把 '0,1' 或 '0-3' 解析成分片編號列表"""
+    shard_ids = set()
+    for part in (text or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        low, _, high = part.partition('-')
+        shard_ids.update(range(int(low), int(high or low) + 1))
+    return sorted(shard_ids)
+
+
+class ShardPartition:
+    """本行程負責的分片，以及據此判斷的用戶歸屬"""
+
+    def __init__(self, shard_count=None, shard_ids=None):
+        self.shard_count = shard_count
+        self.shard_ids = list(shard_ids) if shard_ids else None
+        if self.shard_ids and not self.shard_count:
+            raise ValueError("指定 SHARD_IDS 時必須同時設定 SHARD_COUNT")
+        self._owned = set(self.shard_ids or ())
+
+    @classmethod
+    def from_env(cls):
+        shard_count = int(os.getenv('SHARD_COUNT', 0)) or None
+        shard_ids = parse_shard_ids(os.getenv('SHARD_IDS')) or None
+        return cls(shard_count, shard_ids)
+
+    @property
+    def enabled(self):
+        """只負責部分分片時才需要分割訂閱"""
+        return bool(self.shard_ids) and len(self.shard_ids) < self.shard_count
+
+    def owns_guild(self, guild_id):
+        return not self.enabled or shard_for_guild(guild_id, self.shard_count) in self._owned
+
+    def owns_user(self, user_id, home_guild=None):
+        if not self.enabled:
+            return True
+        if home_guild is None:
+            return 0 in self._owned
+        return self.owns_guild(home_guild)
+
+    def filter(self, mapping, home_guilds):
+        """只保留本行程負責的用戶 {user_id: ...}"""
+        if not self.enabled:
+            return mapping
+        return {user_id: value for user_id, value in mapping.items()
+                if self.owns_user(user_id, home_guilds.get(user_id))}
+
+    def describe(self):
+        if not self.shard_ids:
+            return f"自動（{self.shard_count} 個分片）" if self.shard_count else "單一行程"
+        return f"{', '.join(map(str, self.shard_ids))} / {self.shard_count}"
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Artale 公頻合成訊息產生器
+
+在沒有 WebSocket 連線時提供可重現的測試訊息來源，也可以作為壓力測試的輸入，
+以每秒數萬條的速度把訊息送進處理管線而不需要連網。
+"""
+import argparse
+import asyncio
+import atexit
+import bisect
+import itertools
+import logging
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# 預設詞彙（依常見程度排序，Zipf 分佈的排名即為此順序）
+DEFAULT_ITEMS = [
+    "雪", "楓葉", "拳套", "武器", "披風", "耳環", "手套", "鞋子", "腰帶", "帽子",
+    "盾牌", "卷軸", "拉圖斯腰帶", "扎昆頭盔", "黑色皮鞋", "綠色法師帽", "藍色長袍",
+    "力量卷軸", "敏捷卷軸", "智力卷軸", "幸運卷軸", "攻擊卷軸", "魔力卷軸",
+]
+DEFAULT_STATS = ["攻擊10%", "攻擊60%", "魔攻10%", "敏捷", "力量", "+7", "+5", "全屬"]
+DEFAULT_INTENTS = ["收", "賣", "換", "買"]
+DEFAULT_TEMPLATES = [
+    "{intent}{item}{stat} 1:{price}雪",
+    "{channel}頻{cave}洞{intent}{item}{stat} 1:{price}雪/{intent}{item2}談價",
+    "{intent}{item} 1:{price} 大量{intent}購",
+    "{intent}{stat}{item} 屬性優秀 價格面議",
+    "組隊打扎昆 缺坦克和治療",
+    "公會招募 歡迎新手加入",
+    "{intent}{item} 私訊 {channel}頻",
+]
+# 指定種子時虛擬時鐘的預設起點，讓相同種子在任何時候執行都產生相同的時間戳
+DEFAULT_START_TIME = datetime(2026, 1, 1)
+
+
+class ChatSimulator:
+    """以固定種子產生可重現的公頻訊息
+
+    產生的格式與 wss://api.pal.tw 推送的原始訊息相同（channel / username /
+    text / timestamp），因此可以直接交給 KeywordCatcher.process_message。
+    物品依 Zipf 分佈抽樣，讓常見關鍵字的出現頻率接近真實公頻。
+    時間戳來自從 start_time 起算的虛擬時鐘；指定種子而沒有指定 start_time 時
+    從 DEFAULT_START_TIME 開始，沒有種子時從現在開始。
+    """
+
+    def __init__(self, seed=None, rate=10.0, items=None, stats=None, intents=None,
+                 templates=None, zipf_s=1.1, channels=(1, 4000), usernames=None,
+                 user_count=500, start_time=None):
+        self.seed = seed
+        self.rate = float(rate)
+        self.items = list(items or DEFAULT_ITEMS)
+        self.stats = list(stats or DEFAULT_STATS)
+        self.intents = list(intents or DEFAULT_INTENTS)
+        self.templates = list(templates or DEFAULT_TEMPLATES)
+        self.channels = channels
+        self.usernames = list(usernames) if usernames else [
+            f"玩家{i:04d}#{1000 + (i * 7919) % 9000}" for i in range(user_count)
+        ]
+        self.start_time = start_time or (DEFAULT_START_TIME if seed is not None else datetime.now())
+        self.generated = 0
+        self._random = random.Random(seed)
+        self._item_cum_weights = list(itertools.accumulate(
+            1.0 / (rank ** zipf_s) for rank in range(1, len(self.items) + 1)
+        ))
+        self._poll_started = None
+        self._poll_emitted = 0
+
+    def _zipf_item(self):
+        """依 Zipf 權重抽一個物品"""
+        total = self._item_cum_weights[-1]
+        index = bisect.bisect_right(self._item_cum_weights, self._random.random() * total)
+        return self.items[min(index, len(self.items) - 1)]
+
+    def next_message(self):
+        """產生下一條原始訊息"""
+        rnd = self._random
+        channel = rnd.randint(self.channels[0], self.channels[1])
+        text = rnd.choice(self.templates).format(
+            intent=rnd.choice(self.intents),
+            item=self._zipf_item(),
+            item2=self._zipf_item(),
+            stat=rnd.choice(self.stats),
+            price=rnd.randint(1, 200),
+            channel=channel,
+            cave=rnd.randint(1, 9),
+        )
+        # 時間戳使用虛擬時鐘，相同種子產生完全相同的訊息序列
+        timestamp = self.start_time + timedelta(seconds=self.generated / self.rate) if self.rate > 0 else self.start_time
+        self.generated += 1
+        return {
+            'channel': channel,
+            'username': rnd.choice(self.usernames),
+            'text': text,
+            'timestamp': timestamp.isoformat(),
+        }
+
+    def generate(self, count):
+        """一次產生 count 條訊息"""
+        return [self.next_message() for _ in range(count)]
+
+    def poll(self):
+        """回傳自上次呼叫以來依速率應產生的訊息（用於定時抓取）"""
+        now = time.monotonic()
+        if self._poll_started is None:
+            self._poll_started = now
+        due = int((now - self._poll_started) * self.rate) - self._poll_emitted
+        if due <= 0:
+            return []
+        self._poll_emitted += due
+        return self.generate(due)
+
+    async def run(self, handler, duration=None, batch_size=500):
+        """依設定速率持續把訊息批次交給 handler，回傳送出的訊息數
+
+        handler 接收一個訊息列表，可以是一般函式或協程函式。
+        """
+        started = time.monotonic()
+        sent = 0
+        is_coroutine = asyncio.iscoroutinefunction(handler)
+        while duration is None or time.monotonic() - started < duration:
+            elapsed = time.monotonic() - started
+            due = int(elapsed * self.rate) - sent if self.rate > 0 else batch_size
+            if due <= 0:
+                await asyncio.sleep(min(0.01, batch_size / self.rate))
+                continue
+            batch = self.generate(min(due, batch_size))
+            if is_coroutine:
+                await handler(batch)
+            else:
+                handler(batch)
+            sent += len(batch)
+            # 讓出事件迴圈，讓 handler 建立的任務有機會執行
+            await asyncio.sleep(0)
+        return sent
+
+
+def peak_rss_mb():
+    """目前行程的峰值常駐記憶體（MB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 為單位，macOS 以位元組為單位
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+# 壓力測試時寫入的檔案一律放在暫存目錄，結束後刪除，不會被正式的機器人讀到
+SCRATCH_FILES = (
+    ('HISTORY_DB', 'chat_history.db'),
+    ('OUTBOX_DIR', 'outbox'),
+    ('SNAPSHOT_PATH', 'state_snapshot.bin'),
+)
+
+
+def load_pipeline(keywords, users):
+    # 只載入處理管線，不會啟動 Web 服務器或連線 Discord
+    if 'main' not in sys.modules:
+        scratch = tempfile.mkdtemp(prefix='artale_soak_')
+        atexit.register(shutil.rmtree, scratch, True)
+        for name, filename in SCRATCH_FILES:
+            os.environ[name] = os.path.join(scratch, filename)
+    import main
+
+    main.monitored_keywords.update({
+        user_id: keywords[user_id % len(keywords):] + keywords[:user_id % len(keywords)][:2]
+        for user_id in range(1, users + 1)
+    })
+    return main
+
+
+def start_workers(main):
+    """啟動與正式執行相同的歷史寫入任務，並以空的發送端消化通知佇列，
+    讓待寫入的資料不會在記憶體中累積，RSS 只反映比對管線本身"""
+    async def drain_outbox():
+        while True:
+            main.outbox.ack(await main.outbox.get())
+
+    workers = [asyncio.create_task(drain_outbox())]
+    if main.history_store:
+        workers.append(asyncio.create_task(main.history_store.run()))
+    return workers
+
+
+async def stop_workers(main, workers):
+    """等待比對任務完成後停止背景任務"""
+    pending = [t for t in asyncio.all_tasks() if t is not asyncio.current_task() and t not in workers]
+    await asyncio.gather(*pending, return_exceptions=True)
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    if main.history_store:
+        main.history_store.close()
+
+
+async def soak(rate, duration, seed, keywords, users):
+    """把合成訊息送進 KeywordCatcher 管線並回報吞吐量"""
+    main = load_pipeline(keywords, users)
+    simulator = ChatSimulator(seed=seed, rate=rate)
+    catcher = main.keyword_catcher
+
+    def feed(batch):
+        for msg in batch:
+            catcher.process_message(msg)
+
+    workers = start_workers(main)
+    started = time.monotonic()
+    sent = await simulator.run(feed, duration=duration)
+    await stop_workers(main, workers)
+    elapsed = time.monotonic() - started
+    return sent, elapsed
+
+
+async def soak_websocket(rate, duration, seed, keywords, users, frame_size):
+    """經由本機 WebSocket 伺服器以 JSON 陣列訊框突發送入訊息，走與正式連線相同的接收路徑"""
+    import websockets
+
+    main = load_pipeline(keywords, users)
+    catcher = main.keyword_catcher
+    options = main.websocket_options()
+    simulator = ChatSimulator(seed=seed, rate=rate)
+    finished = asyncio.Event()
+    received = 0
+    sent = 0
+
+    async def serve(websocket):
+        async def send_frame(batch):
+            nonlocal sent
+            await websocket.send(json.dumps(batch, ensure_ascii=False))
+            sent += len(batch)
+        await simulator.run(send_frame, duration=duration, batch_size=frame_size)
+        finished.set()
+        await websocket.wait_closed()
+
+    process_message = catcher.process_message
+
+    def counting_process_message(msg):
+        nonlocal received
+        received += 1
+        process_message(msg)
+
+    catcher.process_message = counting_process_message
+    workers = start_workers(main)
+    started = time.monotonic()
+    async with websockets.serve(serve, '127.0.0.1', 0, compression=options['compression']) as server:
+        port = server.sockets[0].getsockname()[1]
+        catcher.ws_url = f"ws://127.0.0.1:{port}"
+        consumer = asyncio.create_task(catcher.connect_websocket())
+        await finished.wait()
+        while received < sent:
+            await asyncio.sleep(0.01)
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+    await stop_workers(main, workers)
+    elapsed = time.monotonic() - started
+    return sent, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Artale 公頻合成訊息產生器")
+    parser.add_argument("--rate", type=float, default=20000, help="每秒訊息數")
+    parser.add_argument("--duration", type=float, default=5, help="執行秒數")
+    parser.add_argument("--seed", type=int, default=42, help="隨機種子")
+    parser.add_argument("--users", type=int, default=100, help="模擬的訂閱用戶數")
+    parser.add_argument("--keywords", default="雪,楓葉,收,賣,拳套,披風,卷軸", help="逗號分隔的關鍵字")
+    parser.add_argument("--print", dest="print_count", type=int, default=0, help="只印出前 N 條訊息")
+    parser.add_argument("--websocket", action="store_true", help="經由本機 WebSocket 以陣列訊框送入（測試接收路徑）")
+    parser.add_argument("--frame-size", type=int, default=500, help="--websocket 時每個訊框的訊息數")
+    args = parser.parse_args()
+
+    if args.print_count:
+        for msg in ChatSimulator(seed=args.seed, rate=args.rate).generate(args.print_count):
+            print(f"[{str(msg['channel']).zfill(4)}] {msg['username']}: {msg['text']}")
+        return
+
+    logging.basicConfig(level=logging.CRITICAL)
+    logging.getLogger().setLevel(logging.CRITICAL)
+    keywords = [k for k in args.keywords.split(",") if k]
+    print(f"🧪 壓力測試: 目標 {args.rate:.0f} 條/秒, {args.duration} 秒, {args.users} 位用戶"
+          + (f", WebSocket 每訊框 {args.frame_size} 條" if args.websocket else ""))
+    load_pipeline(keywords, args.users)
+    baseline_rss = peak_rss_mb()
+    if args.websocket:
+        run = soak_websocket(args.rate, args.duration, args.seed, keywords, args.users, args.frame_size)
+    else:
+        run = soak(args.rate, args.duration, args.seed, keywords, args.users)
+    sent, elapsed = asyncio.run(run)
+    print(f"✅ 共處理 {sent} 條訊息, 耗時 {elapsed:.2f} 秒, 實際 {sent / elapsed:.0f} 條/秒")
+    print(f"📈 峰值 RSS {peak_rss_mb():.1f} MB（載入管線後 {baseline_rss:.1f} MB）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+熱重啟快照
+
+定期把去重複快取、最新訊息緩衝區與讀取游標寫成一個精簡的二進位檔，
+重新部署後在開始接收訊息前還原，避免重送或補發的訊息再次通知所有人。
+
+檔案格式：MAGIC(8) CRC32(4) 長度(4) zlib 壓縮的內容。內容依序為
+最新序號、監控游標、去重複雜湊（每筆 16 位元組 md5）與訊息紀錄（沿用
+chat_bus.py 的二進位紀錄格式）。寫入時先寫暫存檔再 os.replace，讀取時
+CRC 不符或格式錯誤就放棄整個快照，不會還原一半的狀態。
+"""
+import logging
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+from chat_bus import decode_message, encode_message
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'AKCSNAP1'
+FILE_HEADER = struct.Struct('>II')
+STATE_HEADER = struct.Struct('>QQI')
+COUNT = struct.Struct('>I')
+MESSAGE_HEADER = struct.Struct('>QI')
+DIGEST_SIZE = 16
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def encode_snapshot(latest_seq, monitor_cursor, dedup_hashes, messages):
+    """dedup_hashes 為 md5 十六進位字串，messages 為帶有 'seq' 的訊息 dict
+
+    緩衝區訊息的 channel 是顯示用的 "[3362]"，紀錄改存 channel_id 的頻道編號，
+    還原時由 parse_message 重建顯示頻道與完整訊息。
+    """
+    digests = b''.join(bytes.fromhex(message_hash) for message_hash in dedup_hashes)
+    parts = [
+        STATE_HEADER.pack(latest_seq, monitor_cursor, len(digests) // DIGEST_SIZE),
+        digests,
+        COUNT.pack(len(messages)),
+    ]
+    for message_data in messages:
+        record = encode_message(dict(message_data, channel=message_data.get('channel_id', message_data.get('channel'))))
+        parts.append(MESSAGE_HEADER.pack(message_data['seq'], len(record)))
+        parts.append(record)
+    body = zlib.compress(b''.join(parts), 6)
+    return MAGIC + FILE_HEADER.pack(zlib.crc32(body), len(body)) + body
+
+
+def decode_snapshot(data, max_dedup=None, max_messages=None):
+    """解碼快照；只取最新的 max_dedup 筆雜湊與 max_messages 條訊息，讓還原時間有上限"""
+    if data[:len(MAGIC)] != MAGIC:
+        raise SnapshotError("不是有效的快照檔")
+    checksum, length = FILE_HEADER.unpack_from(data, len(MAGIC))
+    body = data[len(MAGIC) + FILE_HEADER.size:]
+    if len(body) != length or zlib.crc32(body) != checksum:
+        raise SnapshotError("快照檔校驗碼不符")
+    payload = zlib.decompress(body)
+
+    try:
+        latest_seq, monitor_cursor, dedup_count = STATE_HEADER.unpack_from(payload)
+        offset = STATE_HEADER.size
+        skip = max(0, dedup_count - max_dedup) if max_dedup is not None else 0
+        dedup_hashes = [
+            payload[offset + i * DIGEST_SIZE:offset + (i + 1) * DIGEST_SIZE].hex()
+            for i in range(skip, dedup_count)
+        ]
+        offset += dedup_count * DIGEST_SIZE
+
+        (message_count,) = COUNT.unpack_from(payload, offset)
+        offset += COUNT.size
+        records = []
+        for _ in range(message_count):
+            seq, size = MESSAGE_HEADER.unpack_from(payload, offset)
+            offset += MESSAGE_HEADER.size
+            records.append((seq, offset, size))
+            offset += size
+        if max_messages is not None:
+            records = records[max(0, len(records) - max_messages):]
+        messages = []
+        for seq, start, size in records:
+            msg = decode_message(payload[start:start + size])
+            msg['seq'] = seq
+            messages.append(msg)
+    except struct.error as e:
+        raise SnapshotError(f"快照內容格式錯誤: {e}")
+
+    return {
+        'latest_seq': latest_seq,
+        'monitor_cursor': monitor_cursor,
+        'dedup_hashes': dedup_hashes,
+        'messages': messages,
+    }
+
+
+def write_snapshot(path, data):
+    """以暫存檔加 os.replace 原子性地取代快照檔（暫存檔名不重複，同時寫入也不會互相覆蓋）"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def read_snapshot(path, max_dedup=None, max_messages=None):
+    """讀取快照，檔案不存在或損毀時回傳 None"""
+    if not os.path.exists(path):
+        return None
+    started = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            state = decode_snapshot(f.read(), max_dedup, max_messages)
+    except (SnapshotError, zlib.error) as e:
+        logger.warning(f"⚠️ 略過無法使用的快照 {path}: {e}")
+        return None
+    state['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return state
@@ -0,0 +1,29 @@
+from audience import CHANNEL_CACHE_SIZE, AudienceIndex, parse_channel_ranges
+
+
+def test_channel_ranges():
+    index = AudienceIndex([1, 2, 3], {
+        1: {"channels": parse_channel_ranges('1-10,5-20,30')},
+        2: {"channels": [[1, 9999]]},
+    })
+    assert index.route(15, 'a')[0] == set()
+    assert index.route(25, 'a')[0] == {1}
+    assert index.route(30, 'a')[0] == set()
+    assert index.route(None, 'a')[0] == {1, 2}
+
+
+def test_channel_cache_is_bounded():
+    index = AudienceIndex([1], {1: {"channels": [[1, 1]]}})
+    for channel in range(CHANNEL_CACHE_SIZE + 100):
+        index.route(channel, 'a')
+    assert len(index._channel_cache) == CHANNEL_CACHE_SIZE
+
+
+def test_speaker_filters_and_watchers():
+    index = AudienceIndex([1, 2], {1: {"deny_speakers": ['洗版仔']}, 2: {"allow_speakers": ['好友#1234']}},
+                          watchers={3: ['好友']})
+    excluded, watchers = index.route(1, '洗版仔#0001')
+    assert excluded == {1, 2}
+    assert watchers == set()
+    assert index.should_drop(excluded, watchers)
+    assert index.route(1, '好友#1234') == (set(), {3})
@@ -0,0 +1,81 @@
+import asyncio
+import importlib
+from collections import OrderedDict
+
+import pytest
+
+
+class InlineMatcher:
+    """與 ParallelMatcher 相同的介面，但在同一個行程內比對"""
+
+    def __init__(self):
+        self.batches = []
+
+    async def match_batch(self, index, texts):
+        self.batches.append(list(texts))
+        return [index.match_ids(text) for text in texts]
+
+
+@pytest.fixture
+def main(monkeypatch, tmp_path):
+    """在暫存目錄載入 main，設定檔與狀態檔都不會寫到專案目錄"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('HISTORY_ENABLED', '0')
+    module = importlib.import_module('main')
+    monkeypatch.setattr(module, 'monitored_keywords', {})
+    monkeypatch.setattr(module, 'excluded_keywords', {})
+    monkeypatch.setattr(module, 'price_alerts', {})
+    monkeypatch.setattr(module, 'watched_players', {})
+    monkeypatch.setattr(module, 'user_filters', {})
+    monkeypatch.setattr(module, 'previous_messages', OrderedDict())
+    monkeypatch.setattr(module, 'parallel_matcher', InlineMatcher())
+    module.mark_keywords_changed()
+    return module
+
+
+def run_batch(main, messages):
+    """以平行比對模式跑一批訊息，回傳每條訊息的比對結果"""
+    catcher = main.KeywordCatcher()
+    notified = []
+
+    async def notify_matches(message_data, matches):
+        notified.append((message_data['text'], matches))
+
+    catcher.notify_matches = notify_matches
+
+    async def run():
+        task = asyncio.create_task(catcher.run_batch_matcher())
+        for username, text in messages:
+            catcher.match_queue.put_nowait(catcher.parse_message({'channel': '3362', 'username': username, 'text': text}))
+        while not catcher.match_queue.empty():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    return dict(notified)
+
+
+def test_exclusions_apply_to_price_alerts(main):
+    main.price_alerts[1] = [{'intent': '賣', 'item': '拳套', 'price': 5}]
+    main.excluded_keywords[1] = ['攻擊']
+    main.mark_keywords_changed()
+
+    notified = run_batch(main, [('玩家', '賣 拳套 攻擊10% 3雪'), ('玩家', '賣 拳套 4雪')])
+    assert '賣 拳套 攻擊10% 3雪' not in notified
+    assert list(notified['賣 拳套 4雪']) == [1]
+
+
+def test_exclusions_apply_without_keyword_scan(main):
+    # 訂閱者都被頻道篩選排除時訊息不會送進行程池，排除關鍵字仍要自行比對
+    main.price_alerts[1] = [{'intent': '賣', 'item': '拳套', 'price': 5}]
+    main.user_filters[1] = {'channels': [[1, 100]]}
+    main.watched_players[2] = ['奸商']
+    main.excluded_keywords[2] = ['攻擊']
+    main.mark_keywords_changed()
+
+    notified = run_batch(main, [('奸商', '賣 拳套 攻擊10% 3雪'), ('奸商', '賣 拳套 4雪')])
+    assert main.parallel_matcher.batches == []
+    assert '賣 拳套 攻擊10% 3雪' not in notified
+    assert list(notified['賣 拳套 4雪']) == [2]
@@ -0,0 +1,51 @@
+import asyncio
+import struct
+
+import pytest
+
+from chat_bus import FRAME_HEADER, MAX_FIELD_SIZE, decode_message, encode_frame, encode_message, read_frame
+
+
+def test_round_trip_keeps_fields():
+    msg = {'channel': 3362, 'username': '玩家#1234', 'text': '賣 拳套 1:5雪', 'timestamp': '2026-01-01T10:00:00', 'normalized': '賣 拳套 1:5雪'}
+    decoded = decode_message(encode_message(msg))
+    assert decoded == msg
+
+
+def test_normalized_is_optional():
+    decoded = decode_message(encode_message({'channel': '12', 'username': 'a', 'text': 'b', 'timestamp': 0}))
+    assert decoded['channel'] == 12
+    assert 'normalized' not in decoded
+
+
+def test_non_numeric_channel_is_dropped():
+    decoded = decode_message(encode_message({'channel': '[3362]', 'username': 'a', 'text': 'b', 'timestamp': 0}))
+    assert decoded['channel'] == ''
+
+
+def test_long_fields_are_truncated():
+    decoded = decode_message(encode_message({'channel': 1, 'username': 'a', 'text': 'x' * (MAX_FIELD_SIZE + 10), 'timestamp': 0}))
+    assert len(decoded['text']) == MAX_FIELD_SIZE
+
+
+def test_unknown_version_is_rejected():
+    record = bytearray(encode_message({'channel': 1, 'username': 'a', 'text': 'b', 'timestamp': 0}))
+    record[0] = 99
+    with pytest.raises(ValueError):
+        decode_message(bytes(record))
+
+
+def test_read_frame():
+    async def read(data):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_frame(reader)
+
+    msg = {'channel': 7, 'username': 'a', 'text': '收 披風', 'timestamp': '2026-01-01T10:00:00'}
+    assert asyncio.run(read(encode_frame(msg))) == msg
+    with pytest.raises(ValueError):
+        asyncio.run(read(FRAME_HEADER.pack(1 << 30)))
+    with pytest.raises(asyncio.IncompleteReadError):
+        asyncio.run(read(encode_frame(msg)[:-1]))
+    assert struct.unpack('>I', encode_frame(msg)[:4])[0] == len(encode_message(msg))
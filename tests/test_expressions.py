@@ -0,0 +1,53 @@
+import pytest
+
+from expressions import ExpressionError, is_expression, validate_expression
+from matcher import SubscriptionIndex
+
+
+def test_is_expression():
+    assert is_expression('拳套 AND 收')
+    assert is_expression('/1:[1-5]雪/')
+    assert not is_expression('拳套')
+    assert not is_expression('ANDROID')
+
+
+@pytest.mark.parametrize('source', ['NOT 賣', '(拳套 AND', '拳套 AND', '/[/'])
+def test_invalid_expressions(source):
+    with pytest.raises(ExpressionError):
+        validate_expression(source)
+
+
+def test_boolean_expression():
+    index = SubscriptionIndex({1: ['拳套 AND (收 OR 買) NOT 賣']})
+    assert index.match('收 拳套 10雪') == {1: ['拳套 AND (收 OR 買) NOT 賣']}
+    assert index.match('買拳套') == {1: ['拳套 AND (收 OR 買) NOT 賣']}
+    assert index.match('賣 拳套 收') == {}
+    assert index.match('收 披風') == {}
+
+
+def test_phrase_and_regex():
+    keyword = '"1:5 雪" OR /1:[1-5]雪/'
+    index = SubscriptionIndex({1: [keyword]})
+    assert index.match('賣 1:5 雪') == {1: [keyword]}
+    assert index.match('收 披風 1:3雪') == {1: [keyword]}
+    assert index.match('收 披風 1:8雪') == {}
+
+
+def test_expressions_and_plain_keywords_together():
+    index = SubscriptionIndex({1: ['披風'], 2: ['披風 AND 收']})
+    assert index.match('收 披風') == {1: ['披風'], 2: ['披風 AND 收']}
+    assert index.match('賣 披風') == {1: ['披風']}
+
+
+@pytest.mark.parametrize('keyword, text', [
+    (r'/收\d{1,3}雪/', '收100雪'),
+    ('/ab{0,1}c/', 'ac'),
+    ('/ab{0,1}c/', 'abc'),
+    ('/拳套{2}/', '拳套套'),
+])
+def test_regex_with_bounded_quantifier(keyword, text):
+    assert SubscriptionIndex({1: [keyword]}).match(text) == {1: [keyword]}
+
+
+def test_regex_with_bounded_quantifier_still_filters():
+    assert SubscriptionIndex({1: [r'/收\d{1,3}雪/']}).match('賣100雪') == {}
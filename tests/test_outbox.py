@@ -0,0 +1,202 @@
+import asyncio
+import os
+
+from outbox import NotificationOutbox, OutboxDispatcher
+
+
+def drain(outbox, count, ack=True):
+    async def take():
+        entries = []
+        for _ in range(count):
+            entry = await outbox.get()
+            if ack:
+                outbox.ack(entry)
+            entries.append(entry)
+        return entries
+    return asyncio.run(take())
+
+
+def test_nothing_touches_disk_until_used(tmp_path):
+    directory = str(tmp_path / 'outbox')
+    outbox = NotificationOutbox(directory)
+    outbox.close()
+    assert not os.path.exists(directory)
+    outbox.put({'i': 0})
+    assert os.path.isdir(directory)
+
+
+def test_spill_keeps_order(tmp_path):
+    outbox = NotificationOutbox(str(tmp_path), memory_limit=2)
+    for i in range(6):
+        outbox.put({'i': i})
+    assert outbox.stats['spilled'] == 4
+    assert [entry['i'] for entry in drain(outbox, 6)] == list(range(6))
+    assert len(outbox) == 0
+
+
+def test_replay_after_restart(tmp_path):
+    outbox = NotificationOutbox(str(tmp_path), memory_limit=10)
+    for i in range(3):
+        outbox.put({'i': i})
+    outbox.close()
+
+    restarted = NotificationOutbox(str(tmp_path))
+    restarted.open()
+    assert len(restarted) == 3
+    assert restarted.stats['replayed'] == 3
+    assert [entry['i'] for entry in drain(restarted, 3)] == [0, 1, 2]
+    restarted.close()
+    assert len(NotificationOutbox(str(tmp_path))) == 0
+
+
+def test_unacked_entries_are_replayed(tmp_path):
+    outbox = NotificationOutbox(str(tmp_path), memory_limit=0)
+    for i in range(4):
+        outbox.put({'i': i})
+    first, second = drain(outbox, 2, ack=False)
+    outbox.ack(second)
+    outbox.close()
+
+    # 第一則沒有確認，游標不能越過它
+    restarted = NotificationOutbox(str(tmp_path))
+    restarted.open()
+    assert [entry['i'] for entry in drain(restarted, len(restarted))] == [0, 1, 2, 3]
+
+
+def test_out_of_order_acks_advance_cursor(tmp_path):
+    outbox = NotificationOutbox(str(tmp_path), memory_limit=0)
+    for i in range(3):
+        outbox.put({'i': i})
+    entries = drain(outbox, 3, ack=False)
+    for entry in reversed(entries):
+        outbox.ack(entry)
+    outbox.close()
+
+    restarted = NotificationOutbox(str(tmp_path))
+    restarted.open()
+    assert len(restarted) == 0
+
+
+def test_torn_record_is_ignored(tmp_path):
+    outbox = NotificationOutbox(str(tmp_path), memory_limit=0)
+    for i in range(3):
+        outbox.put({'i': i})
+    outbox.close()
+    segment = next(name for name in os.listdir(tmp_path) if name.startswith('segment-'))
+    path = os.path.join(tmp_path, segment)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 2)
+
+    restarted = NotificationOutbox(str(tmp_path))
+    restarted.open()
+    assert [entry['i'] for entry in drain(restarted, len(restarted))] == [0, 1]
+
+
+def test_corrupt_record_is_skipped(tmp_path):
+    outbox = NotificationOutbox(str(tmp_path), memory_limit=0)
+    outbox.put({'i': 0})
+    outbox.put({'i': 1})
+    outbox.close()
+    segment = next(name for name in os.listdir(tmp_path) if name.startswith('segment-'))
+    path = os.path.join(tmp_path, segment)
+    with open(path, 'r+b') as f:
+        f.seek(-2, 2)
+        f.write(b'!!')
+
+    restarted = NotificationOutbox(str(tmp_path))
+    restarted.open()
+    assert [entry['i'] for entry in drain(restarted, len(restarted))] == [0]
+
+
+def test_requeue_goes_first(tmp_path):
+    outbox = NotificationOutbox(str(tmp_path))
+    outbox.put({'i': 0})
+    outbox.put({'i': 1})
+    entry = drain(outbox, 1, ack=False)[0]
+    outbox.requeue(entry)
+    assert [entry['i'] for entry in drain(outbox, 2)] == [0, 1]
+    assert outbox.stats['delivered'] == 2
+
+
+def run_dispatcher(outbox, deliver, expected, max_in_flight=10):
+    async def run():
+        dispatcher = OutboxDispatcher(outbox, deliver, lambda entry: entry['key'], max_in_flight=max_in_flight)
+        task = asyncio.create_task(dispatcher.run())
+        while outbox.stats['delivered'] + outbox.stats['failed'] < expected:
+            await asyncio.sleep(0.001)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return dispatcher
+    return asyncio.run(run())
+
+
+def test_dispatcher_keeps_order_per_destination(tmp_path):
+    outbox = NotificationOutbox(str(tmp_path), memory_limit=4)
+    for i in range(30):
+        outbox.put({'key': i % 3, 'i': i})
+    delivered = {0: [], 1: [], 2: []}
+    failed_once = set()
+
+    async def deliver(entry):
+        await asyncio.sleep(0.001 * (3 - entry['key']))
+        if entry['i'] == 4 and 4 not in failed_once:
+            failed_once.add(4)
+            raise OSError("暫時無法發送")
+        delivered[entry['key']].append(entry['i'])
+        return True
+
+    dispatcher = run_dispatcher(outbox, deliver, 30)
+    assert delivered == {key: list(range(key, 30, 3)) for key in range(3)}
+    assert dispatcher.stats['retries'] == 1
+    outbox.close()
+
+    restarted = NotificationOutbox(str(tmp_path))
+    restarted.open()
+    assert len(restarted) == 0
+
+
+def test_blocked_destination_does_not_block_others(tmp_path):
+    outbox = NotificationOutbox(str(tmp_path))
+    outbox.put({'key': 'slow', 'i': 0})
+    for i in range(1, 6):
+        outbox.put({'key': 'fast', 'i': i})
+    order = []
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def deliver(entry):
+            if entry['key'] == 'slow':
+                await gate.wait()
+            order.append(entry['i'])
+            if len(order) == 5:
+                gate.set()
+            return True
+
+        dispatcher = OutboxDispatcher(outbox, deliver, lambda entry: entry['key'])
+        task = asyncio.create_task(dispatcher.run())
+        while outbox.stats['delivered'] < 6:
+            await asyncio.sleep(0.001)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert order == [1, 2, 3, 4, 5, 0]
+
+
+def test_cancel_requeues_pending_entries(tmp_path):
+    outbox = NotificationOutbox(str(tmp_path))
+    for i in range(3):
+        outbox.put({'key': 'a', 'i': i})
+
+    async def run():
+        async def deliver(entry):
+            await asyncio.sleep(3600)
+
+        task = asyncio.create_task(OutboxDispatcher(outbox, deliver, lambda entry: entry['key']).run())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert [entry['i'] for entry in drain(outbox, 3)] == [0, 1, 2]
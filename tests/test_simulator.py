@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from simulator import DEFAULT_START_TIME, ChatSimulator
+
+
+def test_same_seed_same_stream():
+    first = ChatSimulator(seed=7, rate=100).generate(50)
+    second = ChatSimulator(seed=7, rate=100).generate(50)
+    assert first == second
+    assert first[0]['timestamp'] == DEFAULT_START_TIME.isoformat()
+    assert first[1]['timestamp'] == '2026-01-01T00:00:00.010000'
+
+
+def test_start_time_is_injectable():
+    start = datetime(2025, 6, 1, 12, 0)
+    messages = ChatSimulator(seed=7, rate=2, start_time=start).generate(3)
+    assert [m['timestamp'] for m in messages] == ['2025-06-01T12:00:00', '2025-06-01T12:00:00.500000', '2025-06-01T12:00:01']
+    assert [m['text'] for m in messages] == [m['text'] for m in ChatSimulator(seed=7, rate=2).generate(3)]
@@ -0,0 +1,67 @@
+import hashlib
+
+import pytest
+
+from snapshot import SnapshotError, decode_snapshot, encode_snapshot, read_snapshot, write_snapshot
+
+
+def buffered(seq, channel_id, text):
+    """訊息緩衝區中的格式：channel 是顯示用字串，頻道編號在 channel_id"""
+    return {
+        'seq': seq,
+        'text': text,
+        'normalized': text,
+        'full_text': f"[{channel_id:04d}] 玩家: {text}" if channel_id else f" 玩家: {text}",
+        'channel': f"[{channel_id:04d}]" if channel_id else '',
+        'channel_id': channel_id,
+        'username': '玩家',
+        'timestamp': '2026-01-01T10:00:00',
+    }
+
+
+def hashes(count):
+    return [hashlib.md5(str(i).encode()).hexdigest() for i in range(count)]
+
+
+def test_round_trip():
+    messages = [buffered(5, 3362, '賣 拳套'), buffered(6, None, '收 披風')]
+    state = decode_snapshot(encode_snapshot(6, 4, hashes(3), messages))
+    assert state['latest_seq'] == 6
+    assert state['monitor_cursor'] == 4
+    assert state['dedup_hashes'] == hashes(3)
+    assert [(m['seq'], m['channel'], m['text'], m['normalized']) for m in state['messages']] == [
+        (5, 3362, '賣 拳套', '賣 拳套'),
+        (6, '', '收 披風', '收 披風'),
+    ]
+
+
+def test_limits_keep_the_newest_entries():
+    messages = [buffered(seq, 1, f"訊息 {seq}") for seq in range(1, 11)]
+    state = decode_snapshot(encode_snapshot(10, 10, hashes(100), messages), max_dedup=10, max_messages=3)
+    assert state['dedup_hashes'] == hashes(100)[-10:]
+    assert [m['seq'] for m in state['messages']] == [8, 9, 10]
+
+
+def test_corruption_is_detected():
+    data = bytearray(encode_snapshot(1, 1, hashes(2), [buffered(1, 1, '賣 拳套')]))
+    data[-1] ^= 0xFF
+    with pytest.raises(SnapshotError):
+        decode_snapshot(bytes(data))
+    with pytest.raises(SnapshotError):
+        decode_snapshot(b'not a snapshot')
+
+
+def test_read_snapshot(tmp_path):
+    path = str(tmp_path / 'state_snapshot.bin')
+    assert read_snapshot(path) is None
+    write_snapshot(path, encode_snapshot(3, 2, hashes(1), [buffered(3, 12, '賣 拳套')]))
+    state = read_snapshot(path)
+    assert state['messages'][0]['channel'] == 12
+    assert 'elapsed_ms' in state
+
+    with open(path, 'r+b') as f:
+        f.seek(-1, 2)
+        last = f.read(1)[0]
+        f.seek(-1, 2)
+        f.write(bytes([last ^ 0xFF]))
+    assert read_snapshot(path) is None
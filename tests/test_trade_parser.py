@@ -0,0 +1,46 @@
+import pytest
+
+from normalizer import normalize_text
+from trade_parser import PriceAlertIndex, parse_trades
+
+
+def parse(text):
+    return parse_trades(normalize_text(text))
+
+
+@pytest.mark.parametrize('text, intent', [
+    ('收購拳套 10雪', '收'),
+    ('求購拳套 10雪', '收'),
+    ('出售拳套 10雪', '賣'),
+    ('販售拳套 10雪', '賣'),
+])
+def test_compound_intents(text, intent):
+    assert parse(text) == [{'intent': intent, 'item': '拳套', 'stat': None, 'price': 10}]
+
+
+def test_multiple_segments_with_stats_and_ratio_price():
+    assert parse('賣拳套攻擊10% 1:5雪/收+7武器 50雪') == [
+        {'intent': '賣', 'item': '拳套', 'stat': '攻擊10%', 'price': 5},
+        {'intent': '收', 'item': '武器', 'stat': '+7', 'price': 50},
+    ]
+
+
+def test_filler_and_missing_price():
+    assert parse('販售 楓葉 面議') == [{'intent': '賣', 'item': '楓葉', 'stat': None, 'price': None}]
+
+
+def test_unrecognized_segments():
+    assert parse('賣') == []
+    assert parse('組隊 打王') == []
+
+
+def test_price_alerts():
+    alerts = PriceAlertIndex({
+        1: [{'intent': '賣', 'item': '拳套', 'price': 5}],
+        2: [{'intent': '收', 'item': '拳套', 'price': 10}],
+    })
+    assert len(alerts) == 2
+    assert alerts.match(parse('賣 敏捷拳套 4雪')) == {1: ['💰 賣 拳套 ≤ 5']}
+    assert alerts.match(parse('收購拳套 12雪')) == {2: ['💰 收 拳套 ≥ 10']}
+    assert alerts.match(parse('賣拳套 9雪')) == {}
+    assert alerts.match(parse('賣 敏捷拳套 4雪'), skip_users={1}) == {}
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from ws_stream import JsonStreamDecoder, iter_json_elements
+
+
+def decode_fragments(fragments):
+    """依序餵入每一段，回傳每段之後產生的元素與 close() 產生的元素"""
+    decoder = JsonStreamDecoder()
+    steps = [list(decoder.feed(fragment)) for fragment in fragments]
+    steps.append(list(decoder.close()))
+    return steps
+
+
+def decode_every_split(text):
+    """在每個位置切成兩段餵入，結果都要與 json.loads 相同"""
+    expected = json.loads(text)
+    for cut in range(len(text) + 1):
+        items = [item for step in decode_fragments([text[:cut], text[cut:]]) for item in step]
+        assert items == expected, cut
+
+
+def test_array_elements_arrive_one_by_one():
+    assert decode_fragments(['[{"a": 1}, {"b"', ': 2}', ']']) == [[{'a': 1}], [{'b': 2}], [], []]
+
+
+def test_number_split_across_fragments():
+    assert decode_fragments(['[1.', '5, 2]']) == [[], [1.5, 2], []]
+    assert decode_fragments(['[12', '34]']) == [[], [1234], []]
+    assert decode_fragments(['[1e', '3,', '-2]']) == [[], [1000.0], [-2], []]
+
+
+def test_number_waits_for_delimiter():
+    assert decode_fragments(['[1', ' ', '2', ']']) == [[], [1], [], [2], []]
+    decoder = JsonStreamDecoder()
+    assert list(decoder.feed('[7')) == []
+    assert list(decoder.feed(']')) == [7]
+
+
+def test_literals_split_across_fragments():
+    assert decode_fragments(['[tr', 'ue, nu', 'll, false', ']']) == [[], [True], [None], [False], []]
+
+
+def test_string_split_across_fragments():
+    assert decode_fragments(['["賣 拳', '套", "收"]']) == [[], ['賣 拳套', '收'], []]
+    assert decode_fragments(['["a\\', '"b"]']) == [[], ['a"b'], []]
+
+
+def test_every_split_point():
+    decode_every_split('[1.5, -20, 3e2, true, null, false, "字串", {"n": 10}, [1, 2]]')
+
+
+def test_utf8_bytes_split_mid_character():
+    data = json.dumps([{'text': '賣 拳套'}, 42], ensure_ascii=False).encode('utf-8')
+    for cut in range(len(data) + 1):
+        decoder = JsonStreamDecoder()
+        items = list(decoder.feed(data[:cut])) + list(decoder.feed(data[cut:])) + list(decoder.close())
+        assert items == [{'text': '賣 拳套'}, 42], cut
+
+
+def test_top_level_value_emitted_on_close():
+    assert decode_fragments(['{"a":', ' 1}']) == [[], [], [{'a': 1}]]
+    assert decode_fragments(['4', '2']) == [[], [], [42]]
+
+
+def test_unterminated_array_raises():
+    decoder = JsonStreamDecoder()
+    assert list(decoder.feed('[1, 2')) == [1]
+    with pytest.raises(json.JSONDecodeError):
+        list(decoder.close())
+
+
+def test_iter_json_elements():
+    assert list(iter_json_elements('[1, "a"]')) == [1, 'a']
+    assert list(iter_json_elements('"a"')) == ['a']
@@ -0,0 +1,149 @@
+"""
+交易訊息解析與價格提醒
+
+公頻的交易訊息大多遵循固定句型（「收拳套攻擊10% 1:5雪」、「賣+7武器」），
+每條訊息在正規化後解析一次，拆成 {意圖, 物品, 屬性, 價格} 的結構化紀錄，
+存在訊息的 'trades' 欄位。價格提醒依物品分組並按門檻排序，解析出的紀錄
+只需在物品名稱上找出訂閱的物品，再以二分搜尋取出價格符合的提醒。
+"""
+import bisect
+import logging
+import re
+
+from matcher import KeywordAutomaton
+from normalizer import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# 意圖字 → 標準意圖（收：想買入、賣：想賣出、換：交換）
+INTENTS = {'收': '收', '買': '收', '求': '收', '賣': '賣', '售': '賣', '換': '換'}
+# 兩個字的意圖詞要比單字先比對，否則「收購拳套」的物品會被解析成「購拳套」
+COMPOUND_INTENTS = {'收購': '收', '求購': '收', '出售': '賣', '販售': '賣'}
+PRICE_ALERT_INTENTS = ('收', '賣')
+
+SEGMENT_SPLIT_PATTERN = re.compile(r'[/|,;、]')
+INTENT_PATTERN = re.compile('|'.join(COMPOUND_INTENTS) + '|[' + ''.join(INTENTS) + ']')
+# 1:5雪 → 每單位 5；也接受只寫 50雪
+PRICE_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*:\s*(\d+(?:\.\d+)?)\s*(雪)?|(\d+(?:\.\d+)?)\s*(雪)')
+STAT_PATTERN = re.compile(r'(?:攻擊|魔攻|力量|敏捷|智力|幸運|全屬|命中|迴避)\d+%|\+\d+|全屬')
+FILLER_PATTERN = re.compile(r'(?:談價|面議|私訊|私聊|大量|便宜|價格|收購|出售)+$')
+
+
+def _parse_price(match):
+    if match.group(4):
+        return float(match.group(4))
+    amount, price = float(match.group(1)), float(match.group(2))
+    return price / amount if amount else None
+
+
+def _clean_number(value):
+    return int(value) if value is not None and value == int(value) else value
+
+
+def parse_segment(segment):
+    """解析單一交易片段，無法辨識時回傳 None"""
+    intent_match = INTENT_PATTERN.search(segment)
+    if not intent_match:
+        return None
+    rest = segment[intent_match.end():]
+
+    price = None
+    price_match = PRICE_PATTERN.search(rest)
+    if price_match:
+        price = _clean_number(_parse_price(price_match))
+        body = rest[:price_match.start()]
+    else:
+        body = rest
+    # 物品與屬性寫在意圖後的第一個詞
+    body = body.strip().split(' ', 1)[0] if body.strip() else ''
+
+    stats = STAT_PATTERN.findall(body)
+    item = FILLER_PATTERN.sub('', STAT_PATTERN.sub('', body)).strip()
+    if not item:
+        return None
+    return {
+        'intent': COMPOUND_INTENTS.get(intent_match.group()) or INTENTS[intent_match.group()],
+        'item': item,
+        'stat': ' '.join(stats) or None,
+        'price': price,
+    }
+
+
+def parse_trades(normalized):
+    """把正規化後的訊息解析成交易紀錄列表（一條訊息可能有多個以 / 分隔的交易）"""
+    trades = []
+    for segment in SEGMENT_SPLIT_PATTERN.split(normalized):
+        record = parse_segment(segment)
+        if record:
+            trades.append(record)
+    return trades
+
+
+def format_price_alert(alert):
+    comparison = '≤' if alert['intent'] == '賣' else '≥'
+    return f"{alert['intent']} {alert['item']} {comparison} {_clean_number(alert['price'])}"
+
+
+class PriceAlertIndex:
+    """依物品分組、依價格門檻排序的價格提醒索引
+
+    alerts 格式為 {user_id: [{"intent": "賣", "item": "拳套", "price": 5}, ...]}。
+    「賣」提醒在有人以門檻或更低的價格賣出時觸發，「收」提醒在有人以門檻或
+    更高的價格收購時觸發。物品名稱以自動機比對，因此「拳套」的提醒也會
+    對應到「敏捷拳套」的交易。
+    """
+
+    def __init__(self, alerts, version=0):
+        self.version = version
+        self._items = []
+        self._item_ids = {}
+        # (物品編號, 意圖) → (排序後的門檻列表, 對應的 (user_id, alert) 列表)
+        self._thresholds = {}
+        entries = {}
+        for user_id, user_alerts in alerts.items():
+            for alert in user_alerts or []:
+                item = normalize_text(alert['item'])
+                if not item or alert['intent'] not in PRICE_ALERT_INTENTS:
+                    continue
+                item_id = self._item_ids.get(item)
+                if item_id is None:
+                    item_id = self._item_ids[item] = len(self._items)
+                    self._items.append(item)
+                entries.setdefault((item_id, alert['intent']), []).append((float(alert['price']), user_id, alert))
+
+        for key, values in entries.items():
+            values.sort(key=lambda value: value[0])
+            self._thresholds[key] = ([value[0] for value in values], [(user_id, alert) for _, user_id, alert in values])
+        self.automaton = KeywordAutomaton(self._items)
+
+    def __len__(self):
+        return sum(len(thresholds) for thresholds, _ in self._thresholds.values())
+
+    def lookup(self, trade):
+        """回傳這筆交易觸發的 [(user_id, alert), ...]"""
+        if trade.get('price') is None or trade['intent'] not in PRICE_ALERT_INTENTS:
+            return []
+        hits = []
+        for item_id in self.automaton.find(trade['item']):
+            entry = self._thresholds.get((item_id, trade['intent']))
+            if not entry:
+                continue
+            thresholds, owners = entry
+            if trade['intent'] == '賣':
+                hits.extend(owners[bisect.bisect_left(thresholds, trade['price']):])
+            else:
+                hits.extend(owners[:bisect.bisect_right(thresholds, trade['price'])])
+        return hits
+
+    def match(self, trades, skip_users=None):
+        """比對一條訊息的所有交易紀錄，回傳 {user_id: [提醒說明, ...]}"""
+        skip_users = skip_users or ()
+        matches = {}
+        for trade in trades:
+            for user_id, alert in self.lookup(trade):
+                if user_id in skip_users:
+                    continue
+                label = f"💰 {format_price_alert(alert)}"
+                if label not in matches.setdefault(user_id, []):
+                    matches[user_id].append(label)
+        return matches
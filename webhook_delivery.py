@@ -0,0 +1,112 @@
+"""
+Discord webhook 通知發送
+
+頻道通知原本都透過機器人的 REST 用戶端（channel.send）發送，所有頻道共用
+機器人的全域速率限制。開啟 WEBHOOK_DELIVERY 後，set_channel 會在通知頻道
+建立（或重用）一個 webhook，頻道通知改由獨立的 aiohttp 連線池直接 POST 到
+webhook，不佔用機器人的路由限制。
+
+每個 webhook 依回應的 X-RateLimit-Remaining / X-RateLimit-Reset-After 追蹤
+自己的限制：額度用完時等到重置再送，收到 429 時依 retry_after 等待後重試。
+同一個 webhook 依序發送，不同 webhook 之間並行。
+"""
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_NAME = "Artale 關鍵字通知"
+MAX_RETRIES = 3
+
+
+class WebhookError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"webhook 回應 {status}: {message}")
+        self.status = status
+
+    @property
+    def transient(self):
+        return self.status == 429 or self.status >= 500
+
+
+class WebhookGone(WebhookError):
+    """webhook 已被刪除或權杖失效（401/404），應改用機器人發送"""
+
+
+def webhook_payload(content, embed, user_ids=()):
+    """組出 webhook 的 JSON 內容；embed 為 discord.Embed.to_dict() 的結果，只允許提及指定的用戶"""
+    return {
+        "content": content,
+        "embeds": [embed],
+        "allowed_mentions": {"parse": [], "users": [str(user_id) for user_id in user_ids]},
+    }
+
+
+class WebhookSender:
+    """共用連線池的 webhook 發送器"""
+
+    def __init__(self, pool_size=100, timeout=10):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session = None
+        self._locks = {}
+        self._reset_at = {}
+        self.stats = {"sent": 0, "rate_limited": 0, "errors": 0}
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _track(self, url, headers):
+        """額度用完時記下重置時間，下一次發送前等待"""
+        if headers.get('X-RateLimit-Remaining') == '0':
+            reset_after = float(headers.get('X-RateLimit-Reset-After', 1))
+            self._reset_at[url] = time.monotonic() + reset_after
+        else:
+            self._reset_at.pop(url, None)
+
+    async def _wait_for_reset(self, url):
+        reset_at = self._reset_at.get(url)
+        if reset_at is not None:
+            delay = reset_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def send(self, url, payload):
+        """發送到 webhook；webhook 已失效時拋出 WebhookGone，其他錯誤拋出 WebhookError"""
+        await self.start()
+        lock = self._locks.get(url)
+        if lock is None:
+            lock = self._locks[url] = asyncio.Lock()
+        async with lock:
+            for _ in range(MAX_RETRIES):
+                await self._wait_for_reset(url)
+                async with self._session.post(url, json=payload) as response:
+                    self._track(url, response.headers)
+                    if response.status == 429:
+                        data = await response.json(content_type=None)
+                        retry_after = float((data or {}).get('retry_after', 1))
+                        self._reset_at[url] = time.monotonic() + retry_after
+                        self.stats["rate_limited"] += 1
+                        continue
+                    if response.status in (401, 404):
+                        self.stats["errors"] += 1
+                        raise WebhookGone(response.status, await response.text())
+                    if response.status >= 400:
+                        self.stats["errors"] += 1
+                        raise WebhookError(response.status, await response.text())
+                    self.stats["sent"] += 1
+                    return
+            self.stats["errors"] += 1
+            raise WebhookError(429, f"重試 {MAX_RETRIES} 次後仍被限速")
@@ -0,0 +1,138 @@
+"""
+有記憶體上限的 WebSocket 接收
+
+wss://api.pal.tw 一個訊框可能是一整批訊息的 JSON 陣列。json.loads 會一次把
+整個陣列轉成 dict 列表，突發流量或異常的上游可能讓記憶體暴增。這裡提供：
+
+- connect_options()：依環境變數設定 websockets.connect 的 max_size（單一訊息
+  上限）、max_queue（尚未讀取的訊框上限，滿了就以 TCP 背壓讓上游等待）與
+  permessage-deflate 壓縮協商
+- JsonStreamDecoder：逐段餵入文字，頂層為陣列時一次解出一個元素，
+  不必等整個訊息到齊，也不會建立整個列表
+- iter_websocket_json()：以 recv_streaming 逐段接收每則訊息並逐一產生元素
+"""
+import codecs
+import json
+import logging
+import os
+
+from websockets.exceptions import ConnectionClosedOK
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 1 << 20
+DEFAULT_MAX_QUEUE = 16
+WHITESPACE = ' \t\r\n'
+SCALAR_END = WHITESPACE + ',]}'
+
+
+def connect_options(env=None):
+    """websockets.connect 的大小、佇列與壓縮設定（WS_MAX_SIZE、WS_MAX_QUEUE、WS_COMPRESSION）"""
+    env = os.environ if env is None else env
+    compression = env.get('WS_COMPRESSION', 'deflate').lower()
+    return {
+        'max_size': int(env.get('WS_MAX_SIZE', DEFAULT_MAX_SIZE)),
+        'max_queue': int(env.get('WS_MAX_QUEUE', DEFAULT_MAX_QUEUE)),
+        'compression': None if compression in ('', '0', 'off', 'none') else 'deflate',
+    }
+
+
+class JsonStreamDecoder:
+    """逐段解碼一則 JSON 訊息
+
+    頂層是陣列時，每個元素完整到達就產生；頂層是其他值時，在 close() 產生。
+    """
+
+    def __init__(self):
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._state = 'start'
+
+    def feed(self, chunk):
+        if isinstance(chunk, bytes):
+            chunk = self._utf8.decode(chunk)
+        self._buffer += chunk
+        if self._state == 'start':
+            stripped = self._buffer.lstrip(WHITESPACE)
+            if not stripped:
+                return
+            if stripped[0] == '[':
+                self._state = 'array'
+                self._buffer = stripped[1:]
+            else:
+                self._state = 'value'
+        if self._state == 'array':
+            yield from self._drain()
+
+    def _drain(self):
+        buffer = self._buffer
+        pos = 0
+        while True:
+            while pos < len(buffer) and (buffer[pos] in WHITESPACE or buffer[pos] == ','):
+                pos += 1
+            if pos == len(buffer):
+                break
+            if buffer[pos] == ']':
+                self._state = 'done'
+                pos = len(buffer)
+                break
+            try:
+                item, end = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # 元素還沒接收完整，等下一段
+                break
+            if not isinstance(item, (dict, list, str)) and (end == len(buffer) or buffer[end] not in SCALAR_END):
+                # 數字或常值要看到後面的分隔字元才算結束，例如 '1.' 之後可能還有 '5'
+                break
+            pos = end
+            yield item
+        self._buffer = buffer[pos:]
+
+    def close(self):
+        """訊息結束：產生剩下的值，陣列沒有結束或內容無法解析時拋出 JSONDecodeError"""
+        self._buffer += self._utf8.decode(b'', final=True)
+        if self._state == 'value':
+            yield json.loads(self._buffer)
+        elif self._state == 'array':
+            remainder = self._buffer.strip(WHITESPACE + ',')
+            if remainder:
+                # 讓 json 模組回報確切的錯誤位置
+                self._decoder.raw_decode(remainder)
+            raise json.JSONDecodeError("陣列沒有結束", self._buffer, len(self._buffer))
+
+
+def iter_json_elements(text):
+    """逐一產生一則完整 JSON 文字中的元素（頂層為陣列時逐一產生，否則產生該值）"""
+    decoder = JsonStreamDecoder()
+    yield from decoder.feed(text)
+    yield from decoder.close()
+
+
+async def iter_websocket_json(websocket):
+    """逐一產生 WebSocket 每則訊息中的 JSON 元素；連線正常關閉時結束
+
+    格式錯誤的訊息會記錄錯誤並略過其餘部分，已經產生的元素不受影響。
+    """
+    while True:
+        decoder = JsonStreamDecoder()
+        failed = False
+        try:
+            async for fragment in websocket.recv_streaming():
+                if failed:
+                    continue
+                try:
+                    for item in decoder.feed(fragment):
+                        yield item
+                except json.JSONDecodeError as e:
+                    failed = True
+                    logger.error(f"❌ JSON 解析錯誤: {e}")
+        except ConnectionClosedOK:
+            return
+        if failed:
+            continue
+        try:
+            for item in decoder.close():
+                yield item
+        except json.JSONDecodeError as e:
+            logger.error(f"❌ JSON 解析錯誤: {e}")